@@ -0,0 +1,1260 @@
+from contextlib import redirect_stdout
+import argparse
+import collections
+import concurrent.futures
+import instrument
+import io
+import json
+import numpy
+import os
+import patterns
+import platform
+import random
+import regex
+import statistics
+import subprocess
+import sys
+import tempfile
+import tracemalloc
+import threading
+import time
+from html import unescape
+from urllib.parse import urlsplit
+import requesting_urls
+from requesting_urls import Fetcher, PageCache, get_html, stream_html
+import wiki_race_challenge as wr
+import collect_dates
+from keyword_matcher import KeywordMatcher, body_text
+from tfidf_scorer import TfidfScorer
+from filter_urls import extract_links, find_articles, find_urls
+from link_graph import LinkGraph
+from collect_dates import find_corpus_dates, find_dates, month2num
+from date_arrays import DateArray
+from time_planner import extract_events
+from bs4 import BeautifulSoup
+import document
+import fetch_player_statistics as ps
+from local_wiki import LocalFetcher, LocalWiki, synthetic_graph, synthetic_wiki, use_fetcher
+
+def synthetic_nba(teams=8, players=15, seed=1):
+    """
+    Generates Wikipedia-like pages for the NBA playoffs, with a bracket of teams, a roster for each team,
+    and a page of season stats for each player
+    Args:
+        [teams] (int): The amount of teams in the bracket
+        [players] (int): The amount of players on each team
+        [seed] (int): Seed for the random stats
+    Returns:
+        dict: The pages on the form {path: html}
+    """
+    rng = random.Random(seed)
+    filler = "<p>Filler text after the table.</p>\n" * 200
+    bracket = "".join(f'<tr><td><b>({i + 1}) <a href="/wiki/Team_{i}" title="Team {i}">Team {i}</a></b></td><td>4</td></tr>\n'
+            for i in range(teams))
+    pages = {"/wiki/2020_NBA_playoffs": '<html><body><table border="0"><tbody>'
+            '<tr><td><b><a href="/wiki/Eastern_Conference">Eastern Conference</a></b></td></tr>\n'
+            f"{bracket}</tbody></table>\n{filler}</body></html>"}
+    for i in range(teams):
+        roster = "".join(f'<tr><td>G</td><td>{j}</td><td><a href="/wiki/Player_{i}_{j}" title="Player {i} {j}">Player {i} {j}</a></td></tr>\n'
+                for j in range(players))
+        pages[f"/wiki/Team_{i}"] = ('<html><body><h2><span class="mw-headline" id="Roster">Roster</span></h2>'
+                f"<table><tbody><tr><td><table><tbody>{roster}</tbody></table></td></tr></tbody></table>\n{filler}</body></html>")
+        for j in range(players):
+            seasons = "".join("<tr><td>%s</td>%s</tr>\n" % (season,
+                    "".join(f"<td>{rng.uniform(0, 30):.1f}</td>" for k in range(12)))
+                    for season in ["2017–18", "2018–19", "2019–20"])
+            pages[f"/wiki/Player_{i}_{j}"] = ('<html><body><h3><span class="mw-headline" id="Regular_season">Regular season</span></h3>'
+                    f"<table><tbody>{seasons}</tbody></table>\n{filler}</body></html>")
+    return pages
+
+def synthetic_career(seasons=15, seed=1):
+    """
+    Generates a Wikipedia-like player page with a header row, a row for each season and a career row
+    Args:
+        [seasons] (int): The amount of seasons, ending with 2019–20
+        [seed] (int): Seed for the random stats
+    Returns:
+        string: The HTML of the page
+    """
+    rng = random.Random(seed)
+    header = "".join(f"<th>{name}</th>" for name in ps.stat_headers)
+    rows = "".join("<tr><td>%d–%02d</td><td>Team %d</td>%s</tr>\n" % (year, (year + 1) % 100, year % 4,
+            "".join(f"<td>{rng.uniform(0, 30):.1f}</td>" for k in range(11)))
+            for year in range(2020 - seasons, 2020))
+    career = "<tr><td>Career</td><td></td>%s</tr>\n" % "".join(f"<td>{rng.uniform(0, 30):.1f}</td>" for k in range(10))
+    filler = "<p>Filler text around the table.</p>\n" * 200
+    return ('<html><body>%s<h3><span class="mw-headline" id="Regular_season">Regular season</span></h3>'
+            "<table><tbody><tr>%s</tr>\n%s%s</tbody></table>\n%s</body></html>" % (filler, header, rows, career, filler))
+
+def saved_pages(directory="requesting_urls"):
+    """
+    Reads the pages saved by requesting_urls.py, which start with the URL and a blank line
+    Args:
+        [directory] (string): The directory of saved pages
+    Returns:
+        dict: The saved pages on the form {url: html}
+    """
+    pages = {}
+    for name in sorted(os.listdir(directory)):
+        with open(os.path.join(directory, name)) as f:
+            url = f.readline().strip()
+            f.readline()
+            pages[url] = f.read()
+    return pages
+
+def replay_links(name):
+    """
+    Rebuilds a page with the links saved by filter_urls.py, where links to Wikipedia articles are relative
+    Args:
+        name (string): The name of the saved files, like "Nobel_Prize"
+    Returns:
+        tuple: The HTML of the page, the urls find_urls should find and the articles find_articles should find
+    """
+    with open(f"filter_urls/{name}_urls.txt") as f:
+        urls = f.read().split()
+    with open(f"filter_urls/{name}_articles.txt") as f:
+        articles = f.read().split()
+    html = "<html><body><ul>\n%s</ul></body></html>" % "".join('<li><a href="%s">Link</a></li>\n' % (
+            url[len("https://en.wikipedia.org"):] if url.startswith("https://en.wikipedia.org/wiki/") else url) for url in urls)
+    # The saved links may repeat and have escaped ampersands, the extractors return them once and unescaped
+    return html, list(dict.fromkeys(unescape(url) for url in urls)), list(dict.fromkeys(articles))
+
+def replay_dates(name):
+    """
+    Rebuilds a page with the dates saved by filter_dates_regex, writing them in each of the formats in turn
+    Args:
+        name (string): The name of the saved file, like "Hans_Rosling"
+    Returns:
+        tuple: The HTML of the page and the dates find_dates should find
+    """
+    with open(f"filter_dates_regex/{name}.txt") as f:
+        dates = f.read().split()
+    names = ["January", "February", "March", "April", "May", "June", "July",
+            "August", "September", "October", "November", "December"]
+    paragraphs = []
+    for i, date in enumerate(dates):
+        y, m, d = (date.split("/") + [None])[:3]
+        month = names[int(m) - 1]
+        if d:
+            text = [f"{int(d)} {month} {y}", f"{month} {int(d)}, {y}", f"{y} {month} {int(d)}", f"{y}-{m}-{d}"][i % 4]
+        else:
+            text = [f"{month} {y}", f"{month}, {y}", f"{y} {month}"][i % 3]
+        paragraphs.append(f"<p>Something happened on {text}.</p>\n")
+    return "<html><body>\n%s</body></html>" % "".join(paragraphs), dates
+
+def replay_events(path="datetime_filter/betting_slip_empty.md"):
+    """
+    Rebuilds a table of ski events from a betting slip saved by time_planner.py, like the one on Wikipedia
+    Args:
+        [path] (string): The betting slip
+    Returns:
+        tuple: The HTML of the page and the events extract_events should find
+    """
+    codes = {"Downhill": "DH", "Slalom": "SL", "Giant Slalom": "GS", "Super Giant Slalom": "SG",
+            "Alpine Combined": "AC", "Parallel Giant Slalom": "PG"}
+    with open(path) as f:
+        events = [[cell.strip() for cell in line.split("|")[1:4]] for line in f if line.startswith("| ") and line[2].isdigit()]
+    rows = "".join(f'<tr>\n<td>{i + 1}</td>\n<td>{date}</td>\n'
+            f'<td><span class="flagicon"><img alt="" src="flag.png"></span> <a href="/wiki/{venue}" title="{venue}">{venue}</a></td>\n'
+            f"<td>{codes[disc]}<sub>{i + 1}</sub></td>\n</tr>\n" for i, (date, venue, disc) in enumerate(events))
+    html = ('<html><body><table class="wikitable"><tbody>\n<tr><th>#</th><th>Date</th><th>Venue</th><th>Type</th></tr>\n'
+            f"{rows}</tbody></table></body></html>")
+    return html, events
+
+def bench_connection_reuse(requests=200, threads=4):
+    """
+    Fetches a page repeatedly from a local server through a shared Fetcher,
+    and reports how many connections the server had to accept
+    Args:
+        [requests] (int): The amount of requests to send
+        [threads] (int): The amount of threads sharing the fetcher
+    Returns:
+        dict: The timing, server connection count and the fetcher's pool counters
+    """
+    with LocalWiki({"/wiki/Page": "<html><body>Page</body></html>"}) as wiki:
+        fetcher = Fetcher(pool_size=threads)
+        url = f"{wiki.url}/wiki/Page"
+
+        def work(n):
+            for i in range(n):
+                get_html(url, fetcher=fetcher)
+
+        start = time.perf_counter()
+        workers = [threading.Thread(target=work, args=(requests // threads,)) for i in range(threads)]
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+        elapsed = time.perf_counter() - start
+        pools = fetcher.stats()
+        fetcher.close()
+
+        return {
+            "seconds": elapsed,
+            "requests": wiki.requests,
+            "connections": wiki.connections,
+            "pools": pools
+        }
+
+def bench_page_cache(pages=50, runs=3):
+    """
+    Fetches the same pages over several runs through a cached Fetcher,
+    and reports how many requests reached the server
+    Args:
+        [pages] (int): The amount of distinct pages
+        [runs] (int): The amount of times every page is fetched
+    Returns:
+        dict: The timing of the first and the repeated runs, and the server request count
+    """
+    html = "<html><body>" + "<p>Cached page</p>" * 2000 + "</body></html>"
+    with LocalWiki({f"/wiki/Page_{i}": html for i in range(pages)}) as wiki, tempfile.TemporaryDirectory() as directory:
+        fetcher = Fetcher(cache=PageCache(directory))
+        times = []
+        for run in range(runs):
+            start = time.perf_counter()
+            for i in range(pages):
+                get_html(f"{wiki.url}/wiki/Page_{i}", fetcher=fetcher)
+            times.append(time.perf_counter() - start)
+        fetcher.close()
+
+        return {
+            "first_run_seconds": times[0],
+            "cached_run_seconds": sum(times[1:]) / max(len(times) - 1, 1),
+            "requests": wiki.requests,
+            "cache_size": fetcher.cache.size()
+        }
+
+def bench_revalidation(pages=50):
+    """
+    Fetches pages, lets the cache go stale, and fetches them again with conditional requests
+    Args:
+        [pages] (int): The amount of distinct pages
+    Returns:
+        dict: The timing of the full and the revalidating run, and the amount of bytes saved
+    """
+    html = "<html><body>" + "<p>Unchanged page</p>" * 2000 + "</body></html>"
+    with LocalWiki({f"/wiki/Page_{i}": html for i in range(pages)}) as wiki, tempfile.TemporaryDirectory() as directory:
+        fetcher = Fetcher(cache=PageCache(directory, max_age=0))
+        times = []
+        for run in range(2):
+            start = time.perf_counter()
+            for i in range(pages):
+                get_html(f"{wiki.url}/wiki/Page_{i}", fetcher=fetcher)
+            times.append(time.perf_counter() - start)
+        fetcher.close()
+
+        return {
+            "full_run_seconds": times[0],
+            "revalidating_run_seconds": times[1],
+            "revalidated": fetcher.revalidated,
+            "bytes_saved": fetcher.bytes_saved
+        }
+
+def bench_rate_limit(requests=100, threads=8, rate=50, fail_every=5):
+    """
+    Fetches pages from a local server that fails every few requests, through a rate limited Fetcher
+    Args:
+        [requests] (int): The amount of pages to fetch
+        [threads] (int): The amount of threads sharing the fetcher
+        [rate] (float): The request rate limit of the fetcher
+        [fail_every] (int): Every n-th request to the server fails
+    Returns:
+        dict: The timing, the amount of pages fetched and of requests retried
+    """
+    with LocalWiki({f"/wiki/Page_{i}": f"Page {i}" for i in range(requests)}, fail_every=fail_every) as wiki:
+        fetcher = Fetcher(pool_size=threads, rate=rate, backoff=0.05)
+        start = time.perf_counter()
+        with concurrent.futures.ThreadPoolExecutor(threads) as executor:
+            pages = list(executor.map(lambda i: get_html(f"{wiki.url}/wiki/Page_{i}", fetcher=fetcher), range(requests)))
+        elapsed = time.perf_counter() - start
+        retries = sum(pool["retries"] for pool in fetcher.stats().values())
+        fetcher.close()
+        return {
+            "seconds": elapsed,
+            "fetched": sum(pages[i] == f"Page {i}" for i in range(requests)),
+            "requests": wiki.requests,
+            "retries": retries
+        }
+
+def legacy_find_articles(html, url):
+    # The regex based find_urls and find_articles from before the LinkExtractor, as a baseline
+    urls = regex.findall('<a[^(?:href)]*href="([^"#]*)"', html)
+    base = regex.compile('(https://[^/]*)')
+    base_url = base.match(url).group(1)
+    urls = [s if base.search(s) else f"{base_url}{s}" for s in urls]
+    is_wiki_url = regex.compile('(?:^|wikipedia.org)/wiki/')
+    is_namespace = regex.compile('https://[^:]*:')
+    return [url for url in urls if is_wiki_url.search(url) and not is_namespace.search(url)]
+
+def bench_link_extraction(repeat=10, chunk_size=16384):
+    """
+    Times finding the article links of the saved pages with the old regexes and the LinkExtractor,
+    both on whole pages and on pages given in chunks
+    Args:
+        [repeat] (int): The amount of times to extract each page
+        [chunk_size] (int): The size of the chunks
+    Returns:
+        dict: The time per pass over all pages for each method, and the links each found
+    """
+    pages = saved_pages()
+    result = {}
+    methods = {
+        "regex": lambda url, html: legacy_find_articles(html, url),
+        "extractor": lambda url, html: extract_links(html, url),
+        "extractor_chunked": lambda url, html: extract_links(
+            (html[i:i + chunk_size] for i in range(0, len(html), chunk_size)), url)
+    }
+    for name, method in methods.items():
+        start = time.perf_counter()
+        for i in range(repeat):
+            for url, html in pages.items():
+                found = method(url, html)
+        result[f"{name}_seconds"] = (time.perf_counter() - start) / repeat
+    result["regex_articles"] = sum(len(set(legacy_find_articles(html, url))) for url, html in pages.items())
+    result["extractor_articles"] = sum(
+        sum(kind == "article" for link, kind in extract_links(html, url)) for url, html in pages.items())
+    return result
+
+def bench_streaming(bandwidth=8 * 2**20, latency=0.01):
+    """
+    Finds the article links of the saved articles on a bandwidth limited local server,
+    from the whole page after it is downloaded, and from the page streamed until the end of its content
+    Args:
+        [bandwidth] (int): Bytes per second the server sends the pages at
+        [latency] (float): Seconds the server waits before answering each request
+    Returns:
+        dict: The time of both methods, the time until the first chunk, and the links each found
+    """
+    pages = {url: html for url, html in saved_pages().items() if "/wiki/" in url}
+    served = {urlsplit(url).path: html for url, html in pages.items()}
+    result = {"pages": len(pages), "full_seconds": 0, "streamed_seconds": 0, "first_chunk_seconds": 0,
+            "full_articles": 0, "streamed_articles": 0}
+    with LocalWiki(served, latency, bandwidth=bandwidth) as wiki, use_fetcher(LocalFetcher(wiki, cache=None)):
+        for url in pages:
+            start = time.perf_counter()
+            html = get_html(url)
+            result["full_articles"] += sum(kind == "article" for link, kind in extract_links(html, url))
+            result["full_seconds"] += time.perf_counter() - start
+
+            start = time.perf_counter()
+            result["streamed_articles"] += len(find_articles(url, content_only=True))
+            result["streamed_seconds"] += time.perf_counter() - start
+
+            start = time.perf_counter()
+            chunks = stream_html(url)
+            next(chunks)
+            result["first_chunk_seconds"] += time.perf_counter() - start
+            chunks.close()
+    return result
+
+def legacy_find_dates(html):
+    # The find_dates from before the single pass scanner, with one rewrite of the page for each format.
+    # The YMD rewrite checks its own day group, where the old one raised an error for dates without a day
+    months = "(Jan(?:uary)?|Feb(?:ruary)?|Mar(?:ch)?|Apr(?:il)?|May|June?|July?|Aug(?:ust)?|Sep(?:tember)?|Oct(?:ober)?|(?:Nov|Dec)(?:ember)?)"
+    html = regex.sub(f"(?:([0-9]{{1,2}}) )?{months} ([0-9]{{4}})", lambda x:
+            "#%s/%02d" % (x.group(3), month2num(x.group(2))) + ("/%02d#" % int(x.group(1)) if x.group(1) else "#"), html)
+    html = regex.sub(f"{months}(?: ([0-9]{{1,2}}))?, ([0-9]{{4}})", lambda x:
+            "#%s/%02d" % (x.group(3), month2num(x.group(1))) + ("/%02d#" % int(x.group(2)) if x.group(2) else "#"), html)
+    html = regex.sub(f"([0-9]{{4}}) {months}(?: ([0-9]{{1,2}}))?", lambda x:
+            "#%s/%02d" % (x.group(1), month2num(x.group(2))) + ("/%02d#" % int(x.group(3)) if x.group(3) else "#"), html)
+    html = regex.sub("([0-9]{4})-([0-9]{2})-([0-9]{2})", "#\\1/\\2/\\3#", html)
+    return sorted(regex.findall("#([0-9]{4}/[0-9]{2}(?:/[0-9]{2})?)#", html))
+
+def bench_date_extraction(repeat=10):
+    """
+    Times finding the dates of the saved pages with the old rewriting regexes and the single pass scanner
+    Args:
+        [repeat] (int): The amount of times to extract each page
+    Returns:
+        dict: The time per pass over all pages for each method, the dates found and if both found the same
+    """
+    pages = list(saved_pages().values())
+    result = {}
+    for name, method in [("regex", legacy_find_dates), ("scanner", find_dates)]:
+        start = time.perf_counter()
+        for i in range(repeat):
+            for html in pages:
+                method(html)
+        result[f"{name}_seconds"] = (time.perf_counter() - start) / repeat
+    result["dates"] = sum(len(find_dates(html)) for html in pages)
+    result["same"] = all(legacy_find_dates(html) == find_dates(html) for html in pages)
+    return result
+
+def bench_date_corpus(copies=8, processes=(1, 2, 4), latency=0.05):
+    """
+    Finds the dates of a corpus of copies of the saved pages, from local files and from a local server,
+    sequentially and with find_corpus_dates
+    Args:
+        [copies] (int): The amount of copies of each saved page in the corpus
+        [processes] (tuple): The amounts of processes to time find_corpus_dates with.
+            find_corpus_dates uses at most one per core, so the larger amounts only scale on hosts with that many cores
+        [latency] (float): Seconds the server waits before answering each request
+    Returns:
+        dict: The size of the corpus, the amount of cores and the time of each run, with the batch runs
+            by the amount of processes, and the download and extraction time summed over the pages of the url runs
+    """
+    pages = saved_pages()
+    result = {"pages": len(pages) * copies, "cores": os.cpu_count()}
+    with tempfile.TemporaryDirectory() as directory:
+        files = []
+        for i in range(copies):
+            for n, html in enumerate(pages.values()):
+                files.append(os.path.join(directory, f"page_{n}_{i}.html"))
+                with open(files[-1], "w", encoding="utf-8") as f:
+                    f.write(html)
+        output = os.path.join(directory, "dates.jsonl")
+
+        start = time.perf_counter()
+        for file in files:
+            with open(file, encoding="utf-8") as f:
+                find_dates(f.read())
+        result["sequential_files_seconds"] = time.perf_counter() - start
+        result["files_seconds"] = {count: find_corpus_dates(files, output, count)["seconds"] for count in processes}
+
+        served = {f"/wiki/Page_{n}_{i}": html for i in range(copies) for n, html in enumerate(pages.values())}
+        urls = [f"https://en.wikipedia.org{path}" for path in served]
+        with LocalWiki(served, latency) as wiki, use_fetcher(LocalFetcher(wiki, cache=None)):
+            start = time.perf_counter()
+            for url in urls:
+                find_dates(get_html(url))
+            result["sequential_urls_seconds"] = time.perf_counter() - start
+            result["urls_seconds"] = {}
+            for count in processes:
+                summary = find_corpus_dates(urls, output, count)
+                result["urls_seconds"][count] = summary["seconds"]
+                result["urls_fetch_seconds"] = summary["fetch_seconds"]
+                result["urls_extract_seconds"] = summary["extract_seconds"]
+    return result
+
+def bench_date_histogram(size=10**6, pages=1000, seed=1):
+    """
+    Summarises random dates of a corpus with a loop over the date strings, and with a DateArray
+    Args:
+        [size] (int): The amount of dates
+        [pages] (int): The amount of pages the dates are spread over
+        [seed] (int): Seed for the random dates
+    Returns:
+        dict: The time of each method, and the time to pack the strings into the DateArray
+    """
+    rng = random.Random(seed)
+    strings = [f"{rng.randint(1800, 2020):04d}/{rng.randint(1, 12):02d}" + (f"/{rng.randint(1, 28):02d}" if rng.random() < 0.8 else "")
+            for i in range(size)]
+    page_of = [i * pages // size for i in range(size)]
+
+    start = time.perf_counter()
+    years = collections.Counter(int(d[:4]) for d in strings)
+    decades = collections.Counter(int(d[:3]) * 10 for d in strings)
+    span = min(strings), max(strings)
+    unique = len(set(strings))
+    unique_per_page = len(set(zip(page_of, strings)))
+    loop_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    dates = DateArray.from_strings(strings)
+    dates.pages = numpy.array(page_of, numpy.int32)
+    pack_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    dates.year_histogram()
+    dates.decade_histogram()
+    dates.span()
+    assert len(dates.unique()) == unique and len(dates.unique(per_page=True)) == unique_per_page
+    return {"dates": size, "loop_seconds": loop_seconds, "pack_seconds": pack_seconds, "array_seconds": time.perf_counter() - start}
+
+def bench_documents(lookups=3):
+    """
+    Looks up the tables after the first section headers of the saved pages, once by parsing the page
+    with html.parser for every lookup and serializing the table, like the extractors did,
+    and once through the shared document cache
+    Args:
+        [lookups] (int): The amount of section headers to look up in each page
+    Returns:
+        dict: The time of each method, the time of the lookups once the pages are cached, and the parser used
+    """
+    pages = saved_pages()
+    ids = {url: regex.findall('<span class="mw-headline" id="([^"]*)"', html)[:lookups] for url, html in pages.items()}
+    cache = document.DocumentCache()
+
+    start = time.perf_counter()
+    for url, html in pages.items():
+        for id in ids[url]:
+            soup = BeautifulSoup(html, "html.parser")
+            table = soup.find(id=id).find_next("table")
+            str(table)
+    parse_each_seconds = time.perf_counter() - start
+
+    times = []
+    for run in range(2):
+        start = time.perf_counter()
+        for url, html in pages.items():
+            for id in ids[url]:
+                cache.parse(html, url).after(id)
+        times.append(time.perf_counter() - start)
+    return {"pages": len(pages), "lookups": sum(len(i) for i in ids.values()), "parser": document.PARSER,
+            "parse_each_seconds": parse_each_seconds, "document_seconds": times[0], "cached_seconds": times[1]}
+
+def bench_player_stats(latency=0.05, threads=8, limit=3):
+    """
+    Gets the top players of every team in a synthetic NBA bracket on a local server,
+    team by team with get_players, and with get_all_players
+    Args:
+        [latency] (float): Seconds the server waits before answering each request
+        [threads] (int): The maximum amount of requests at a time for get_all_players
+        [limit] (int): The amount of top players to keep for each team
+    Returns:
+        dict: The time of both methods, the amount of requests, and if both found the same players and stats
+    """
+    result = {}
+    found = {}
+    with LocalWiki(synthetic_nba(), latency) as wiki, use_fetcher(LocalFetcher(wiki, cache=None, pool_size=threads)):
+        for name in ["sequential", "concurrent"]:
+            document.default_cache.clear()
+            start = time.perf_counter()
+            with redirect_stdout(io.StringIO()):
+                teams = ps.get_teams("https://en.wikipedia.org/wiki/2020_NBA_playoffs")
+                if name == "sequential":
+                    players = []
+                    for team in teams:
+                        players += ps.get_players(team[0], team[1], limit)
+                else:
+                    players = ps.get_all_players(teams, limit, threads)
+            result[f"{name}_seconds"] = time.perf_counter() - start
+            found[name] = [(p.name, p.team, p.ppg, p.bpg, p.rpg) for p in players]
+        result["requests"] = wiki.requests // 2
+    result["players"] = len(found["sequential"])
+    result["same"] = found["sequential"] == found["concurrent"]
+    return result
+
+def bench_player_table(size=3 * 10**5, teams=30, n=3, seed=1):
+    """
+    Stores random player stats as Player objects turned into dictionaries, like the charts used,
+    and in a PlayerTable, then finds the top players of each team in both
+    Args:
+        [size] (int): The amount of players
+        [teams] (int): The amount of teams
+        [n] (int): The amount of top players to find for each team
+        [seed] (int): Seed for the random stats
+    Returns:
+        dict: The time and peak memory of storing the players each way, the time to find the top players,
+            and if both found the same players
+    """
+    rng = random.Random(seed)
+    rows = [(f"Player {i}", f"Team {rng.randrange(teams)}", f"/wiki/Player_{i}", round(rng.uniform(0, 30), 1),
+            rng.uniform(0, 3), rng.uniform(0, 15)) for i in range(size)]
+    result = {"players": size}
+
+    def objects():
+        players = []
+        for name, team, url, ppg, bpg, rpg in rows:
+            player = ps.Player(name, team, url)
+            player.ppg, player.bpg, player.rpg = ppg, bpg, rpg
+            players.append(player)
+        return players, [player.to_dict() for player in players]
+
+    def columns():
+        table = ps.PlayerTable()
+        for row in rows:
+            table.append(*row)
+        table.column("ppg")
+        return table
+
+    for name, build in [("objects", objects), ("table", columns)]:
+        start = time.perf_counter()
+        built = build()
+        result[f"{name}_seconds"] = time.perf_counter() - start
+        # Measure the memory in a separate run, as tracing every allocation slows it down
+        del built
+        tracemalloc.start()
+        built = build()
+        result[f"{name}_bytes"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        if name == "objects":
+            players = built[0]
+        else:
+            table = built
+        del built
+
+    start = time.perf_counter()
+    by_team = {}
+    for player in players:
+        by_team.setdefault(player.team, []).append(player)
+    top = [player.name for team_players in by_team.values() for player in ps.top_players(team_players, n)]
+    result["sort_top_seconds"] = time.perf_counter() - start
+    start = time.perf_counter()
+    top_rows = table.top(n)
+    result["table_top_seconds"] = time.perf_counter() - start
+    result["same"] = top == [table.names[row] for row in top_rows]
+    return result
+
+def legacy_player_stat(html, season, column):
+    # The extraction of get_player_stats before the stats table, which parsed the page for every stat
+    # and read the stat at a fixed column
+    soup = BeautifulSoup(html, "html.parser")
+    soup_table = soup.find(id="Regular_season").find_next("tbody")
+    value = 0
+    for row in soup_table.find_all("tr"):
+        cells = row.find_all("td")
+        if len(cells) >= 13 and regex.match(season, cells[0].get_text()):
+            value = ps.safe_float(cells[column].get_text())
+    return value
+
+def bench_stat_table(seasons=15, stats=("PPG", "BPG", "RPG")):
+    """
+    Looks up stats of every season of a player's page, by extracting each stat from the page like get_player_stats did,
+    and by extracting the stats table once and querying it
+    Args:
+        [seasons] (int): The amount of seasons on the page
+        [stats] (tuple): The stats to look up for each season
+    Returns:
+        dict: The time of each method, the amount of lookups and if both found the same stats
+    """
+    html = synthetic_career(seasons)
+    queries = ["%d.%02d" % (year, (year + 1) % 100) for year in range(2020 - seasons, 2020)]
+    result = {"lookups": len(queries) * len(stats)}
+
+    start = time.perf_counter()
+    legacy = [tuple(legacy_player_stat(html, season, ps.stat_headers.index(stat)) for stat in stats) for season in queries]
+    result["legacy_seconds"] = time.perf_counter() - start
+
+    document.default_cache.clear()
+    start = time.perf_counter()
+    table = ps.parse_stat_table(html)
+    found = [table.stats(season, stats) for season in queries]
+    result["table_seconds"] = time.perf_counter() - start
+    result["same"] = legacy == found
+    return result
+
+def bench_patterns(repeat=3):
+    """
+    Finds the dates and links of the saved pages with pattern timing enabled, to see which regex dominates
+    Args:
+        [repeat] (int): The amount of times to extract each page
+    Returns:
+        list: The counters of the patterns that were used, with the slowest first, see patterns.stats
+    """
+    pages = list(saved_pages().items())
+    patterns.reset()
+    patterns.enable_timing()
+    try:
+        for i in range(repeat):
+            for url, html in pages:
+                find_dates(html)
+                extract_links(html, url)
+    finally:
+        patterns.enable_timing(False)
+    return [s for s in patterns.stats() if s["calls"]]
+
+def bench_wiki_race(engine="thread", size=300, fanout=10, latency=0.02, threads=4, start=0, goal=None):
+    """
+    Runs a wiki race over a synthetic wiki on a local server with the given engine
+    Args:
+        [engine] (string): The wiki_race engine to benchmark
+        [size] (int): The amount of articles in the synthetic wiki
+        [fanout] (int): The amount of links in each article
+        [latency] (float): Seconds the server waits before answering each request
+        [threads] (int): The threads or concurrency of the engine
+        [start] (int): The number of the start article
+        [goal] (int): The number of the goal article, the last article by default
+    Returns:
+        dict: The timing, path length and amount of requests of the race
+    """
+    goal = size - 1 if goal is None else goal
+    with LocalWiki(synthetic_wiki(size, fanout), latency) as wiki, use_fetcher(LocalFetcher(wiki, pool_size=threads)):
+        start_time = time.perf_counter()
+        with redirect_stdout(io.StringIO()):
+            path = wr.wiki_race(f"https://en.wikipedia.org/wiki/Article_{start}",
+                    f"https://en.wikipedia.org/wiki/Article_{goal}", threads=threads, engine=engine)
+        return {
+            "engine": engine,
+            "seconds": time.perf_counter() - start_time,
+            "path_length": len(path) - 1 if path else None,
+            "requests": wiki.requests
+        }
+
+def bench_process_race(processes=(1, 2, 4), size=300, fanout=10, filler=2000, latency=0.005, threads=4):
+    """
+    Runs wiki races over long synthetic articles, where scoring the pages takes more time than fetching them,
+    with the thread engine and the process engine with different amounts of worker processes
+    Args:
+        [processes] (tuple): The amounts of worker processes to race with
+        [size] (int): The amount of articles in the synthetic wiki
+        [fanout] (int): The amount of links in each article
+        [filler] (int): The amount of filler paragraphs in each article
+        [latency] (float): Seconds the server waits before answering each request
+        [threads] (int): The threads of the thread engine, and of each worker process
+    Returns:
+        list: The results of each race, see bench_wiki_race, with the amount of processes
+    """
+    results = []
+    goal = f"https://en.wikipedia.org/wiki/Article_{size - 1}"
+    with LocalWiki(synthetic_wiki(size, fanout, filler=filler), latency) as wiki:
+        for count in (None,) + tuple(processes):
+            # Every race fetches the pages again, so they are scored again
+            with use_fetcher(LocalFetcher(wiki, cache=None, pool_size=threads)):
+                requests = wiki.requests
+                start_time = time.perf_counter()
+                with redirect_stdout(io.StringIO()):
+                    path = wr.wiki_race("https://en.wikipedia.org/wiki/Article_0", goal, threads=threads,
+                            engine="process" if count else "thread", processes=count)
+                results.append({
+                    "engine": "process" if count else "thread",
+                    "processes": count,
+                    "seconds": time.perf_counter() - start_time,
+                    "path_length": len(path) - 1 if path else None,
+                    "requests": wiki.requests - requests
+                })
+    return results
+
+def bench_prescoring(modes=({}, {"top": 3}, {"top": 5}, {"threshold": 30}), races=((0, 299), (5, 150), (10, 77)),
+        size=300, fanout=10, latency=0.005, threads=4):
+    """
+    Runs wiki races over a synthetic wiki, scoring every linked page and pre-scoring the links from their anchors
+    Args:
+        [modes] (tuple): The pre-scoring arguments of wiki_race to compare, where {} scores every linked page
+        [races] (tuple): The start and goal article numbers of each race
+        [size] (int): The amount of articles in the synthetic wiki
+        [fanout] (int): The amount of links in each article
+        [latency] (float): Seconds the server waits before answering each request
+        [threads] (int): The threads of the race
+    Returns:
+        list: For each mode, the total time, requests and path length of the races, and the links fetched and avoided
+    """
+    results = []
+    url = "https://en.wikipedia.org/wiki/Article_%d"
+    with LocalWiki(synthetic_wiki(size, fanout), latency) as wiki:
+        for mode in modes:
+            result = {"mode": ", ".join(f"{k}={v}" for k, v in mode.items()) or "exhaustive", "seconds": 0,
+                    "requests": 0, "path_length": 0, "fetched": 0, "avoided": 0}
+            for start, goal in races:
+                with use_fetcher(LocalFetcher(wiki, cache=None, pool_size=threads)):
+                    requests = wiki.requests
+                    start_time = time.perf_counter()
+                    output = io.StringIO()
+                    with redirect_stdout(output):
+                        path = wr.wiki_race(url % start, url % goal, threads=threads, **mode)
+                    result["seconds"] += time.perf_counter() - start_time
+                    result["requests"] += wiki.requests - requests
+                    result["path_length"] += len(path) - 1
+                for line in output.getvalue().splitlines():
+                    if line.startswith("Pre-scoring fetched"):
+                        words = line.split()
+                        result["fetched"] += int(words[2])
+                        result["avoided"] += int(words[-1])
+            results.append(result)
+    return results
+
+def bench_bidirectional(size=300, fanout=10, latency=0.02, threads=4, start=0, goal=None):
+    """
+    Runs a bidirectional wiki race over a synthetic wiki on a local server,
+    where the backlinks come from a LinkFixture of the same graph
+    Args:
+        See bench_wiki_race
+    Returns:
+        dict: The timing, path length and amount of requests of the race
+    """
+    goal = size - 1 if goal is None else goal
+    url = "https://en.wikipedia.org/wiki/Article_%d"
+    fixture = wr.LinkFixture({url % i: [url % j for j in links] for i, links in synthetic_graph(size, fanout).items()})
+    with LocalWiki(synthetic_wiki(size, fanout), latency) as wiki, use_fetcher(LocalFetcher(wiki, pool_size=threads)):
+        start_time = time.perf_counter()
+        with redirect_stdout(io.StringIO()):
+            path = wr.wiki_race(url % start, url % goal, threads=threads, bidirectional=True, backlinks=fixture.backlinks)
+        return {
+            "engine": "bidirectional",
+            "seconds": time.perf_counter() - start_time,
+            "path_length": len(path) - 1 if path else None,
+            "requests": wiki.requests
+        }
+
+def bench_link_graph(size=300, fanout=10, latency=0.02, threads=4, graph_size=10**5, graph_fanout=20):
+    """
+    Runs the same wiki race twice with a LinkGraph, where the second race should need no requests,
+    and times a path query through the whole of a large synthetic graph loaded from disk
+    Args:
+        [size], [fanout], [latency], [threads]: See bench_wiki_race
+        [graph_size] (int): The amount of articles in the large graph
+        [graph_fanout] (int): The amount of links in each article of the large graph
+    Returns:
+        dict: Timing and requests of the cold and warm race, and the edges per second of the path query
+    """
+    url = "https://en.wikipedia.org/wiki/Article_%d"
+    result = {}
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "links.graph")
+        with LocalWiki(synthetic_wiki(size, fanout), latency) as wiki, use_fetcher(LocalFetcher(wiki, pool_size=threads)):
+            for run in ["cold", "warm"]:
+                requests = wiki.requests
+                start_time = time.perf_counter()
+                with redirect_stdout(io.StringIO()):
+                    wr.wiki_race(url % 0, url % (size - 1), threads=threads, graph=LinkGraph(path))
+                result[f"{run}_seconds"] = time.perf_counter() - start_time
+                result[f"{run}_requests"] = wiki.requests - requests
+
+        graph = LinkGraph(path)
+        for i, links in synthetic_graph(graph_size, graph_fanout).items():
+            graph.add(url % i, [url % j for j in links])
+        graph.save()
+        graph = LinkGraph(path)
+        # A goal without links to it makes the search visit every reachable article
+        graph.intern("unreachable")
+        start_time = time.perf_counter()
+        graph.shortest_path(url % 0, "unreachable")
+        result["edges_per_second"] = graph_size * graph_fanout / (time.perf_counter() - start_time)
+    return result
+
+def bench_checkpoint(size=10**6, fanout=20):
+    """
+    Times a checkpoint of a race with a large queue, split into the snapshot that pauses
+    the race and the background write
+    Args:
+        [size] (int): The amount of articles in the queue
+        [fanout] (int): The amount of queued articles under each expanded article
+    Returns:
+        dict: The snapshot and write times, and the size of the checkpoint file
+    """
+    url = "https://en.wikipedia.org/wiki/Article_%d"
+    rng = random.Random(1)
+    root = wr.Article(url % size)
+    parents = [wr.Article(url % (size + 1 + i), root) for i in range(size // fanout)]
+    queue = wr.ArticleQueue()
+    visited = wr.VisitedSet([root.url] + [p.url for p in parents])
+    for i in range(size):
+        article = wr.Article(url % i, parents[i // fanout])
+        article.score = rng.randrange(200)
+        queue.insert(article)
+        visited.add(article.url)
+
+    with tempfile.TemporaryDirectory() as directory:
+        checkpointer = wr.Checkpointer(os.path.join(directory, "race.ckpt"))
+        start = time.perf_counter()
+        checkpointer.save(root.url, url % -1, [[], [], []], queue, visited, force=True)
+        snapshot = time.perf_counter() - start
+        checkpointer.wait()
+        total = time.perf_counter() - start
+        start = time.perf_counter()
+        wr.Checkpointer.load(checkpointer.path)
+        return {
+            "entries": size,
+            "snapshot_seconds": snapshot,
+            "write_seconds": total - snapshot,
+            "load_seconds": time.perf_counter() - start,
+            "bytes": os.path.getsize(checkpointer.path)
+        }
+
+def bench_frontier(sizes=(10**5, 10**6), list_size=10**4):
+    """
+    Times inserting and popping articles in the ArticleQueue, and marking urls in the VisitedSet.
+    The sorted ArticleList is timed at a smaller size for comparison, as it scales quadratically.
+    Args:
+        [sizes] (tuple): The amounts of entries to time the queue and set with
+        [list_size] (int): The amount of entries to time the ArticleList with
+    Returns:
+        list: Timings for each structure and size
+    """
+    rng = random.Random(1)
+    results = []
+    for size in sizes + (list_size,):
+        articles = []
+        for i in range(size):
+            article = wr.Article(f"https://en.wikipedia.org/wiki/Article_{i}")
+            article.score = rng.randrange(200)
+            articles.append(article)
+        structures = [("ArticleQueue", wr.ArticleQueue())] if size != list_size else [("ArticleList", wr.ArticleList([]))]
+        for name, frontier in structures:
+            start = time.perf_counter()
+            for article in articles:
+                frontier.insert(article)
+            while frontier.next_article():
+                pass
+            results.append({"structure": name, "size": size, "seconds": time.perf_counter() - start})
+        if size != list_size:
+            visited = wr.VisitedSet()
+            start = time.perf_counter()
+            for article in articles:
+                visited.add(article.url)
+                visited.add(article.url)
+            results.append({"structure": "VisitedSet", "size": size, "seconds": time.perf_counter() - start})
+    return results
+
+def bench_keyword_scoring(goal="Star_Wars", greed=3):
+    """
+    Scores the saved pages with the keywords of a saved goal page, with a substring
+    search per keyword and with the KeywordMatcher over the full HTML and the body text
+    Args:
+        [goal] (string): The saved page to take the keywords from
+        [greed] (int): The greed to find keywords with
+    Returns:
+        dict: The keyword count and the time each method took to score all pages
+    """
+    pages = saved_pages()
+    wiki = LocalWiki({"/wiki/" + goal: pages["https://en.wikipedia.org/wiki/" + goal]})
+    with wiki, use_fetcher(LocalFetcher(wiki)), redirect_stdout(io.StringIO()):
+        keywords = wr.find_keywords("https://en.wikipedia.org/wiki/" + goal, greed)
+
+    start = time.perf_counter()
+    for html in pages.values():
+        content = html.lower()
+        [sum(k in content for k in tier) for tier in keywords]
+    substring = time.perf_counter() - start
+
+    start = time.perf_counter()
+    matcher = KeywordMatcher(keywords)
+    compile_time = time.perf_counter() - start
+    for html in pages.values():
+        matcher.count(html.lower())
+    full = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for html in pages.values():
+        matcher.count(body_text(html).lower())
+    body = time.perf_counter() - start
+
+    return {
+        "keywords": sum(len(tier) for tier in keywords),
+        "substring_seconds": substring,
+        "matcher_compile_seconds": compile_time,
+        "matcher_seconds": full,
+        "matcher_body_seconds": body
+    }
+
+def bench_tfidf_scoring(goal="Star_Wars", greed=3, races=((0, 299), (5, 150), (10, 77)), size=300, fanout=10,
+        latency=0.005, threads=4):
+    """
+    Runs wiki races over a synthetic wiki with the keyword and the TF-IDF scorer,
+    and scores the saved pages against a saved goal page with the KeywordMatcher and the TfidfScorer
+    Args:
+        [goal] (string): The saved page to score the saved pages against
+        [greed] (int): The greed to find keywords with
+        [races] (tuple): The start and goal article numbers of each race
+        [size], [fanout], [latency], [threads]: See bench_wiki_race
+    Returns:
+        dict: For each scorer, the total time, requests and path length of the races and the time to score the saved pages
+    """
+    result = {}
+    url = "https://en.wikipedia.org/wiki/Article_%d"
+    with LocalWiki(synthetic_wiki(size, fanout), latency) as wiki:
+        for scorer in ["keywords", "tfidf"]:
+            result[f"{scorer}_seconds"] = result[f"{scorer}_requests"] = result[f"{scorer}_path_length"] = 0
+            for start, end in races:
+                with use_fetcher(LocalFetcher(wiki, cache=None, pool_size=threads)):
+                    requests = wiki.requests
+                    start_time = time.perf_counter()
+                    with redirect_stdout(io.StringIO()):
+                        path = wr.wiki_race(url % start, url % end, threads=threads, scorer=scorer)
+                    result[f"{scorer}_seconds"] += time.perf_counter() - start_time
+                    result[f"{scorer}_requests"] += wiki.requests - requests
+                    result[f"{scorer}_path_length"] += len(path) - 1
+
+    pages = saved_pages()
+    goal_html = pages["https://en.wikipedia.org/wiki/" + goal]
+    wiki = LocalWiki({"/wiki/" + goal: goal_html})
+    with wiki, use_fetcher(LocalFetcher(wiki)), redirect_stdout(io.StringIO()):
+        keywords = wr.find_keywords("https://en.wikipedia.org/wiki/" + goal, greed)
+    htmls = list(pages.values())
+
+    start = time.perf_counter()
+    matcher = KeywordMatcher(keywords)
+    for html in htmls:
+        matcher.count(body_text(html).lower())
+    result["keywords_scoring_seconds"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    scorer = TfidfScorer(goal_html)
+    scores = scorer.score_pages(htmls)
+    result["tfidf_scoring_seconds"] = time.perf_counter() - start
+    result["pages"] = len(htmls)
+    # The goal should be the page most similar to itself
+    result["goal_is_best"] = max(range(len(htmls)), key=scores.__getitem__) == htmls.index(goal_html)
+    return result
+
+def bench_instrumentation(repeat=20, calls=10**5, latency=0.02):
+    """
+    Measures the cost of the instrumentation hooks, and records a traced wiki race
+    Args:
+        [repeat] (int): The amount of times to extract the links and dates of the saved pages
+        [calls] (int): The amount of empty spans and counts to time
+        [latency] (float): Seconds the local server waits before answering each request in the race
+    Returns:
+        dict: The time of extracting the saved pages without hooks, with recording off and on,
+            the time of a span and a count with recording off, and the amount of events of the traced race
+    """
+    pages = list(saved_pages().items())
+    result = {}
+    untraced = (extract_links.__wrapped__, collect_dates.scan_dates.__wrapped__)
+    for name, on, functions in [("untraced", False, untraced), ("disabled", False, (extract_links, collect_dates.scan_dates)),
+            ("enabled", True, (extract_links, collect_dates.scan_dates))]:
+        instrument.enable(on)
+        start = time.perf_counter()
+        for i in range(repeat):
+            for url, html in pages:
+                functions[0](html, url)
+                functions[1](html)
+        result[f"{name}_seconds"] = (time.perf_counter() - start) / repeat
+    instrument.enable(False)
+    instrument.reset()
+
+    start = time.perf_counter()
+    for i in range(calls):
+        with instrument.span("empty"):
+            pass
+    result["disabled_span_seconds"] = (time.perf_counter() - start) / calls
+    start = time.perf_counter()
+    for i in range(calls):
+        instrument.count("empty")
+    result["disabled_count_seconds"] = (time.perf_counter() - start) / calls
+
+    instrument.enable()
+    try:
+        race = bench_wiki_race("thread", latency=latency)
+    finally:
+        instrument.enable(False)
+    summary = instrument.summary()
+    result["race_events"] = len(instrument.events)
+    result["race_fetch_seconds"] = summary["spans"]["fetch.request"]["seconds"]
+    result["race_score_seconds"] = summary["spans"]["score"]["seconds"]
+    result["race_seconds"] = race["seconds"]
+    with tempfile.TemporaryDirectory() as directory:
+        instrument.write_trace(os.path.join(directory, "trace.json"))
+        result["trace_bytes"] = os.path.getsize(os.path.join(directory, "trace.json"))
+    instrument.reset()
+    return result
+
+def timed(function, repeat=3):
+    """
+    Runs a function several times
+    Args:
+        function (function): The function to run, without arguments
+        [repeat] (int): The amount of runs
+    Returns:
+        tuple: The result of the last run, and the median time of a run in seconds
+    """
+    times = []
+    for i in range(repeat):
+        document.default_cache.clear()
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+    return result, statistics.median(times)
+
+def record(name, seconds, items, same=None, **extra):
+    # A result of the suite, with the throughput in items per second
+    return {"name": name, "seconds": seconds, "items": items,
+            "items_per_second": items / seconds if seconds else None, "same": same, **extra}
+
+def run_suite(latency=0.02, size=300, fanout=10, repeat=3):
+    """
+    Runs the offline benchmark suite. Every page comes from the saved outputs of the scripts or is generated,
+    and is served by a local server, so no request reaches Wikipedia.
+    Each extractor is checked against the saved outputs it should reproduce
+    Args:
+        [latency] (float): Seconds the local server waits before answering each request
+        [size] (int): The amount of articles in the synthetic wiki for the races
+        [fanout] (int): The amount of links in each synthetic article
+        [repeat] (int): The amount of runs to take the median time of. Races are run once
+    Returns:
+        dict: Details of the run, with a list of results that each have a name, the time in seconds,
+            the amount of items handled, the items per second, and if the output was as saved (None if not checked)
+    """
+    saved = saved_pages()
+    link_names = sorted(name[:-len("_urls.txt")] for name in os.listdir("filter_urls") if name.endswith("_urls.txt"))
+    links = {name: replay_links(name) for name in link_names}
+    dates = {name[:-4]: replay_dates(name[:-4]) for name in sorted(os.listdir("filter_dates_regex"))}
+    events_html, events = replay_events()
+    # Saved pages get paths of their own, as some of their URLs only differ in the query
+    served = {f"/wiki/Saved_{i}": html for i, html in enumerate(saved.values())}
+    served.update({f"/wiki/{name}": html for name, (html, urls, articles) in links.items()})
+    results = []
+
+    with LocalWiki(served, latency) as wiki, use_fetcher(LocalFetcher(wiki, cache=None)):
+        urls = [f"https://en.wikipedia.org{path}" for path in served]
+        pages, seconds = timed(lambda: [get_html(url) for url in urls], repeat)
+        results.append(record("get_html", seconds, len(urls), all(pages), bytes=sum(len(html.encode("utf-8")) for html in pages)))
+
+        found, seconds = timed(lambda: [find_articles(f"https://en.wikipedia.org/wiki/{name}") for name in link_names], repeat)
+        results.append(record("find_articles", seconds, sum(map(len, found)),
+                found == [links[name][2] for name in link_names]))
+
+    found, seconds = timed(lambda: [find_urls(html, f"https://en.wikipedia.org/wiki/{name}") for name, (html, urls, articles) in links.items()], repeat)
+    results.append(record("find_urls", seconds, sum(map(len, found)), found == [urls for html, urls, articles in links.values()]))
+
+    found, seconds = timed(lambda: [find_dates(html) for html in saved.values()], repeat)
+    results.append(record("find_dates_saved", seconds, sum(map(len, found)), found == [legacy_find_dates(html) for html in saved.values()]))
+    found, seconds = timed(lambda: [find_dates(html) for html, expected in dates.values()], repeat)
+    results.append(record("find_dates_replayed", seconds, sum(map(len, found)), found == [expected for html, expected in dates.values()]))
+
+    found, seconds = timed(lambda: extract_events(events_html), repeat)
+    results.append(record("extract_events", seconds, len(found), found == events))
+
+    with LocalWiki(synthetic_nba(), latency) as wiki, use_fetcher(LocalFetcher(wiki, cache=None)), redirect_stdout(io.StringIO()):
+        players, seconds = timed(lambda: ps.get_all_players(ps.get_teams("https://en.wikipedia.org/wiki/2020_NBA_playoffs"), 3), repeat)
+        results.append(record("player_statistics", seconds, wiki.requests // repeat, players=len(players)))
+
+    for engine in ["thread", "async", "bidirectional"]:
+        document.default_cache.clear()
+        if engine == "bidirectional":
+            race = bench_bidirectional(size, fanout, latency)
+        else:
+            race = bench_wiki_race(engine, size, fanout, latency)
+        results.append(record(f"wiki_race_{engine}", race["seconds"], race["requests"], race["path_length"] is not None,
+                path_length=race["path_length"]))
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "commit": commit,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "cores": os.cpu_count(),
+        "latency": latency,
+        "size": size,
+        "fanout": fanout,
+        "repeat": repeat,
+        "results": results
+    }
+
+def compare_suites(old, new, tolerance=0.2):
+    """
+    Compares two runs of the suite, for example from before and after a commit
+    Args:
+        old (dict): The earlier run, see run_suite
+        new (dict): The later run
+        [tolerance] (float): How much slower a result may be before it counts as a regression, 0.2 is 20%
+    Returns:
+        list: A dictionary for each result in both runs with the name, old and new seconds, the relative change,
+            and if it is a regression, which it also is if its output no longer is as saved
+    """
+    old_results = {r["name"]: r for r in old["results"]}
+    changes = []
+    for r in new["results"]:
+        before = old_results.get(r["name"])
+        if not before:
+            continue
+        change = r["seconds"] / before["seconds"] - 1 if before["seconds"] else 0
+        changes.append({"name": r["name"], "old_seconds": before["seconds"], "new_seconds": r["seconds"], "change": change,
+                "regression": change > tolerance or (before["same"] is True and r["same"] is False)})
+    return changes
+
+def suite_main(args):
+    """
+    Runs the suite from the command line:
+        python benchmark.py suite [output.json] [--size 300] [--fanout 10] [--latency 0.02] [--repeat 3]
+        python benchmark.py compare old.json new.json [--tolerance 0.2]
+    Args:
+        args (list): The command line arguments
+    Returns:
+        int: The exit code, 1 if compare found a regression
+    """
+    parser = argparse.ArgumentParser(prog="benchmark.py", description="Runs and compares the offline benchmark suite")
+    commands = parser.add_subparsers(dest="command", required=True)
+    suite_parser = commands.add_parser("suite", help="Run the suite, see run_suite")
+    suite_parser.add_argument("output", nargs="?", help="JSON file to save the run to")
+    suite_parser.add_argument("--size", type=int, default=300, help="Articles in the synthetic wiki of the races")
+    suite_parser.add_argument("--fanout", type=int, default=10, help="Links in each synthetic article")
+    suite_parser.add_argument("--latency", type=float, default=0.02, help="Seconds the local server waits before each answer")
+    suite_parser.add_argument("--repeat", type=int, default=3, help="Runs to take the median time of")
+    compare_parser = commands.add_parser("compare", help="Compare two saved runs, see compare_suites")
+    compare_parser.add_argument("old", help="The earlier run")
+    compare_parser.add_argument("new", help="The later run")
+    compare_parser.add_argument("--tolerance", type=float, default=0.2, help="How much slower a result may be, 0.2 is 20%%")
+    options = parser.parse_args(args)
+
+    if options.command == "suite":
+        suite = run_suite(options.latency, options.size, options.fanout, options.repeat)
+        for r in suite["results"]:
+            print(f"{r['name']}: {r['seconds']:.4f}s, {r['items']} items, same results: {r['same']}")
+        if options.output:
+            with open(options.output, "w") as f:
+                json.dump(suite, f, indent=2)
+        return 0
+    with open(options.old) as f:
+        old = json.load(f)
+    with open(options.new) as f:
+        new = json.load(f)
+    changes = compare_suites(old, new, options.tolerance)
+    for c in changes:
+        print(f"{c['name']}: {c['old_seconds']:.4f}s -> {c['new_seconds']:.4f}s ({c['change']:+.0%})" + (" REGRESSION" if c["regression"] else ""))
+    return 1 if any(c["regression"] for c in changes) else 0
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        sys.exit(suite_main(sys.argv[1:]))
+
+    result = bench_connection_reuse()
+    print(f"connection reuse: {result['requests']} requests over {result['connections']} connections in {result['seconds']:.3f}s")
+
+    result = bench_page_cache()
+    print(f"page cache: first run {result['first_run_seconds']:.3f}s, cached runs {result['cached_run_seconds']:.3f}s, {result['requests']} server requests")
+
+    result = bench_revalidation()
+    print(f"revalidation: full run {result['full_run_seconds']:.3f}s, revalidating run {result['revalidating_run_seconds']:.3f}s, {result['bytes_saved']} bytes saved")
+
+    result = bench_rate_limit()
+    print(f"rate limit: {result['fetched']} pages fetched with {result['retries']} retries in {result['seconds']:.3f}s")
+
+    result = bench_link_extraction()
+    print(f"link extraction: regex {result['regex_seconds']:.4f}s ({result['regex_articles']} articles), extractor {result['extractor_seconds']:.4f}s ({result['extractor_articles']} articles), chunked {result['extractor_chunked_seconds']:.4f}s")
+
+    result = bench_streaming()
+    print(f"streaming ({result['pages']} pages): full pages {result['full_seconds']:.3f}s ({result['full_articles']} articles), streamed content {result['streamed_seconds']:.3f}s ({result['streamed_articles']} articles), first chunk after {result['first_chunk_seconds']:.3f}s")
+
+    result = bench_date_extraction()
+    print(f"date extraction ({result['dates']} dates): regex {result['regex_seconds']:.4f}s, scanner {result['scanner_seconds']:.4f}s, same results: {result['same']}")
+
+    result = bench_date_corpus()
+    timings = ", ".join(f"{count} processes {seconds:.3f}s" for count, seconds in result["files_seconds"].items())
+    print(f"date corpus ({result['pages']} files, {result['cores']} cores): sequential {result['sequential_files_seconds']:.3f}s, {timings}")
+    timings = ", ".join(f"{count} processes {seconds:.3f}s" for count, seconds in result["urls_seconds"].items())
+    print(f"date corpus ({result['pages']} urls): sequential {result['sequential_urls_seconds']:.3f}s, {timings}, "
+            f"downloading {result['urls_fetch_seconds']:.3f}s and extracting {result['urls_extract_seconds']:.3f}s over all pages")
+
+    result = bench_date_histogram()
+    print(f"date histogram ({result['dates']} dates): string loop {result['loop_seconds']:.3f}s, packing {result['pack_seconds']:.3f}s, arrays {result['array_seconds']:.3f}s")
+
+    result = bench_documents()
+    print(f"documents ({result['lookups']} lookups in {result['pages']} pages): parse for each lookup {result['parse_each_seconds']:.3f}s, parse once with {result['parser']} {result['document_seconds']:.3f}s, cached {result['cached_seconds']:.4f}s")
+
+    result = bench_player_stats()
+    print(f"player stats ({result['requests']} pages, {result['players']} top players): sequential {result['sequential_seconds']:.3f}s, concurrent {result['concurrent_seconds']:.3f}s, same results: {result['same']}")
+
+    result = bench_player_table()
+    print(f"player table ({result['players']} players): objects {result['objects_seconds']:.3f}s {result['objects_bytes'] / 2**20:.0f} MB, table {result['table_seconds']:.3f}s {result['table_bytes'] / 2**20:.0f} MB, top players by sorting {result['sort_top_seconds']:.3f}s, from table {result['table_top_seconds']:.4f}s, same results: {result['same']}")
+
+    result = bench_stat_table()
+    print(f"stat table ({result['lookups']} lookups): extract each stat {result['legacy_seconds']:.3f}s, extract table once {result['table_seconds']:.4f}s, same results: {result['same']}")
+
+    for s in bench_patterns():
+        print(f"pattern {s['name']}: {s['calls']} calls, {s['hits']} hits, {s['seconds']:.3f}s")
+
+    result = bench_instrumentation()
+    print(f"instrumentation: extraction without hooks {result['untraced_seconds']:.4f}s, recording off {result['disabled_seconds']:.4f}s, recording on {result['enabled_seconds']:.4f}s, {result['disabled_span_seconds'] * 1e9:.0f}ns per span while off")
+    print(f"instrumentation: traced race {result['race_seconds']:.3f}s, {result['race_events']} events, {result['race_fetch_seconds']:.3f}s in requests, {result['race_score_seconds']:.3f}s scoring, {result['trace_bytes']} bytes of trace")
+
+    for engine in ["thread", "async"]:
+        result = bench_wiki_race(engine)
+        print(f"wiki race ({engine}): {result['seconds']:.3f}s, path length {result['path_length']}, {result['requests']} requests")
+    for result in bench_process_race():
+        engine = f"{result['processes']} processes" if result["processes"] else "thread"
+        print(f"wiki race on long articles ({engine}, {os.cpu_count()} cores): {result['seconds']:.3f}s, path length {result['path_length']}, {result['requests']} requests")
+    for result in bench_prescoring():
+        print(f"wiki race ({result['mode']}): {result['seconds']:.3f}s, {result['requests']} requests, total path length {result['path_length']}, {result['fetched']} links fetched and {result['avoided']} avoided")
+    result = bench_bidirectional()
+    print(f"wiki race (bidirectional): {result['seconds']:.3f}s, path length {result['path_length']}, {result['requests']} requests")
+
+    result = bench_link_graph()
+    print(f"link graph: cold race {result['cold_seconds']:.3f}s with {result['cold_requests']} requests, warm race {result['warm_seconds']:.3f}s with {result['warm_requests']} requests, {result['edges_per_second'] / 1e6:.1f}M edges/s")
+
+    result = bench_checkpoint()
+    print(f"checkpoint ({result['entries']} queued): {result['snapshot_seconds']:.3f}s snapshot, {result['write_seconds']:.3f}s background write, {result['bytes']} bytes")
+
+    for result in bench_frontier():
+        print(f"{result['structure']} ({result['size']} entries): {result['seconds']:.3f}s")
+
+    result = bench_keyword_scoring()
+    print(f"keyword scoring ({result['keywords']} keywords): substrings {result['substring_seconds']:.3f}s, matcher {result['matcher_seconds']:.3f}s, matcher on body text {result['matcher_body_seconds']:.3f}s")
+
+    result = bench_tfidf_scoring()
+    for scorer in ["keywords", "tfidf"]:
+        print(f"wiki race ({scorer} scorer): {result[scorer + '_seconds']:.3f}s, {result[scorer + '_requests']} requests, total path length {result[scorer + '_path_length']}")
+    print(f"page scoring ({result['pages']} pages): keywords {result['keywords_scoring_seconds']:.3f}s, tfidf {result['tfidf_scoring_seconds']:.3f}s, goal scored best: {result['goal_is_best']}")
@@ -1,5 +1,12 @@
 from requesting_urls import get_html
-import regex as re
+import instrument
+import patterns
+import concurrent.futures
+import contextlib
+import json
+import os
+import sys
+import time
 
 def month2num(month):
     """
@@ -25,49 +32,113 @@ def month2num(month):
     }
     return switcher.get(month, 0)
 
+# Regex for each date component (Month may be only first 3 letters)
+months = "(Jan(?:uary)?|Feb(?:ruary)?|Mar(?:ch)?|Apr(?:il)?|May|June?|July?|Aug(?:ust)?|Sep(?:tember)?|Oct(?:ober)?|(?:Nov|Dec)(?:ember)?)"
+days = "([0-9]{1,2})"
+year = "([0-9]{4})"
+
+# The four date formats in a single pattern, so a page is searched in one pass
+# When formats overlap, the one starting first is used, and at the same start the first format listed
+date_pattern = patterns.register("dates.date", "|".join([
+    f"(?:{days} )?{months} {year}", # DMY, groups 1-3
+    f"{months}(?: {days})?, {year}", # MDY, groups 4-6
+    f"{year} {months}(?: {days})?", # YMD, groups 7-9
+    "([0-9]{4})-([0-9]{2})-([0-9]{2})" # ISO, groups 10-12
+]))
+
+# Separate patterns for the parts every date has, see scan_text
+month_pattern = patterns.register("dates.month", months)
+iso_pattern = patterns.register("dates.iso", "[0-9]{4}-")
+
+@instrument.traced("extract.dates")
+def scan_dates(html):
+    """
+    Finds all dates within HTML in a single pass, without rewriting it
+    Args:
+        html (string or iterable): The HTML string to fetch dates from, or an iterable of HTML chunks
+    Returns:
+        list: A list of all dates as (year, month, day) tuples of ints, in the order they appear.
+            The day is None if it was not present
+    """
+    chunks = [html] if isinstance(html, str) else html
+    dates = []
+    rest = ""
+    for chunk in chunks:
+        text = rest + chunk
+        # Dates never contain a tag, so everything before the last tag can be searched already
+        last = text.rfind("<")
+        if last > 0:
+            scan_text(text[:last], dates)
+            text = text[last:]
+        rest = text
+    scan_text(rest, dates)
+    return dates
+
+def scan_text(text, dates):
+    # Appends the dates in a piece of text to a list, see scan_dates
+    # Every date has a month name, or starts with the "yyyy-" of an ISO date. Searching for those first is much
+    # faster than trying the whole pattern at every position, so it is only tried where a date can start:
+    # 5 characters before a month for YMD, 3 or 2 before it for DMY with a day, or at the month or ISO year
+    end = 0
+    month = month_pattern.search(text)
+    iso = iso_pattern.search(text)
+    while month or iso:
+        if iso and (not month or iso.start() < month.start()):
+            anchor = iso
+            starts = (iso.start(),)
+        else:
+            anchor = month
+            a = month.start()
+            starts = (a - 5, a - 3, a - 2, a)
+        match = None
+        for start in starts:
+            if start >= end:
+                match = date_pattern.match(text, start)
+                if match:
+                    break
+
+        # Continue after the date, or after the anchor if there was none. The other anchor may be inside the date
+        pos = match.end() if match else anchor.end()
+        if month and month.start() < pos:
+            month = month_pattern.search(text, pos)
+        if iso and iso.start() < pos:
+            iso = iso_pattern.search(text, pos)
+        if not match:
+            continue
+        end = pos
+        d1, m1, y1, m2, d2, y2, y3, m3, d3, y4, m4, d4 = match.groups()
+        if y1:
+            dates.append((int(y1), month2num(m1), int(d1) if d1 else None))
+        elif y2:
+            dates.append((int(y2), month2num(m2), int(d2) if d2 else None))
+        elif y3:
+            dates.append((int(y3), month2num(m3), int(d3) if d3 else None))
+        else:
+            dates.append((int(y4), int(m4), int(d4)))
+
+def format_date(date):
+    """
+    Formats a date from scan_dates
+    Args:
+        date (tuple): The date as a (year, month, day) tuple
+    Returns:
+        string: The date in a yyyy/mm/dd format. If day was not present, then yyyy/mm
+    """
+    y, m, d = date
+    return "%04d/%02d" % (y, m) if d is None else "%04d/%02d/%02d" % (y, m, d)
+
 def find_dates(html, output=None):
     """
     Finds all dates within an HTML string
     Args:
-        html (string): The HTML string to fetch dates from
+        html (string or iterable): The HTML string to fetch dates from, or an iterable of HTML chunks
         [output] (string): Optional filename to write the dates to
     Returns:
         list: A list of all dates as strings in a yyyy/mm/dd format. If day was not present, then yyyy/mm
     """
-    # Regex for each date component (Month may be only first 3 letters)
-    months = "(Jan(?:uary)?|Feb(?:ruary)?|Mar(?:ch)?|Apr(?:il)?|May|June?|July?|Aug(?:ust)?|Sep(?:tember)?|Oct(?:ober)?|(?:Nov|Dec)(?:ember)?)"
-    days = "([0-9]{1,2})"
-    year = "([0-9]{4})"
-
-    # Specify the four date formats
-    DMY = f"(?:{days} )?{months} {year}"
-    MDY = f"{months}(?: {days})?, {year}"
-    YMD = f"{year} {months}(?: {days})?"
-    ISO = "([0-9]{4})-([0-9]{2})-([0-9]{2})"
-
-    # Replace all instances of each date format in the HTML
-    # All formatted dates are encapsulated in two hashtags
-    html = re.sub(DMY, lambda x:
-            "#%s/%02d" % (x.group(3), month2num(x.group(2))) +
-            ("/%02d#" % int(x.group(1)) if x.group(1) else "#"),
-            html)
-    html = re.sub(MDY, lambda x:
-            "#%s/%02d" % (x.group(3), month2num(x.group(1))) +
-            ("/%02d#" % int(x.group(2)) if x.group(2) else "#"),
-            html)
-    html = re.sub(YMD, lambda x:
-            "#%s/%02d" % (x.group(1), month2num(x.group(2))) +
-            ("/%02d#" % int(x.group(3)) if x.group(1) else "#"),
-            html)
-
-    # ISO is much simpler
-    html = re.sub(ISO, "#\\1/\\2/\\3#", html)
-
-    # Find and sort all dates in the new target format
-    # Use the hashtag encapsulation to find only the previously formatted dates
-    goal_format = "#([0-9]{4}/[0-9]{2}(?:/[0-9]{2})?)#"
-    all_dates = re.findall(goal_format, html)
-    all_dates.sort()
+    # A date without a day sorts before the days of its month, like the strings do
+    dates = sorted(scan_dates(html), key=lambda d: (d[0], d[1], -1 if d[2] is None else d[2]))
+    all_dates = [format_date(d) for d in dates]
 
     # Write to file if argument was provided
     if output:
@@ -75,6 +146,111 @@ def find_dates(html, output=None):
 
     return all_dates
 
+def extract_dates(source, html=None):
+    """
+    Finds the dates of one page of a corpus, see scan_corpus. Runs in the worker processes
+    Args:
+        source (string): The url or file of the page
+        [html] (string): The HTML of the page. Read from the file if not given
+    Returns:
+        dict: The dates of the page, with the amount of dates and the time spent reading and extracting
+    """
+    start = time.perf_counter()
+    if html is None:
+        with open(source, encoding="utf-8") as f:
+            html = f.read()
+    read = time.perf_counter()
+    dates = find_dates(html)
+    return {
+        "source": source,
+        "count": len(dates),
+        "dates": dates,
+        "read_seconds": read - start,
+        "extract_seconds": time.perf_counter() - read
+    }
+
+def fetch_page(url):
+    # Downloads a page for scan_corpus, and times it
+    start = time.perf_counter()
+    html = get_html(url)
+    return html, time.perf_counter() - start
+
+def scan_corpus(sources, processes=None, threads=8):
+    """
+    Finds the dates of many pages. Urls are downloaded by a pool of threads, while the dates
+    of the pages already downloaded are extracted by a pool of processes.
+    Local files are read by the processes themselves, so their HTML is never sent between processes.
+    The process pool only pays off when there are several cores to extract dates on. With a single process,
+    the dates are extracted by the threads instead, as the downloads dominate and a lone worker process
+    only adds the cost of sending each page to it
+    Args:
+        sources (iterable): The urls or local HTML files of the pages
+        [processes] (int): The amount of processes to extract dates with. Default and at most: one per core
+        [threads] (int): The amount of pages to download at the same time
+    Returns:
+        generator: A dictionary for each page, see extract_dates, in the order they are done.
+            Pages that could not be read have an "error" instead of dates
+    """
+    processes = min(processes or os.cpu_count(), os.cpu_count())
+    # Limit the pages in progress, so downloaded pages do not pile up while waiting for a process
+    window = 2 * processes + threads
+    sources = iter(sources)
+    pending = {}
+    with concurrent.futures.ThreadPoolExecutor(threads) as io, \
+            (concurrent.futures.ProcessPoolExecutor(processes) if processes > 1 else contextlib.nullcontext(io)) as pool:
+        while True:
+            while len(pending) < window:
+                source = next(sources, None)
+                if source is None:
+                    break
+                if source.startswith(("http://", "https://")):
+                    pending[io.submit(fetch_page, source)] = (source, None)
+                else:
+                    pending[pool.submit(extract_dates, source)] = (source, 0)
+            if not pending:
+                return
+
+            done, unused = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                source, fetch_seconds = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    yield {"source": source, "error": repr(e)}
+                    continue
+                if fetch_seconds is None:
+                    # A downloaded page, which still needs its dates extracted
+                    html, fetch_seconds = result
+                    pending[pool.submit(extract_dates, source, html)] = (source, fetch_seconds)
+                else:
+                    result["fetch_seconds"] = fetch_seconds
+                    yield result
+
+def find_corpus_dates(sources, output, processes=None, threads=8):
+    """
+    Finds the dates of many pages, and writes them to a JSON Lines file as they are found, see scan_corpus
+    Args:
+        sources (iterable): The urls or local HTML files of the pages
+        output (string): The file to write a line of JSON with the dates, count and timing of each page to
+        [processes] (int): The amount of processes to extract dates with. Default: one per core
+        [threads] (int): The amount of pages to download at the same time
+    Returns:
+        dict: The amount of pages, dates and errors, the total time, and the time spent downloading
+            and extracting summed over the pages, to see if the corpus is bound by the downloads or the extraction
+    """
+    start = time.perf_counter()
+    summary = {"pages": 0, "dates": 0, "errors": 0, "fetch_seconds": 0, "extract_seconds": 0}
+    with open(output, "w") as f:
+        for result in scan_corpus(sources, processes, threads):
+            f.write(json.dumps(result) + "\n")
+            summary["pages"] += 1
+            summary["dates"] += result.get("count", 0)
+            summary["errors"] += "error" in result
+            summary["fetch_seconds"] += result.get("fetch_seconds", 0)
+            summary["extract_seconds"] += result.get("extract_seconds", 0)
+    summary["seconds"] = time.perf_counter() - start
+    return summary
+
 def write_to_file(output, dates):
     """
     Writes dates to file
@@ -89,6 +265,11 @@ def write_to_file(output, dates):
 
 
 if __name__ == "__main__":
+    if len(sys.argv) > 2:
+        # Batch mode: python collect_dates.py output.jsonl [urls or files...]
+        print(find_corpus_dates(sys.argv[2:], sys.argv[1]))
+        sys.exit()
+
     find_dates(get_html("https://en.wikipedia.org/wiki/Linus_Pauling"), "filter_dates_regex/Linus_Pauling.txt")
     find_dates(get_html("https://en.wikipedia.org/wiki/Rafael_Nadal"), "filter_dates_regex/Rafael_Nadal.txt")
     find_dates(get_html("https://en.wikipedia.org/wiki/J._K._Rowling"), "filter_dates_regex/J._K_Rowling.txt")
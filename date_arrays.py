@@ -0,0 +1,188 @@
+import json
+import numpy as np
+
+class DateArray:
+    """
+    Compact array of dates, for summarising the dates of many pages without Python loops.
+    Every date is packed into one integer as year << 14 | month << 7 | day + 1, where the day part is 0
+    if the date has none, so the packed dates sort in the same order as the date strings of find_dates.
+    Months and days get 7 bits each, as ISO dates are not checked for valid months and days.
+    Properties:
+        packed: The packed dates, as an int32 array
+        pages: The index of the page each date was found in, as an int32 array
+    """
+    def __init__(self, packed, pages=None):
+        """
+        Args:
+            packed (array): The packed dates
+            [pages] (array): The page index of each date. All dates are from page 0 by default
+        """
+        self.packed = np.asarray(packed, dtype=np.int32)
+        self.pages = np.zeros(len(self.packed), np.int32) if pages is None else np.asarray(pages, dtype=np.int32)
+
+    @classmethod
+    def from_dates(cls, dates, page=0):
+        """
+        Packs the dates found by scan_dates
+        Args:
+            dates (list): The dates as (year, month, day) tuples, where the day may be None
+            [page] (int): The page index of the dates
+        Returns:
+            DateArray: The packed dates
+        """
+        packed = np.fromiter((y << 14 | m << 7 | (0 if d is None else d + 1) for y, m, d in dates), np.int32, len(dates))
+        return cls(packed, np.full(len(packed), page, np.int32))
+
+    @classmethod
+    def from_strings(cls, strings, page=0):
+        """
+        Packs dates in the yyyy/mm/dd or yyyy/mm format of find_dates
+        Args:
+            strings (list): The date strings
+            [page] (int): The page index of the dates
+        Returns:
+            DateArray: The packed dates
+        """
+        if not len(strings):
+            return cls([])
+        # Read the digits of all strings at once, as rows of 10 characters padded with zero bytes
+        chars = np.array(strings, dtype="S10").view(np.uint8).reshape(-1, 10).astype(np.int32) - ord("0")
+        years = chars[:, 0] * 1000 + chars[:, 1] * 100 + chars[:, 2] * 10 + chars[:, 3]
+        months = chars[:, 5] * 10 + chars[:, 6]
+        # Strings without a day end after the month, so the day is padding
+        days = np.where(chars[:, 7] == ord("/") - ord("0"), chars[:, 8] * 10 + chars[:, 9] + 1, 0)
+        return cls(years << 14 | months << 7 | days, np.full(len(years), page, np.int32))
+
+    @classmethod
+    def concatenate(cls, arrays):
+        """
+        Joins the dates of several arrays, keeping the page index of each date
+        Args:
+            arrays (list): The DateArrays to join
+        Returns:
+            DateArray: All the dates
+        """
+        if not arrays:
+            return cls([])
+        return cls(np.concatenate([a.packed for a in arrays]), np.concatenate([a.pages for a in arrays]))
+
+    def __len__(self):
+        return len(self.packed)
+
+    @property
+    def years(self):
+        return self.packed >> 14
+
+    @property
+    def months(self):
+        return self.packed >> 7 & 127
+
+    @property
+    def days(self):
+        # The day of each date, -1 for dates without one
+        return (self.packed & 127) - 1
+
+    def year_histogram(self):
+        """
+        Counts the dates of every year from the first to the last year
+        Returns:
+            tuple: An array of the years, and an array of the amount of dates in each year
+        """
+        if not len(self):
+            return np.zeros(0, np.int32), np.zeros(0, np.int64)
+        years = self.years
+        first = years.min()
+        counts = np.bincount(years - first)
+        return np.arange(first, first + len(counts)), counts
+
+    def decade_histogram(self):
+        """
+        Counts the dates of every decade from the first to the last decade
+        Returns:
+            tuple: An array of the first year of each decade, and an array of the amount of dates in each decade
+        """
+        if not len(self):
+            return np.zeros(0, np.int32), np.zeros(0, np.int64)
+        decades = self.years // 10
+        first = decades.min()
+        counts = np.bincount(decades - first)
+        return np.arange(first, first + len(counts)) * 10, counts
+
+    def span(self):
+        """
+        Gets the earliest and latest date
+        Returns:
+            tuple: The first and last date as (year, month, day) tuples, where the day is None if missing.
+                None if there are no dates
+        """
+        if not len(self):
+            return None
+        return unpack(self.packed.min()), unpack(self.packed.max())
+
+    def unique(self, per_page=False):
+        """
+        Removes repeated dates
+        Args:
+            [per_page] (bool): Only remove dates repeated within a page, so a date is kept once for every page it is in.
+                By default a date is kept once for all the pages
+        Returns:
+            DateArray: The sorted dates without repeats. Without per_page, each date keeps the first page it is in
+        """
+        # Sorting the dates together with their page puts repeats next to each other, with the first page first.
+        # This is much faster than np.unique
+        if per_page:
+            keys = np.sort(self.pages.astype(np.int64) << 32 | self.packed)
+            keys = keys[changes(keys)]
+            return DateArray(keys & 0xFFFFFFFF, keys >> 32)
+        keys = np.sort(self.packed.astype(np.int64) << 32 | self.pages)
+        keys = keys[changes(keys >> 32)]
+        return DateArray(keys >> 32, keys & 0xFFFFFFFF)
+
+    def datetime64(self):
+        """
+        Converts the dates to NumPy dates. Dates without a day are placed on the first day of their month
+        Returns:
+            array: The dates as a datetime64[D] array
+        """
+        months = ((self.years - 1970) * 12 + self.months - 1).astype("datetime64[M]")
+        return months.astype("datetime64[D]") + np.maximum(self.days - 1, 0).astype("timedelta64[D]")
+
+    def strings(self):
+        """
+        Formats the dates like find_dates
+        Returns:
+            list: The dates as strings in a yyyy/mm/dd format. If day was not present, then yyyy/mm
+        """
+        return ["%04d/%02d" % (y, m) if d < 0 else "%04d/%02d/%02d" % (y, m, d)
+                for y, m, d in zip(self.years.tolist(), self.months.tolist(), self.days.tolist())]
+
+def changes(values):
+    # Marks the values of a sorted array that differ from the value before them
+    mask = np.empty(len(values), bool)
+    mask[:1] = True
+    np.not_equal(values[1:], values[:-1], out=mask[1:])
+    return mask
+
+def unpack(packed):
+    # Unpacks a single packed date to a (year, month, day) tuple
+    packed = int(packed)
+    day = (packed & 127) - 1
+    return packed >> 14, packed >> 7 & 127, None if day < 0 else day
+
+def load_corpus(path):
+    """
+    Loads the dates of a JSON Lines file written by find_corpus_dates
+    Args:
+        path (string): The file to load
+    Returns:
+        tuple: A DateArray of all dates, where the page index of a date is its line in the file,
+            and a list of the source of each page
+    """
+    arrays = []
+    sources = []
+    with open(path) as f:
+        for line in f:
+            result = json.loads(line)
+            arrays.append(DateArray.from_strings(result.get("dates", []), len(sources)))
+            sources.append(result["source"])
+    return DateArray.concatenate(arrays), sources
@@ -0,0 +1,157 @@
+from bs4 import BeautifulSoup
+import collections
+import hashlib
+import threading
+from requesting_urls import get_html
+import instrument
+
+# lxml parses several times faster than Python's html.parser, so use it when it is installed
+try:
+    import lxml
+    PARSER = "lxml"
+except ImportError:
+    PARSER = "html.parser"
+
+class Document:
+    """
+    Class to contain a parsed HTML page, with lookups for the parts extractors need.
+    Get documents through parse or get_document, so each page is only parsed once
+    Properties:
+        url: The URL of the page, if known
+        html: The HTML the page was parsed from
+        soup: The BeautifulSoup tree of the page
+    """
+    def __init__(self, html, url=None, parser=None):
+        """
+        Args:
+            html (string): The HTML of the page
+            [url] (string): The URL of the page
+            [parser] (string): The BeautifulSoup parser to use. Default: lxml if installed, else html.parser
+        """
+        self.url = url
+        self.html = html
+        with instrument.span("parse", url=url):
+            self.soup = BeautifulSoup(html, parser or PARSER)
+        self._ids = None
+
+    def element(self, id):
+        """
+        Finds the element with an id, like the span of a section header
+        Args:
+            id (string): The id of the element
+        Returns:
+            Tag: The element, or None if no element has the id
+        """
+        if self._ids is None:
+            # Index every id in one walk over the tree, instead of a walk for every lookup
+            ids = {}
+            for tag in self.soup.find_all(id=True):
+                ids.setdefault(tag["id"], tag)
+            self._ids = ids
+        return self._ids.get(id)
+
+    def after(self, id, name="table"):
+        """
+        Finds the first element with a tag name after the element with an id,
+        for example the table after the span with id Roster
+        Args:
+            id (string): The id of the element to search from
+            [name] (string): The tag name of the element to find
+        Returns:
+            Tag: The element, or None if the id or an element after it was not found
+        """
+        start = self.element(id)
+        return start.find_next(name) if start else None
+
+    def table(self, attrs=None):
+        """
+        Finds the first table with the given attributes, for example table({"border": "0"}).
+        A class matches tables that have the class among others, like with BeautifulSoup
+        Args:
+            [attrs] (dict): The attributes of the table
+        Returns:
+            Tag: The table, or None if it was not found
+        """
+        return self.soup.find("table", attrs or {})
+
+def rows(table):
+    """
+    Gets the cells of each row of a table
+    Args:
+        table (Tag): The table, or its tbody
+    Returns:
+        list: A list of rows, where each row is a list of the td cells in it
+    """
+    return [row.find_all("td") for row in table.find_all("tr")]
+
+class DocumentCache:
+    """
+    Cache of parsed documents, keyed by the URL and a hash of the HTML, so a page is parsed again if it changes.
+    Keeps the most recently used documents, as parsed trees take several times the memory of their HTML.
+    Safe to share between threads
+    """
+    def __init__(self, size=32):
+        """
+        Args:
+            [size] (int): The maximum amount of documents to keep
+        """
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._documents = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def parse(self, html, url=None):
+        """
+        Gets the document of a page, parsing it only if it is not in the cache
+        Args:
+            html (string): The HTML of the page
+            [url] (string): The URL of the page
+        Returns:
+            Document: The parsed page
+        """
+        key = (url, hashlib.blake2b(html.encode("utf-8"), digest_size=16).digest())
+        with self._lock:
+            document = self._documents.get(key)
+            if document:
+                self._documents.move_to_end(key)
+                self.hits += 1
+                return document
+            self.misses += 1
+
+        # Parse outside the lock, so threads can parse different pages at the same time
+        document = Document(html, url)
+        with self._lock:
+            self._documents[key] = document
+            while len(self._documents) > self.size:
+                self._documents.popitem(last=False)
+        return document
+
+    def clear(self):
+        with self._lock:
+            self._documents.clear()
+
+# Documents shared by every extractor
+default_cache = DocumentCache()
+
+def parse(html, url=None):
+    """
+    Parses a page once, returning the cached document when the same page is parsed again
+    Args:
+        html (string): The HTML of the page
+        [url] (string): The URL of the page
+    Returns:
+        Document: The parsed page
+    """
+    return default_cache.parse(html, url)
+
+def get_document(url, params=None):
+    """
+    Requests a page and parses it, see parse
+    Args:
+        url (string): The URL of the page
+        [params] (dict): Parameters to apply to the request
+    Returns:
+        Document: The parsed page
+    """
+    return parse(get_html(url, params), url)
@@ -1,13 +1,20 @@
-from bs4 import BeautifulSoup
-from requesting_urls import get_html
+from array import array
+from contextlib import nullcontext
+from document import parse, rows
+from requesting_urls import stream_html
+import instrument
+import patterns
 import regex as re
-import altair as alt
-import pandas as pd
+import concurrent.futures
+import numpy as np
 
 class Player:
     """
     Class to store information on NBA players
     """
+    # No __dict__ for each player, as there can be many of them
+    __slots__ = ("name", "team", "url", "ppg", "bpg", "rpg")
+
     def __init__(self, name, team, url):
         self.name = name
         self.team = team
@@ -30,6 +37,215 @@ class Player:
             "rpg": self.rpg
         }
 
+class PlayerTable:
+    """
+    Columnar store of players, for when there are too many for a Player object each.
+    The stats are kept in float64 arrays, and team names are interned, so each row stores a team id.
+    Rows can be appended one at a time as they are found, and stats set later as they arrive.
+    Properties:
+        names: List of the name of each player
+        urls: List of the url of each player
+        teams: List of the distinct team names, where a team id is the index of its name
+    """
+    stats = ("ppg", "bpg", "rpg")
+
+    def __init__(self, capacity=1024):
+        """
+        Args:
+            [capacity] (int): The amount of rows to make room for at first. Grows when needed
+        """
+        self.names = []
+        self.urls = []
+        self.teams = []
+        self._team_ids = {}
+        self._team = np.zeros(capacity, np.int32)
+        self._stats = {stat: np.zeros(capacity) for stat in self.stats}
+        # Appended rows are collected as flat (team, ppg, bpg, rpg) values, and moved to the arrays
+        # in one go when the arrays are read
+        self._stored = 0
+        self._pending = array("d")
+
+    @classmethod
+    def from_players(cls, players):
+        """
+        Creates a table of Player objects
+        Args:
+            players (list): The Players
+        Returns:
+            PlayerTable: The table of the players, in the same order
+        """
+        table = cls(max(len(players), 1))
+        for player in players:
+            table.append(player.name, player.team, player.url, player.ppg, player.bpg, player.rpg)
+        return table
+
+    def __len__(self):
+        return len(self.names)
+
+    def team_id(self, team):
+        # Returns the id of a team name, giving it a new id if it is not in the table
+        i = self._team_ids.get(team)
+        if i is None:
+            i = self._team_ids[team] = len(self.teams)
+            self.teams.append(team)
+        return i
+
+    def append(self, name, team, url, ppg=0, bpg=0, rpg=0):
+        """
+        Adds a player to the table
+        Args:
+            name (string): The name of the player
+            team (string): The name of the player's team
+            url (string): The url of the player
+            [ppg], [bpg], [rpg] (float): The stats of the player, if known
+        Returns:
+            int: The row of the player
+        """
+        self.names.append(name)
+        self.urls.append(url)
+        self._pending.extend((self.team_id(team), ppg, bpg, rpg))
+        return len(self.names) - 1
+
+    def set_stats(self, row, stats):
+        """
+        Sets the stats of a player, like from parse_player_stats
+        Args:
+            row (int): The row of the player
+            stats (tuple): The stats as (ppg, bpg, rpg). Nothing is changed if None
+        """
+        if not stats:
+            return
+        if row >= self._stored:
+            i = (row - self._stored) * 4
+            self._pending[i + 1:i + 4] = array("d", stats)
+            return
+        for stat, value in zip(self.stats, stats):
+            self._stats[stat][row] = value
+
+    def _store(self):
+        # Moves the appended rows to the arrays, doubling the arrays when they are full
+        if not self._pending:
+            return
+        size = len(self.names)
+        if size > len(self._team):
+            capacity = max(size, 2 * len(self._team))
+            self._team = np.concatenate([self._team[:self._stored], np.zeros(capacity - self._stored, np.int32)])
+            for stat, values in self._stats.items():
+                self._stats[stat] = np.concatenate([values[:self._stored], np.zeros(capacity - self._stored)])
+        pending = np.frombuffer(self._pending).reshape(-1, 4)
+        self._team[self._stored:size] = pending[:, 0]
+        for i, stat in enumerate(self.stats):
+            self._stats[stat][self._stored:size] = pending[:, i + 1]
+        self._stored = size
+        del pending
+        self._pending = array("d")
+
+    @property
+    def team(self):
+        # The team id of each row, as a view of the table's array
+        self._store()
+        return self._team[:len(self)]
+
+    def column(self, stat):
+        """
+        Gets a stat of every row, as a view of the table's array, without copying it.
+        The view no longer follows the table after the table grows
+        Args:
+            stat (string): "ppg", "bpg" or "rpg"
+        Returns:
+            array: The stat of each row
+        """
+        self._store()
+        return self._stats[stat][:len(self)]
+
+    def top(self, n, stat="ppg"):
+        """
+        Finds the top n rows of each team by a stat, without sorting the rows of every team.
+        The result matches sorting the rows of each team with a stable sort from highest to lowest
+        Args:
+            n (int): The amount of rows to keep of each team. No rows are kept if it is 0 or less
+            [stat] (string): The stat to rank by
+        Returns:
+            array: The rows of the top players, team by team in the order the teams were added,
+                and from highest to lowest stat within each team
+        """
+        if n <= 0:
+            return np.zeros(0, np.intp)
+        values = self.column(stat)
+        # Group the rows by team with a stable counting sort of the team ids, keeping the row order within teams
+        order = np.argsort(self.team, kind="stable")
+        bounds = np.searchsorted(self.team[order], np.arange(len(self.teams) + 1))
+        top = []
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            rows = order[start:end]
+            if len(rows) > n:
+                # The n-th highest value, and the rows above it, are found without a full sort.
+                # Ties at the n-th value are taken in row order, like a stable sort would
+                kth = np.partition(values[rows], len(rows) - n)[len(rows) - n]
+                above = rows[values[rows] > kth]
+                rows = np.concatenate([above, rows[values[rows] == kth][:n - len(above)]])
+            # Order the few kept rows by highest value, then by row
+            top.append(rows[np.lexsort((rows, -values[rows]))])
+        return np.concatenate(top) if top else np.zeros(0, np.intp)
+
+    def take(self, rows):
+        """
+        Creates a table of some of the rows
+        Args:
+            rows (array): The rows to keep, like from top
+        Returns:
+            PlayerTable: The table of the rows, in the given order
+        """
+        self._store()
+        table = PlayerTable(max(len(rows), 1))
+        for row in rows:
+            table.append(self.names[row], self.teams[self._team[row]], self.urls[row],
+                    *(self._stats[stat][row] for stat in self.stats))
+        return table
+
+    def players(self):
+        # Creates a Player object for every row
+        self._store()
+        players = []
+        for row in range(len(self)):
+            player = Player(self.names[row], self.teams[self._team[row]], self.urls[row])
+            player.ppg, player.bpg, player.rpg = (float(self._stats[stat][row]) for stat in self.stats)
+            players.append(player)
+        return players
+
+    def to_pandas(self):
+        """
+        Creates a pandas DataFrame of the table. The stat columns share memory with the table,
+        and the team column is categorical, using the team ids as codes
+        Returns:
+            DataFrame: The table with columns name, team, url, ppg, bpg and rpg
+        """
+        import pandas as pd
+        columns = {"name": self.names, "team": pd.Categorical.from_codes(self.team, self.teams), "url": self.urls}
+        columns.update((stat, self.column(stat)) for stat in self.stats)
+        return pd.DataFrame(columns, copy=False)
+
+    def to_arrow(self):
+        """
+        Creates a pyarrow Table of the table. The stat columns share memory with the table,
+        and the team column is dictionary encoded, using the team ids as indices
+        Returns:
+            Table: The table with columns name, team, url, ppg, bpg and rpg
+        """
+        import pyarrow as pa
+        columns = {
+            "name": pa.array(self.names, pa.string()),
+            "team": pa.DictionaryArray.from_arrays(pa.array(self.team), pa.array(self.teams, pa.string())),
+            "url": pa.array(self.urls, pa.string())
+        }
+        columns.update((stat, pa.array(self.column(stat))) for stat in self.stats)
+        return pa.table(columns)
+
+# The number at the start of a stat cell, for safe_float
+number_pattern = patterns.register("players.number", "[\d\.]+")
+# Opening and closing table tags, for read_table
+table_tag_pattern = patterns.register("players.table_tag", "<(/?)table")
+
 def safe_float(string):
     """
     Converts a string to float with a zero as a safetynet
@@ -38,9 +254,171 @@ def safe_float(string):
     Returns:
         float: The first float value within the string. If no valid float exists, returns 0
     """
-    num = re.match("[\d\.]+", string)
+    num = number_pattern.match(string)
     return float(num.group(0)) if num else 0
 
+def read_table(chunks, marker):
+    """
+    Reads chunks of HTML until a table has been closed, and stops the download there.
+    The table is the one the marker is in the opening tag of, or else the first table after the marker
+    Args:
+        chunks (iterable): The chunks of HTML, like from stream_html
+        marker (string): Text to find the table by, like an id or attribute
+    Returns:
+        string: The HTML up to the end of the table. All of the HTML if the table was not found or never closed
+    """
+    html = ""
+    start = -1
+    for chunk in chunks:
+        html += chunk
+        if start < 0:
+            at = html.find(marker)
+            if at < 0:
+                continue
+            start = html.find("<table", html.rfind("<", 0, at))
+            if start < 0:
+                continue
+
+        # Count nested tables, the table ends when every table opened since its start is closed
+        depth = 0
+        for tag in table_tag_pattern.finditer(html[start:]):
+            depth += -1 if tag.group(1) else 1
+            if depth == 0:
+                end = html.find(">", start + tag.end())
+                if end < 0:
+                    break
+                if hasattr(chunks, "close"):
+                    chunks.close()
+                return html[:end + 1]
+    return html
+
+def fetch_player_page(player):
+    # Downloads the part of a player's page up to the end of the regular season stats table
+    return read_table(stream_html("https://en.wikipedia.org" + player.url), 'id="Regular_season"')
+
+class StatTable:
+    """
+    Class to store the stats table of a player, with a row for every season and team.
+    Every numeric column is kept as a float64 array, so any season and stat can be looked up
+    without going through the HTML again
+    Properties:
+        seasons: List of the season of each row, like "2019–20"
+        teams: List of the team of each row
+        columns: Dictionary of {header: array} for every numeric column, like "PPG"
+    """
+    def __init__(self, seasons, teams, columns):
+        self.seasons = seasons
+        self.teams = teams
+        self.columns = columns
+
+    def __len__(self):
+        return len(self.seasons)
+
+    def rows(self, season):
+        """
+        Finds the rows of a season
+        Args:
+            season (string): Regex the season must start with, like "2019.20"
+        Returns:
+            list: The indices of the rows of the season
+        """
+        pattern = re.compile(season)
+        return [i for i, s in enumerate(self.seasons) if pattern.match(s)]
+
+    def column(self, name):
+        """
+        Finds a column by its header. If the table names its columns differently, like "PTS" for "PPG",
+        the column at the position of the name in stat_headers is used instead
+        Args:
+            name (string): The header of the column, like "PPG"
+        Returns:
+            array: The values of the column, or None if the table has no such column
+        """
+        if name in self.columns:
+            return self.columns[name]
+        if name in stat_headers:
+            # The first two columns are the season and team, which are not numeric
+            i = stat_headers.index(name) - 2
+            columns = list(self.columns.values())
+            if i < len(columns):
+                return columns[i]
+        return None
+
+    def stats(self, season, names=("PPG", "BPG", "RPG")):
+        """
+        Gets stats of a season. If a player played for several teams in a season, the last row is used
+        Args:
+            season (string): Regex the season must start with, like "2019.20"
+            [names] (tuple): The headers of the stats to get, see column
+        Returns:
+            tuple: The stats in the order of the names, where missing columns are 0,
+                or None if the season is not in the table
+        """
+        rows = self.rows(season)
+        if not rows:
+            return None
+        columns = [self.column(name) for name in names]
+        return tuple(float(column[rows[-1]]) if column is not None else 0.0 for column in columns)
+
+# The columns of the stats tables in Wikipedia, for tables where the header row is not found
+stat_headers = ["Year", "Team", "GP", "GS", "MPG", "FG%", "3P%", "FT%", "RPG", "APG", "SPG", "BPG", "PPG"]
+
+@instrument.traced("extract.stat_table")
+def parse_stat_table(html, section="Regular_season"):
+    """
+    Extracts every season and every numeric column of a player's stats table in one pass.
+    The columns are found by the names in the header row, instead of by position
+    Args:
+        html (string): The HTML of the player's page
+        [section] (string): The id of the header the table comes after
+    Returns:
+        StatTable: The stats of the player. Empty if the section was not found
+    """
+    soup_table = parse(html).after(section, "tbody")
+    header = stat_headers
+    seasons = []
+    teams = []
+    values = []
+    for row in soup_table.find_all("tr") if soup_table else []:
+        names = [th.get_text(strip=True) for th in row.find_all("th")]
+        if names and not values:
+            header = names
+            continue
+        cells = row.find_all("td")
+        # Row must have a cell for every column, which also skips the career total rows
+        if len(cells) >= len(header):
+            seasons.append(cells[0].get_text().strip())
+            teams.append(cells[1].get_text().strip())
+            values.append([safe_float(cells[i].get_text()) for i in range(2, len(header))])
+
+    numbers = np.array(values, dtype=float).reshape(len(values), len(header) - 2)
+    return StatTable(seasons, teams, {name: numbers[:, i] for i, name in enumerate(header[2:])})
+
+def get_stat_table(player):
+    """
+    Fetches the stats table of a Player, see parse_stat_table
+    Args:
+        player: Player-object to fetch the stats of
+    Returns:
+        StatTable: The stats of the player
+    """
+    return parse_stat_table(fetch_player_page(player))
+
+def parse_player_stats(html):
+    """
+    Finds the points/blocks/rebounds per game stats of the 2019-20 season in a player's page
+    Args:
+        html (string): The HTML of the player's page
+    Returns:
+        tuple: The stats as (ppg, bpg, rpg), or None if the page has no stats for the season
+    """
+    return parse_stat_table(html).stats("2019.20")
+
+def set_stats(player, stats):
+    # Writes the stats from parse_player_stats to a Player
+    if stats:
+        player.ppg, player.bpg, player.rpg = stats
+
 def get_player_stats(player):
     """
     Fetches the points/blocks/rebounds per game stats for a given Player
@@ -48,56 +426,96 @@ def get_player_stats(player):
         player: Player-object to fetch stats for and to write them back to
     """
     print("Fetching stats for", player.name)
+    set_stats(player, parse_player_stats(fetch_player_page(player)))
 
-    # Find the correct header for regular season stats
-    html = get_html("https://en.wikipedia.org" + player.url)
-    soup = BeautifulSoup(html, "html.parser")
-    soup_header = soup.find("span", {"id": "Regular_season"})
-
-    # If the header was not found, assume no stats for the season
-    if soup_header:
-        soup_table = soup_header.findNext("tbody")
-        for row in soup_table.findAll("tr"):
-            cells = row.findAll("td")
-            # Row must have appropriate number of cells, and match the correct season date
-            if len(cells) >= 13 and re.match("2019.20", cells[0].get_text()):
-                # Extract the stats from each cell
-                player.ppg = safe_float(cells[12].get_text())
-                player.bpg = safe_float(cells[11].get_text())
-                player.rpg = safe_float(cells[8].get_text())
+def fetch_roster_page(team_url):
+    # Downloads the part of a team's page up to the end of the roster table
+    return read_table(stream_html("https://en.wikipedia.org" + team_url), 'id="Roster"')
 
-def get_players(team_url, team_name, limit=None):
+@instrument.traced("extract.roster")
+def parse_roster(html):
     """
-    Gets a list of Players for an NBA team, and each of their stats
+    Finds the players in the roster of a team's page
     Args:
-        team_url (string): The url for the team's wikipedia page
-        team_name (string): The name of the team. This is assigned to each Player
-        [limit] (int): Limits the list of Players to the top [limit] players by points per game
+        html (string): The HTML of the team's page
     Returns:
-        list: A list of Players for the team
+        list: A list of the players, where each item is a tuple of (name, url)
     """
     # Find the table for the Roster
-    html = get_html("https://en.wikipedia.org" + team_url)
-    soup = BeautifulSoup(html, "html.parser")
-    soup_header = soup.find("span", {"id": "Roster"})
-    soup_table = soup_header.findNext("tbody").findNext("tbody")
+    soup_table = parse(html).after("Roster", "tbody").findNext("tbody")
 
-    players = []
-    for row in soup_table.findAll("tr"):
-        cells = row.findAll("td")
+    roster = []
+    for cells in rows(soup_table):
         # Row must contain a minimum of 2 cells to have a player name
         if len(cells) > 2:
             a = cells[2].find("a")
-            # Create a Player-object with the name and url of the player
-            player = Player(a["title"], team_name, a["href"])
-            get_player_stats(player)
-            players.append(player)
-    # Limit the list to top [limit] players by points per game if the argument is given
+            roster.append((a["title"], a["href"]))
+    return roster
+
+def top_players(players, limit=None):
+    # Limits a list of Players to the top [limit] players by points per game if the argument is given
     if limit:
-        players.sort(reverse=True)
-        players = players[:limit]
+        players = sorted(players, reverse=True)[:limit]
     return players
 
+def get_players(team_url, team_name, limit=None):
+    """
+    Gets a list of Players for an NBA team, and each of their stats
+    Args:
+        team_url (string): The url for the team's wikipedia page
+        team_name (string): The name of the team. This is assigned to each Player
+        [limit] (int): Limits the list of Players to the top [limit] players by points per game
+    Returns:
+        list: A list of Players for the team
+    """
+    players = []
+    for name, url in parse_roster(fetch_roster_page(team_url)):
+        # Create a Player-object with the name and url of the player
+        player = Player(name, team_name, url)
+        get_player_stats(player)
+        players.append(player)
+    return top_players(players, limit)
+
+def get_all_players(teams, limit=None, threads=8, processes=None):
+    """
+    Gets the Players of several teams and their stats, like get_players for each team, but concurrently.
+    The roster pages of all teams are requested at once, and the pages of the players of a team are
+    requested as soon as its roster is parsed, with at most [threads] requests at a time.
+    Every player's stats are needed to find the top players of a team, so all of them are fetched, like with get_players
+    Args:
+        teams (list): The teams, where each item is a list of [team_url, team_name], like from get_teams
+        [limit] (int): Limits the list of Players of each team to the top [limit] players by points per game
+        [threads] (int): The maximum amount of pages to request at the same time
+        [processes] (int): The amount of processes to parse the pages in. Parses them in the request threads by default
+    Returns:
+        list: The Players of all teams, in the same order as get_players would give them team by team
+    """
+    with concurrent.futures.ThreadPoolExecutor(threads) as pool, \
+            (concurrent.futures.ProcessPoolExecutor(processes) if processes else nullcontext()) as parsers:
+
+        def run(function, html):
+            # Parses a page in the process pool if there is one, else in the calling thread
+            return parsers.submit(function, html).result() if parsers else function(html)
+
+        def roster(team_url):
+            return run(parse_roster, fetch_roster_page(team_url))
+
+        def stats(player):
+            print("Fetching stats for", player.name)
+            set_stats(player, run(parse_player_stats, fetch_player_page(player)))
+
+        rosters = {pool.submit(roster, team[0]): i for i, team in enumerate(teams)}
+        players = [None] * len(teams)
+        pending = []
+        for future in concurrent.futures.as_completed(rosters):
+            i = rosters[future]
+            players[i] = [Player(name, teams[i][1], url) for name, url in future.result()]
+            pending += [pool.submit(stats, player) for player in players[i]]
+        for future in pending:
+            future.result()
+
+    return [player for team_players in players for player in top_players(team_players, limit)]
+
 def get_teams(url):
     """
     Fetches a list of NBA teams in the semifinals from the NBA playoffs Wikipedia page
@@ -106,32 +524,40 @@ def get_teams(url):
     Returns:
         list: A list of the teams in the semifinals, where each item is a list of [team_url, team_name]
     """
-    html = get_html(url)
+    # Only download the page until the end of the table containing the bracket
+    html = read_table(stream_html(url), 'border="0"')
 
     # Find the table containing the bracket
-    soup = BeautifulSoup(html, "html.parser")
-    soup_table = soup.find("table", {"border": "0"})
+    soup_table = parse(html, url).table({"border": "0"})
 
     # All winners are in bold text, and semifinals require one win,
     # so finding all bold names in the table find all semifinal teams
     # Put them in a set to remove duplicates
-    teams = set(re.findall('<b>[^<]*<a href="([^"]*)"[^>]*>([^<]*)', str(soup_table)))
+    teams = set()
+    for bold in soup_table.find_all("b"):
+        # The team link is the first tag in the bold text
+        link = bold.find(True, recursive=False)
+        if link and link.name == "a" and link.has_attr("href"):
+            teams.add((link["href"], link.get_text()))
 
     # Remove results with "Conference" as these are noe actually teams in the table
-    teams = [t for t in teams if not re.search("Conference", t[1])]
+    teams = [t for t in teams if "Conference" not in t[1]]
     return teams
 
 if __name__ == "__main__":
-    teams = get_teams("https://en.wikipedia.org/wiki/2020_NBA_playoffs")
+    # Only needed for the charts
+    import altair as alt
+    import pandas as pd
 
-    # Make a list of all players for all teams
-    players = []
+    teams = get_teams("https://en.wikipedia.org/wiki/2020_NBA_playoffs")
     for team in teams:
         print(team)
-        players += get_players(team[0], team[1], 3)
 
-    # Create a pandas dataframe of the Player-objects as dictionaries
-    data = pd.DataFrame([player.to_dict() for player in players])
+    # Make a list of all players for all teams
+    players = get_all_players(teams, 3)
+
+    # Create a pandas dataframe of the players through a columnar table
+    data = PlayerTable.from_players(players).to_pandas()
 
     stats = ["ppg", "bpg", "rpg"]
     title = ["Points Per Game", "Blocks Per Game", "Rebound Per Game"]
@@ -1,5 +1,185 @@
+from html import unescape
+from urllib.parse import unquote, urljoin, urlsplit
+import instrument
+import patterns
 import regex as re
-from requesting_urls import get_html
+from requesting_urls import get_html, stream_html
+
+class LinkExtractor:
+    """
+    Extracts the links of an HTML page in a single pass over the <a> tags.
+    The HTML can be given in chunks, as it arrives, and links are returned as soon as their tag is complete.
+    Links are made absolute, have their fragment removed, are only returned once,
+    and are classified as "article" (Wikipedia articles), "namespace" (other Wikipedia pages, like File:) or "other".
+    """
+    # An <a> tag up to the value of its href attribute, quoted or not. HTML only counts ASCII whitespace as whitespace.
+    # Runs over every page, so it uses the re module, which scans about twice as fast here
+    pattern = patterns.register("links.href",
+            r"""<[aA][ \t\n\r\f](?:[^>]*?[ \t\n\r\f])??href[ \t\n\r\f]*=[ \t\n\r\f]*["']?([^"'> \t\n\r\f]*)""", engine="re")
+    # A whole <a> tag with its attributes and content, for the anchor text
+    anchor_pattern = patterns.register("links.anchor", r"""<[aA](\s[^>]*)>(.*?)</[aA]\s*>""", re.DOTALL)
+    href_pattern = patterns.register("links.href_attribute", r"""(?<=\s)href\s*=\s*["']?([^"'\s>]*)""")
+    title_pattern = patterns.register("links.title_attribute", r"""(?<=\s)title\s*=\s*(?:"([^"]*)"|'([^']*)')""")
+    open_pattern = patterns.register("links.open", "<[aA]\\s")
+    tag_pattern = patterns.register("links.inner_tag", "<[^>]*>")
+
+    def __init__(self, url=None, dedup=True, anchors=False):
+        """
+        Args:
+            [url] (string): The URL of the page, to make relative links complete
+            [dedup] (bool): Only return each link the first time it is found
+            [anchors] (bool): Also return the title attribute and text of each link.
+                Only links with a closing </a> tag are found then
+        """
+        self.url = url
+        self.dedup = dedup
+        self.anchors = anchors
+        self.seen = set()
+        self._rest = ""
+        self._normalized = {}
+        parts = urlsplit(url or "")
+        self._origin = f"{parts.scheme}://{parts.netloc}"
+
+    def feed(self, chunk):
+        """
+        Extracts the links from the next chunk of HTML
+        Args:
+            chunk (string): The next part of the HTML
+        Returns:
+            list: The new links, where each item is a tuple of (url, kind), or (url, kind, title, text) with anchors
+        """
+        rest = self._rest
+        html = rest + chunk if rest else chunk
+        # Keep a tag that is cut off at the end of the chunk for the next chunk.
+        # The tail carried over from the last chunk has no complete tag after its "<", so only the new chunk is searched
+        cut = html.rfind("<", len(rest))
+        if cut < 0:
+            cut = rest.rfind("<")
+        if cut < 0 or html.find(">", cut) >= 0:
+            cut = len(html)
+        if self.anchors:
+            # Also keep a link whose closing tag has not arrived yet, which is a link opened after the last closing tag.
+            # A closing tag can only be complete if it ends in the new chunk
+            start = max(len(rest) - 3, 0)
+            closed = max(html.rfind("</a>", start, cut), html.rfind("</A>", start, cut))
+            opened = self.open_pattern.compiled.search(html, closed + 1, cut)
+            if opened:
+                cut = opened.start()
+        self._rest = html[cut:]
+        return self._extract(html, cut)
+
+    def close(self):
+        # Extracts the links from any HTML left over after the last chunk
+        html, self._rest = self._rest, ""
+        return self._extract(html, len(html))
+
+    def _extract(self, html, end):
+        # Extracts the links from the HTML before [end], without copying it
+        if self.anchors:
+            hrefs = []
+            anchors = {} # The attributes and text of each href, from its first link
+            for attributes, text in self.anchor_pattern.findall(html, 0, end):
+                href = self.href_pattern.compiled.search(attributes)
+                if href:
+                    hrefs.append(href.group(1))
+                    anchors.setdefault(href.group(1), (attributes, text))
+        else:
+            hrefs = self.pattern.findall(html, 0, end)
+        links = []
+        normalized = self._normalized
+        seen = self.seen
+        dedup = self.dedup
+        anchored = self.anchors
+        origin = self._origin if self.url else ""
+        for href in hrefs:
+            if href in normalized:
+                # The link of a repeated href was already returned or dropped
+                if dedup:
+                    continue
+                link = normalized[href]
+            elif href.startswith("/wiki/") and "#" not in href and "?" not in href and "&" not in href:
+                # Fast path for the plain article and namespace links that most pages consist of.
+                # A colon may be percent-encoded in the title
+                link = normalized[href] = (origin + href,
+                        "namespace" if ":" in href or "%3A" in href or "%3a" in href else "article")
+            elif href.startswith("#"):
+                # Links within the same page, like the citations
+                link = normalized[href] = None
+            else:
+                link = normalized[href] = self.link(href)
+            if not link or (dedup and link[0] in seen):
+                continue
+            seen.add(link[0])
+            if anchored:
+                link += self.anchor(*anchors[href])
+            links.append(link)
+        return links
+
+    def link(self, href):
+        # Makes the (url, kind) of an href, or None for links within the same page
+        if href.startswith(("https://", "http://")) and "#" not in href and "&" not in href:
+            # Complete links without a fragment or entities are already normalized
+            return (href, self.classify(href))
+        url = self.normalize(href)
+        return (url, self.classify(url)) if url else None
+
+    def anchor(self, attributes, text):
+        # Gets the title attribute and the readable text of a link
+        title = self.title_pattern.compiled.search(attributes)
+        title = unescape(title.group(1) or title.group(2)) if title else ""
+        if "<" in text:
+            text = self.tag_pattern.compiled.sub("", text)
+        return title, " ".join(unescape(text).split())
+
+    def normalize(self, link):
+        # Makes a link absolute without its fragment. Returns None for links within the same page
+        if "&" in link:
+            link = unescape(link)
+        link = link.strip().split("#", 1)[0]
+        if not link or link.startswith("javascript:"):
+            return None
+        if self.url and not link.startswith(("https://", "http://")):
+            if link.startswith("/") and not link.startswith("//"):
+                link = self._origin + link
+            else:
+                link = urljoin(self.url, link)
+        return link
+
+    def classify(self, link):
+        # Finds out if a link is a Wikipedia article, another Wikipedia page, or something else
+        if link.startswith("/wiki/"):
+            title = link[6:]
+        elif "wikipedia.org/wiki/" not in link:
+            return "other"
+        else:
+            host = link.find("://") + 3
+            path = link.find("/", host)
+            if host < 3 or path < 0 or not link[host:path].endswith("wikipedia.org") or not link.startswith("/wiki/", path):
+                return "other"
+            title = link[path + 6:]
+        if "?" in title:
+            return "other"
+        if "%" in title:
+            title = unquote(title)
+        return "namespace" if ":" in title else "article"
+
+@instrument.traced("extract.links")
+def extract_links(html, url=None, anchors=False):
+    """
+    Extracts all links from HTML in a single pass, see LinkExtractor
+    Args:
+        html (string or iterable): The HTML, or an iterable of HTML chunks
+        [url] (string): The URL of the HTML to make relative links complete
+        [anchors] (bool): Also get the title attribute and text of each link
+    Returns:
+        list: The links, where each item is a tuple of (url, kind), or (url, kind, title, text) with anchors
+    """
+    extractor = LinkExtractor(url, anchors=anchors)
+    chunks = [html] if isinstance(html, str) else html
+    links = []
+    for chunk in chunks:
+        links += extractor.feed(chunk)
+    return links + extractor.close()
 
 def find_urls(html, url=None, output=None):
     """
@@ -8,42 +188,54 @@ def find_urls(html, url=None, output=None):
         html (string): The HTML string to find URLs in
         [url] (string): The URL of the HTML to make relative links complete
     Returns:
-        list: A list of all URLs found within the HTML
+        list: A list of all URLs found within the HTML, without duplicates
     """
-    # Find elements starting with <a, then any characters until it meets the href with the URL
-    urls = re.findall('<a[^(?:href)]*href="([^"#]*)"', html)
-    if url:
-        # Add base URL to all relative URLs
-        base = re.compile('(https://[^/]*)')
-        base_url = base.match(url).group(1)
-        urls = [s if base.search(s) else f"{base_url}{s}" for s in urls]
+    urls = [link for link, kind in extract_links(html, url)]
 
     if output:
         write_to_file(output, urls)
 
     return urls
 
-def find_articles(url, output=None):
+@instrument.traced("extract.articles")
+def find_articles(url, output=None, content_only=False, anchors=False):
     """
     Finds all Wikipedia article links within a Wikipedia page.
+    The page is streamed into the link extractor while it is downloaded.
     Args:
         url (string): The URL of the wikipedia page to fetch
         [output] (string): Optional filename to write urls to
+        [content_only] (bool): Only find links in the article content, and stop the download where it ends
+        [anchors] (bool): Return the title attribute and text of each link as well
     Returns:
-        list: List of Wikipedia article URLs
+        list: List of Wikipedia article URLs, or of (url, title, text) tuples with anchors
     """
-    html = get_html(url)
-    urls = find_urls(html, url)
-    # Article test, URL must either be relative or have a wikipedia URL
-    is_wiki_url = re.compile('(?:^|wikipedia.org)/wiki/')
-    # Check if the URL is a namespace (contains a colon)
-    is_namespace = re.compile('https://[^:]*:')
-    # Create a list containing only URLs that passes the article test and is not a namespace
-    article_urls = [url for url in urls if is_wiki_url.search(url) and not is_namespace.search(url)]
+    extractor = LinkExtractor(url, anchors=anchors)
+    links = []
+    chunks = stream_html(url)
+    # The end of the article content, right before the categories, sidebar and footer
+    end_marker = 'class="printfooter"'
+    tail = ""
+    for chunk in chunks:
+        if content_only:
+            # Look for the marker across the end of the previous chunk as well
+            end = (tail + chunk).find(end_marker)
+            if end >= 0:
+                links += extractor.feed(chunk[:max(end - len(tail), 0)])
+                chunks.close()
+                break
+            tail = chunk[-len(end_marker):]
+        links += extractor.feed(chunk)
+    else:
+        links += extractor.close()
+    # Only keep links to articles, not namespaces like File: or Help:
+    article_urls = [link[0] for link in links if link[1] == "article"]
 
     if output:
         write_to_file(output, article_urls)
 
+    if anchors:
+        return [(link[0], link[2], link[3]) for link in links if link[1] == "article"]
     return article_urls
 
 def write_to_file(output, urls):
@@ -0,0 +1,221 @@
+import functools
+import json
+import os
+import threading
+import time
+
+# If spans, counters and gauges are recorded. When off, every hook returns right away
+enabled = False
+
+# The recorded spans and gauge samples, as tuples of (kind, name, start, duration or value, thread id, args)
+events = []
+
+# Totals of the counters, on the form {name: value}
+counters = {}
+
+_lock = threading.Lock()
+_origin = time.perf_counter()
+
+class Span:
+    """
+    Class to time a block of code, used through span.
+    The span is recorded when the block ends, also if it raises an error
+    Properties:
+        name: The name of the span, like "fetch.request"
+        args: Details of the span, like the url
+    """
+    __slots__ = ("name", "args", "start")
+
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter()
+        events.append(("span", self.name, self.start, end - self.start, threading.get_ident(), self.args))
+        return False
+
+class NullSpan:
+    # Does nothing, returned by span while recording is off
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_null_span = NullSpan()
+
+class TracedLock:
+    """
+    Lock that counts how long threads wait to acquire it, used through lock.
+    The waits are added to the counters "lock.[name].wait_seconds" and "lock.[name].acquired"
+    Properties:
+        name: The name of the lock, like "queue"
+    """
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self._wait = f"lock.{name}.wait_seconds"
+        self._acquired = f"lock.{name}.acquired"
+
+    def acquire(self, blocking=True, timeout=-1):
+        start = time.perf_counter()
+        acquired = self._lock.acquire(blocking, timeout)
+        count(self._wait, time.perf_counter() - start)
+        count(self._acquired)
+        return acquired
+
+    def release(self):
+        self._lock.release()
+
+    def locked(self):
+        return self._lock.locked()
+
+    __enter__ = acquire
+
+    def __exit__(self, *exc):
+        self._lock.release()
+
+def enable(on=True):
+    """
+    Turns recording on or off. Recorded data is kept until reset
+    Args:
+        [on] (bool): If spans, counters and gauges should be recorded
+    """
+    global enabled
+    enabled = on
+
+def reset():
+    # Removes all recorded spans, gauge samples and counters
+    with _lock:
+        events.clear()
+        counters.clear()
+
+def span(name, **args):
+    """
+    Times a block of code while recording is on, as in: with span("parse", url=url):
+    Args:
+        name (string): The name of the span
+        [args]: Details to store with the span
+    Returns:
+        Span: A context manager for the block. One that does nothing while recording is off
+    """
+    if not enabled:
+        return _null_span
+    return Span(name, args)
+
+def traced(name=None):
+    """
+    Decorator that records a span for every call of a function while recording is on
+    Args:
+        [name] (string): The name of the spans. The name of the function by default
+    Returns:
+        function: The decorator
+    """
+    def decorator(function):
+        span_name = name or function.__name__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return function(*args, **kwargs)
+            with Span(span_name, {}):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def count(name, value=1):
+    """
+    Adds to a counter while recording is on, like the bytes fetched
+    Args:
+        name (string): The name of the counter
+        [value] (number): The amount to add
+    """
+    if enabled:
+        with _lock:
+            counters[name] = counters.get(name, 0) + value
+
+def gauge(name, value):
+    """
+    Records the current value of something that changes over time, like the size of a queue
+    Args:
+        name (string): The name of the gauge
+        value (number): The current value
+    """
+    if enabled:
+        events.append(("gauge", name, time.perf_counter(), value, threading.get_ident(), None))
+
+def lock(name):
+    """
+    Creates a lock for a data structure shared between threads. While recording is on, the lock counts
+    how long threads wait for it, see TracedLock. Otherwise it is a plain lock without any overhead,
+    so recording must be turned on before the structure is created to see its lock
+    Args:
+        name (string): The name of the lock in the counters
+    Returns:
+        Lock: The lock
+    """
+    return TracedLock(name) if enabled else threading.Lock()
+
+def summary():
+    """
+    Sums up the recorded data
+    Returns:
+        dict: The spans as {name: {count, seconds, max_seconds}}, the gauges as {name: {samples, last, max}},
+            and the counters as {name: value}
+    """
+    spans = {}
+    gauges = {}
+    for kind, name, start, value, thread, args in list(events):
+        if kind == "span":
+            s = spans.setdefault(name, {"count": 0, "seconds": 0.0, "max_seconds": 0.0})
+            s["count"] += 1
+            s["seconds"] += value
+            s["max_seconds"] = max(s["max_seconds"], value)
+        else:
+            g = gauges.setdefault(name, {"samples": 0, "last": value, "max": value})
+            g["samples"] += 1
+            g["last"] = value
+            g["max"] = max(g["max"], value)
+    with _lock:
+        totals = dict(counters)
+    return {"spans": spans, "gauges": gauges, "counters": totals}
+
+def write_summary(output):
+    """
+    Writes the summary of the recorded data to a JSON file, see summary
+    Args:
+        output (string): The file to write to
+    """
+    with open(output, "w") as f:
+        json.dump(summary(), f, indent=2)
+
+def write_trace(output):
+    """
+    Writes the recorded spans and gauges to a file in the Chrome trace format,
+    which can be opened in chrome://tracing or https://ui.perfetto.dev to see each thread's spans on a timeline
+    Args:
+        output (string): The file to write to
+    """
+    pid = os.getpid()
+    trace = []
+    for kind, name, start, value, thread, args in list(events):
+        # Chrome traces are in microseconds
+        ts = (start - _origin) * 1e6
+        if kind == "span":
+            trace.append({"name": name, "ph": "X", "ts": ts, "dur": value * 1e6, "pid": pid, "tid": thread,
+                    "args": {k: str(v) for k, v in args.items()}})
+        else:
+            trace.append({"name": name, "ph": "C", "ts": ts, "pid": pid, "args": {name: value}})
+    end = (time.perf_counter() - _origin) * 1e6
+    with _lock:
+        # Counters are placed at the end of the trace with their totals
+        trace += [{"name": name, "ph": "C", "ts": end, "pid": pid, "args": {name: value}} for name, value in counters.items()]
+    with open(output, "w") as f:
+        json.dump({"traceEvents": trace, "displayTimeUnit": "ms"}, f)
@@ -0,0 +1,108 @@
+import collections
+import patterns
+import regex as re
+
+class KeywordMatcher:
+    """
+    Aho-Corasick automaton over tiers of keywords, to find every keyword in a text in a single pass.
+    The automaton is built once, and can then score any amount of pages.
+    """
+    def __init__(self, tiers):
+        """
+        Args:
+            tiers (list): A list of keyword lists, one for each priority tier.
+                A keyword listed several times in a tier counts several times
+        """
+        self.tiers = len(tiers)
+        # How many times each keyword appears in each tier
+        self.weights = []
+        ids = {}
+        for tier, keywords in enumerate(tiers):
+            for k in keywords:
+                if k not in ids:
+                    ids[k] = len(self.weights)
+                    self.weights.append([0] * self.tiers)
+                self.weights[ids[k]][tier] += 1
+        self.keywords = list(ids)
+        self._build()
+
+    def _build(self):
+        # Builds the trie of all keywords, then the failure links and the complete transition table
+        goto = [{}]
+        output = [[]]
+        for i, k in enumerate(self.keywords):
+            state = 0
+            for ch in k:
+                if ch not in goto[state]:
+                    goto.append({})
+                    output.append([])
+                    goto[state][ch] = len(goto) - 1
+                state = goto[state][ch]
+            output[state].append(i)
+
+        # Breadth first, so the failure state of every state is known before its children
+        fail = [0] * len(goto)
+        delta = [dict(g) for g in goto]
+        queue = collections.deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            output[state] = output[state] + output[fail[state]]
+            # Characters the state has no edge for continue from the failure state
+            for ch, target in delta[fail[state]].items():
+                delta[state].setdefault(ch, target)
+            for ch, child in goto[state].items():
+                fail[child] = delta[fail[state]].get(ch, 0) if state else 0
+                queue.append(child)
+
+        self._delta = delta
+        self._output = [tuple(o) for o in output]
+
+    def find(self, text):
+        """
+        Finds which keywords occur in a text
+        Args:
+            text (string): The text to search, it should be lowercase like the keywords
+        Returns:
+            set: The indices of the keywords found, in self.keywords
+        """
+        delta = self._delta
+        output = self._output
+        found = set()
+        state = 0
+        for ch in text:
+            state = delta[state].get(ch, 0)
+            if output[state]:
+                found.update(output[state])
+        return found
+
+    def count(self, text):
+        """
+        Counts the keywords of each tier that occur in a text
+        Args:
+            text (string): The text to search, it should be lowercase like the keywords
+        Returns:
+            list: The amount of keyword hits for each tier
+        """
+        counts = [0] * self.tiers
+        for i in self.find(text):
+            for tier, weight in enumerate(self.weights[i]):
+                counts[tier] += weight
+        return counts
+
+# Scripts and styles with their content, and any other tag, for body_text
+script_pattern = patterns.register("text.script", "<(script|style)[^>]*>.*?</\\1>", re.DOTALL)
+tag_pattern = patterns.register("text.tag", "<[^>]*>")
+
+def body_text(html):
+    """
+    Gets the readable text of a Wikipedia article, without markup, navigation or footer
+    Args:
+        html (string): The HTML of the article
+    Returns:
+        string: The text of the article body
+    """
+    start = html.find('id="mw-content-text"')
+    end = html.find('class="printfooter"', start)
+    body = html[max(start, 0):end if end > 0 else len(html)]
+    body = script_pattern.sub(" ", body)
+    return tag_pattern.sub(" ", body)
@@ -0,0 +1,262 @@
+from array import array
+import collections
+import mmap
+import os
+import threading
+
+class LinkGraph:
+    """
+    Link graph of crawled articles, where every article url is interned as an integer id.
+    Saved adjacency is kept as two flat arrays, offsets and targets, where the links of article i
+    are targets[offsets[i]:offsets[i + 1]]. A saved graph file is memory-mapped when loaded, and
+    links added after that are kept in memory until the next save.
+    Safe to share between threads.
+    """
+    def __init__(self, path=None):
+        """
+        Args:
+            [path] (string): The file to load the graph from and save it to. None keeps it in memory only
+        """
+        self.path = path
+        self.urls = []
+        self.ids = {}
+        self._offsets = array("q", [0])
+        self._targets = array("i")
+        self._expanded = bytearray()
+        self._pending = {}
+        self._map = None
+        self._lock = threading.RLock()
+        if path and os.path.exists(path):
+            self.load()
+
+    def intern(self, url):
+        # Returns the id of a url, giving it a new id if it is not in the graph
+        with self._lock:
+            i = self.ids.get(url)
+            if i is None:
+                i = self.ids[url] = len(self.urls)
+                self.urls.append(url)
+            return i
+
+    def add(self, url, links):
+        """
+        Records the outgoing links of an article, replacing any previous links
+        Args:
+            url (string): The url of the article
+            links (list): The urls of the articles it links to
+        """
+        with self._lock:
+            self._pending[self.intern(url)] = array("i", (self.intern(l) for l in links))
+
+    def neighbours(self, i):
+        """
+        Gets the outgoing links of an article by id
+        Args:
+            i (int): The id of the article
+        Returns:
+            sequence: The ids the article links to, or None if its links are not known
+        """
+        links = self._pending.get(i)
+        if links is not None:
+            return links
+        if i < len(self._expanded) and self._expanded[i]:
+            return self._targets[self._offsets[i]:self._offsets[i + 1]]
+        return None
+
+    def links(self, url):
+        """
+        Gets the outgoing links of an article
+        Args:
+            url (string): The url of the article
+        Returns:
+            list: The urls the article links to, or None if its links are not known
+        """
+        i = self.ids.get(url)
+        links = None if i is None else self.neighbours(i)
+        return None if links is None else [self.urls[j] for j in links]
+
+    def cached(self, fetch):
+        """
+        Wraps a link function, so links are read from the graph when known, and stored in it when fetched
+        Args:
+            fetch (function): Returns the list of article urls an article links to, like find_articles
+        Returns:
+            CachedLinks: The wrapped function
+        """
+        return CachedLinks(self, fetch)
+
+    def cached_anchors(self, fetch):
+        """
+        Like cached, for a link function returning anchors, such as the one of a Prescorer.
+        Only the urls of the anchors are stored, so known links come back with an empty title and text
+        Args:
+            fetch (function): Returns the (url, title, text) of the articles an article links to, like article_anchors
+        Returns:
+            CachedAnchors: The wrapped function
+        """
+        return CachedAnchors(self, fetch)
+
+    def shortest_path(self, start, goal):
+        """
+        Finds the shortest path between two articles with a breadth first search over the known links
+        Args:
+            start (string): The url of the article to find the path from
+            goal (string): The url of the article to find the path to
+        Returns:
+            list: A list containing the path from the goal to the start, or None if no path is known
+        """
+        with self._lock:
+            if start not in self.ids or goal not in self.ids:
+                return None
+            start, goal = self.ids[start], self.ids[goal]
+            parents = array("i", [-1]) * len(self.urls)
+            parents[start] = start
+            queue = collections.deque([start])
+            while queue and parents[goal] < 0:
+                i = queue.popleft()
+                for j in self.neighbours(i) or ():
+                    if parents[j] < 0:
+                        parents[j] = i
+                        queue.append(j)
+            if parents[goal] < 0:
+                return None
+            path = [goal]
+            while path[-1] != start:
+                path.append(parents[path[-1]])
+            return [self.urls[i] for i in path]
+
+    def edges(self):
+        # Counts the known links
+        with self._lock:
+            saved = sum(self._offsets[i + 1] - self._offsets[i]
+                    for i in range(len(self._expanded)) if self._expanded[i] and i not in self._pending)
+            return saved + sum(len(links) for links in self._pending.values())
+
+    def __len__(self):
+        return len(self.urls)
+
+    def __getstate__(self):
+        # Copies the links into plain arrays, so the graph can be sent to another process.
+        # The copy has no file, so it never overwrites the saved graph
+        with self._lock:
+            offsets = array("q")
+            offsets.frombytes(memoryview(self._offsets).cast("B"))
+            targets = array("i")
+            targets.frombytes(memoryview(self._targets).cast("B"))
+            return {"urls": self.urls, "offsets": offsets, "targets": targets,
+                    "expanded": bytearray(self._expanded), "pending": self._pending}
+
+    def __setstate__(self, state):
+        self.path = None
+        self.urls = state["urls"]
+        self.ids = {url: i for i, url in enumerate(self.urls)}
+        self._offsets = state["offsets"]
+        self._targets = state["targets"]
+        self._expanded = state["expanded"]
+        self._pending = state["pending"]
+        self._map = None
+        self._lock = threading.RLock()
+
+    def save(self):
+        """
+        Merges the links added since the last save into the flat arrays, and writes the graph to its file.
+        The file holds a header with the array lengths, then the offsets, targets, expanded flags and urls.
+        """
+        with self._lock:
+            offsets = array("q", [0])
+            targets = array("i")
+            expanded = bytearray(len(self.urls))
+            for i in range(len(self.urls)):
+                links = self.neighbours(i)
+                if links is not None:
+                    targets.extend(links)
+                    expanded[i] = 1
+                offsets.append(len(targets))
+
+            self._close()
+            self._offsets, self._targets, self._expanded = offsets, targets, expanded
+            self._pending = {}
+            if not self.path:
+                return
+
+            urls = "\n".join(self.urls).encode("utf-8")
+            header = array("q", [len(self.urls), len(targets), len(urls), 0])
+            # Pad the targets so the sections after them stay aligned
+            padding = bytes(-len(targets) * targets.itemsize % 8)
+            # Write to a temporary file first, so a crash never leaves a half written graph
+            with open(self.path + ".tmp", "wb") as f:
+                f.write(header.tobytes())
+                f.write(offsets.tobytes())
+                f.write(targets.tobytes() + padding)
+                f.write(bytes(expanded))
+                f.write(urls)
+            os.replace(self.path + ".tmp", self.path)
+
+    def load(self):
+        """
+        Loads the graph from its file, memory-mapping the link arrays
+        """
+        with self._lock:
+            self._close()
+            with open(self.path, "rb") as f:
+                m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._map = m
+            view = memoryview(m)
+            count, edges, size, unused = view[:32].cast("q")
+            start = 32
+            self._offsets = view[start:start + (count + 1) * 8].cast("q")
+            start += (count + 1) * 8
+            self._targets = view[start:start + edges * 4].cast("i")
+            start += edges * 4 + (-edges * 4 % 8)
+            self._expanded = view[start:start + count]
+            start += count
+            self.urls = bytes(view[start:start + size]).decode("utf-8").split("\n") if count else []
+            self.ids = {url: i for i, url in enumerate(self.urls)}
+            self._pending = {}
+
+    def _close(self):
+        # Releases the memory map of the previously loaded file
+        self._offsets = self._targets = self._expanded = None
+        if self._map:
+            try:
+                self._map.close()
+            except BufferError:
+                # Arrays handed out by neighbours still use the map, it is closed when they are released
+                pass
+            self._map = None
+
+class CachedLinks:
+    """
+    Link function that reads the links of an article from a LinkGraph when they are known,
+    and stores them in it when they are fetched, see LinkGraph.cached
+    Properties:
+        graph: The LinkGraph to read and store links in
+        fetch: The wrapped function, which returns the list of article urls an article links to
+    """
+    def __init__(self, graph, fetch):
+        self.graph = graph
+        self.fetch = fetch
+
+    def __call__(self, url):
+        known = self.graph.links(url)
+        if known is not None:
+            return known
+        found = self.fetch(url)
+        self.graph.add(url, found)
+        return found
+
+class CachedAnchors(CachedLinks):
+    """
+    Link function that reads the links of an article from a LinkGraph when they are known, as (url, "", "") anchors,
+    and stores the urls of the anchors in it when they are fetched, see LinkGraph.cached_anchors
+    Properties:
+        graph: The LinkGraph to read and store links in
+        fetch: The wrapped function, which returns the (url, title, text) of the articles an article links to
+    """
+    def __call__(self, url):
+        known = self.graph.links(url)
+        if known is not None:
+            return [(link, "", "") for link in known]
+        found = self.fetch(url)
+        self.graph.add(url, [a[0] for a in found])
+        return found
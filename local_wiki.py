@@ -0,0 +1,154 @@
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import random
+import threading
+import time
+import zlib
+import requesting_urls
+from requesting_urls import Fetcher
+
+class LocalWiki:
+    """
+    Local HTTP stand-in for Wikipedia, serving pages from a dictionary on a free port.
+    Counts the TCP connections it accepts, to show whether clients reuse them.
+    Properties:
+        pages: Dictionary of {path: html} to serve. The html may also be given as UTF-8 bytes
+        url: The base URL of the server, e.g. http://127.0.0.1:12345
+        connections: The amount of accepted connections
+        requests: The amount of handled requests
+        latency: Seconds the server waits before answering each request
+        fail_every: Every n-th request is answered with 503 Service Unavailable. 0 never fails
+        bandwidth: Bytes per second to send the pages at. 0 sends them as fast as possible
+    """
+    def __init__(self, pages=None, latency=0, fail_every=0, bandwidth=0):
+        self.pages = pages or {}
+        self.latency = latency
+        self.fail_every = fail_every
+        self.bandwidth = bandwidth
+        self.connections = 0
+        self.requests = 0
+        self._lock = threading.Lock()
+        wiki = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            wbufsize = 1 << 16 # Send headers and body together
+
+            def setup(self):
+                super().setup()
+                with wiki._lock:
+                    wiki.connections += 1
+
+            def do_GET(self):
+                with wiki._lock:
+                    wiki.requests += 1
+                    fail = wiki.fail_every and wiki.requests % wiki.fail_every == 0
+                time.sleep(wiki.latency)
+                html = wiki.pages.get(self.path.split("?")[0])
+                if html is None or fail:
+                    self.send_response(503 if fail else 404)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                body = html if isinstance(html, bytes) else html.encode("utf-8")
+                etag = '"%x"' % zlib.crc32(body)
+                if self.headers.get("If-None-Match") == etag:
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=UTF-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("ETag", etag)
+                self.end_headers()
+                if not wiki.bandwidth:
+                    self.wfile.write(body)
+                    return
+                for i in range(0, len(body), 1 << 14):
+                    self.wfile.write(body[i:i + (1 << 14)])
+                    self.wfile.flush()
+                    time.sleep(min(len(body) - i, 1 << 14) / wiki.bandwidth)
+
+            def handle(self):
+                try:
+                    super().handle()
+                except ConnectionError:
+                    # The client closed the connection, e.g. after reading only part of a page
+                    pass
+
+            def finish(self):
+                try:
+                    super().finish()
+                except ConnectionError:
+                    pass
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.server.server_close()
+
+class LocalFetcher(Fetcher):
+    """
+    Fetcher that sends the requests for Wikipedia pages to a LocalWiki instead
+    """
+    def __init__(self, wiki, **kwargs):
+        super().__init__(**kwargs)
+        self.wiki = wiki
+
+    def request(self, url, params=None, headers=None, stream=False):
+        return super().request(url.replace("https://en.wikipedia.org", self.wiki.url), params, headers, stream)
+
+@contextmanager
+def use_fetcher(fetcher):
+    # Makes every call to get_html use the given fetcher
+    default = requesting_urls.default_fetcher
+    requesting_urls.default_fetcher = fetcher
+    try:
+        yield fetcher
+    finally:
+        requesting_urls.default_fetcher = default
+        fetcher.close()
+
+def synthetic_graph(size=300, fanout=10, seed=1):
+    """
+    Generates a random link graph of articles named Article_0 to Article_[size - 1]
+    Args:
+        [size] (int): The amount of articles
+        [fanout] (int): The amount of links in each article
+        [seed] (int): Seed for the random links
+    Returns:
+        dict: The article numbers each article links to, on the form {number: [numbers]}
+    """
+    rng = random.Random(seed)
+    return {i: rng.sample(range(size), fanout) for i in range(size)}
+
+def synthetic_wiki(size=300, fanout=10, seed=1, filler=0):
+    """
+    Generates Wikipedia-like pages for a synthetic link graph, see synthetic_graph
+    Args:
+        See synthetic_graph
+        [filler] (int): The amount of filler paragraphs in each article, to make them as long as real articles
+    Returns:
+        dict: The articles on the form {path: html}
+    """
+    text = "<p>Filler text about the history, people and places of a synthetic subject.</p>\n" * filler
+    pages = {}
+    for i, links in synthetic_graph(size, fanout, seed).items():
+        body = "".join(
+            f'<p>Article {i} is related to <a href="/wiki/Article_{j}" title="Article {j}">Article {j}</a>.</p>\n'
+            for j in links)
+        pages[f"/wiki/Article_{i}"] = (
+            f"<html><head><title>Article {i} - Wikipedia</title></head><body>\n"
+            f"<p><b>Article {i}</b> is a synthetic article.</p>\n{body}{text}</body></html>")
+    return pages
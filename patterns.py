@@ -0,0 +1,203 @@
+import re as stdlib_re
+import regex as re
+import time
+
+class Pattern:
+    """
+    Class to contain a regex that is compiled the first time it is used, and counts how it is used.
+    Has the same search methods as a compiled regex, so it can be used in place of one
+    Properties:
+        name: The name of the pattern in the registry
+        pattern: The regex string
+        flags: The regex flags
+        budget: The seconds the pattern may use in total before it is reported by over_budget, or None
+        engine: The module the regex is compiled with, "regex" or "re"
+        calls: The amount of times the pattern has been used
+        hits: The amount of matches found, or substitutions made
+        seconds: The time spent in the pattern. Only measured while timing is enabled
+    """
+    def __init__(self, name, pattern, flags=0, budget=None, engine="regex"):
+        """
+        Args:
+            name (string): The name of the pattern, like "dates.month"
+            pattern (string): The regex
+            [flags] (int): The regex flags
+            [budget] (float): The seconds the pattern may use in total
+            [engine] (string): The module to compile the regex with
+                "regex": The regex module (DEFAULT)
+                "re": The re module of the standard library. Faster at scanning long pages with simple patterns,
+                    but without the features of the regex module, like variable length lookbehinds
+        """
+        self.name = name
+        self.pattern = pattern
+        self.flags = flags
+        self.budget = budget
+        self.engine = engine
+        self.calls = 0
+        self.hits = 0
+        self.seconds = 0.0
+        self._regex = None
+
+    def __repr__(self):
+        return f"Pattern({self.name!r}, {self.pattern!r})"
+
+    @property
+    def compiled(self):
+        # The compiled regex. Using it directly skips the counters
+        return self._regex or self._compile()
+
+    def _compile(self):
+        # Compiling twice from two threads gives the same regex, so no lock is needed
+        self._regex = (stdlib_re if self.engine == "re" else re).compile(self.pattern, self.flags)
+        return self._regex
+
+    def _record(self, start, hits):
+        # Counts a use of the pattern, and times it if start is given
+        self.calls += 1
+        self.hits += hits
+        if start is not None:
+            seconds = time.perf_counter() - start
+            self.seconds += seconds
+            for hook in hooks:
+                hook(self, seconds)
+
+    def search(self, string, *args, **kwargs):
+        start = time.perf_counter() if timing else None
+        result = (self._regex or self._compile()).search(string, *args, **kwargs)
+        self._record(start, result is not None)
+        return result
+
+    def match(self, string, *args, **kwargs):
+        start = time.perf_counter() if timing else None
+        result = (self._regex or self._compile()).match(string, *args, **kwargs)
+        self._record(start, result is not None)
+        return result
+
+    def fullmatch(self, string, *args, **kwargs):
+        start = time.perf_counter() if timing else None
+        result = (self._regex or self._compile()).fullmatch(string, *args, **kwargs)
+        self._record(start, result is not None)
+        return result
+
+    def findall(self, string, *args, **kwargs):
+        start = time.perf_counter() if timing else None
+        result = (self._regex or self._compile()).findall(string, *args, **kwargs)
+        self._record(start, len(result))
+        return result
+
+    def sub(self, repl, string, *args, **kwargs):
+        start = time.perf_counter() if timing else None
+        result, count = (self._regex or self._compile()).subn(repl, string, *args, **kwargs)
+        self._record(start, count)
+        return result
+
+    def split(self, string, *args, **kwargs):
+        start = time.perf_counter() if timing else None
+        result = (self._regex or self._compile()).split(string, *args, **kwargs)
+        self._record(start, len(result) - 1)
+        return result
+
+    def finditer(self, string, *args, **kwargs):
+        # The matches are found while iterating, so the time is measured for each step
+        iterator = (self._regex or self._compile()).finditer(string, *args, **kwargs)
+        hits = 0
+        try:
+            while True:
+                start = time.perf_counter() if timing else None
+                match = next(iterator, None)
+                if start is not None:
+                    self.seconds += time.perf_counter() - start
+                if match is None:
+                    break
+                hits += 1
+                yield match
+        finally:
+            # Counted once the iteration ends, also when it is stopped early
+            self.calls += 1
+            self.hits += hits
+
+    def stats(self):
+        """
+        Gets the counters of the pattern
+        Returns:
+            dict: The name, pattern, calls, hits, seconds and budget of the pattern
+        """
+        return {"name": self.name, "pattern": self.pattern, "calls": self.calls, "hits": self.hits,
+                "seconds": self.seconds, "budget": self.budget}
+
+# Every registered pattern, on the form {name: Pattern}
+registry = {}
+
+# Functions called with (pattern, seconds) after each timed use of a pattern
+hooks = []
+
+# If the time spent in the patterns is measured. Off by default, as it costs two clock reads per use
+timing = False
+
+def register(name, pattern, flags=0, budget=None, engine="regex"):
+    """
+    Adds a pattern to the registry. The regex is not compiled until it is first used,
+    so modules can register their patterns at import without slowing the import down
+    Args:
+        name (string): The name of the pattern, like "dates.month"
+        pattern (string): The regex
+        [flags] (int): The regex flags
+        [budget] (float): The seconds the pattern may use in total, see over_budget
+        [engine] (string): The module to compile the regex with, see Pattern
+    Returns:
+        Pattern: The registered pattern. The existing one if the same pattern was registered before
+    """
+    existing = registry.get(name)
+    if existing:
+        if (existing.pattern, existing.flags, existing.engine) != (pattern, flags, engine):
+            raise ValueError(f"Pattern {name} is already registered with a different regex")
+        return existing
+    registry[name] = Pattern(name, pattern, flags, budget, engine)
+    return registry[name]
+
+def get(name):
+    """
+    Finds a registered pattern
+    Args:
+        name (string): The name of the pattern
+    Returns:
+        Pattern: The pattern. Raises KeyError if no pattern has the name
+    """
+    return registry[name]
+
+def compile_all():
+    # Compiles every registered pattern now, for example before timing a run or forking worker processes
+    for pattern in registry.values():
+        pattern.compiled
+
+def enable_timing(enabled=True):
+    """
+    Turns measuring the time spent in each pattern on or off
+    Args:
+        [enabled] (bool): If the time should be measured
+    """
+    global timing
+    timing = enabled
+
+def reset():
+    # Sets the counters of every pattern to zero
+    for pattern in registry.values():
+        pattern.calls = pattern.hits = 0
+        pattern.seconds = 0.0
+
+def stats():
+    """
+    Gets the counters of every pattern, to see which patterns a run spends its time in.
+    The counters are not locked, so they may miss a few uses when patterns are used by several threads at once
+    Returns:
+        list: A dictionary of counters for each pattern, see Pattern.stats, with the slowest first
+    """
+    return sorted((pattern.stats() for pattern in registry.values()), key=lambda s: (-s["seconds"], -s["calls"]))
+
+def over_budget():
+    """
+    Finds the patterns that have used more time than their budget
+    Returns:
+        list: The counters of the patterns over budget, see Pattern.stats
+    """
+    return [s for s in stats() if s["budget"] is not None and s["seconds"] > s["budget"]]
@@ -1,22 +1,724 @@
+import codecs
+import functools
+import hashlib
+import json
+import os
+import queue
+import random
+import threading
+import time
+import zlib
+from email.utils import parsedate_to_datetime
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
 import requests as req
+import instrument
 
-def get_html(url, params=None, output=None):
+class CacheMiss(Exception):
+    """
+    Raised when a page is requested in offline mode and it is not in the cache
+    """
+
+class Page:
+    """
+    Class to contain a fetched page
+    Properties:
+        url: The final URL of the page, after redirects
+        text: The decoded HTML of the page
+        status: The HTTP status code
+        etag: The ETag header of the response, if any
+        last_modified: The Last-Modified header of the response, if any
+        from_cache: True if the page was served from the cache
+    """
+    def __init__(self, url, text, status=200, etag=None, last_modified=None, from_cache=False):
+        self.url = url
+        self.text = text
+        self.status = status
+        self.etag = etag
+        self.last_modified = last_modified
+        self.from_cache = from_cache
+
+def normalize_url(url, params=None):
+    """
+    Normalizes a URL and its parameters, so equal requests get equal cache keys
+    Args:
+        url (string): The URL to normalize
+        [params] (dict): Parameters to apply to the request
+    Returns:
+        string: The URL with a lowercase scheme and host, no fragment, no default port and sorted parameters
+    """
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    host = parts.netloc.lower()
+    if (scheme, host[-3:]) == ("http", ":80") or (scheme, host[-4:]) == ("https", ":443"):
+        host = host[:host.rindex(":")]
+    query = parse_qsl(parts.query, keep_blank_values=True)
+    if params:
+        query += [(str(k), str(v)) for k, v in params.items() if v is not None]
+    return urlunsplit((scheme, host, parts.path or "/", urlencode(sorted(query)), ""))
+
+class PageCache:
+    """
+    On-disk page cache keyed by the normalized URL and parameters.
+    Each page is stored compressed in its own file together with its ETag/Last-Modified metadata.
+    The file modification time is used as the access time, and the least recently used pages are
+    evicted when the total size grows past the cap.
+    """
+    def __init__(self, directory=".page_cache", max_size=512 * 2**20, max_age=24 * 60 * 60, low_water=0.9):
+        """
+        Args:
+            [directory] (string): The directory to store pages in
+            [max_size] (int): The maximum total size of the cache in bytes
+            [max_age] (float): Seconds before a cached page is stale and fetched again. None never goes stale
+            [low_water] (float): The part of max_size that eviction brings the cache down to,
+                so a full cache is not walked again on every put
+        """
+        self.directory = directory
+        self.max_size = max_size
+        self.low_water = low_water
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._size = None
+
+    def path(self, key):
+        # Returns the file path of a cache key
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, digest[:2], digest + ".page")
+
+    def get(self, key):
+        """
+        Reads a page from the cache, and marks it as recently used
+        Args:
+            key (string): The normalized URL of the page
+        Returns:
+            tuple: (Page, stored_time), or None if the page is not cached
+        """
+        path = self.path(key)
+        try:
+            with open(path, "rb") as f:
+                header = json.loads(f.readline())
+                body = zlib.decompress(f.read()).decode("utf-8")
+            os.utime(path)
+        except (OSError, ValueError, zlib.error):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        page = Page(header["url"], body, 200, header.get("etag"), header.get("last_modified"), True)
+        return page, header["stored"]
+
+    def is_stale(self, stored):
+        # Checks if a page stored at the given time has gone stale
+        return self.max_age is not None and time.time() - stored > self.max_age
+
+    def put(self, key, page):
+        """
+        Writes a page to the cache, and evicts old pages if the cache is full
+        Args:
+            key (string): The normalized URL of the page
+            page (Page): The page to store
+        """
+        writer = self.writer(key, page.url, page.etag, page.last_modified)
+        writer.write(page.text)
+        writer.commit()
+
+    def writer(self, key, url, etag=None, last_modified=None):
+        """
+        Starts writing a page to the cache piece by piece, like while it is downloaded
+        Args:
+            key (string): The normalized URL of the page
+            url (string): The final URL of the page, after redirects
+            [etag] (string): The ETag header of the response
+            [last_modified] (string): The Last-Modified header of the response
+        Returns:
+            PageWriter: The writer. The page is only stored once it is committed
+        """
+        header = {
+            "key": key,
+            "url": url,
+            "etag": etag,
+            "last_modified": last_modified,
+            "stored": time.time()
+        }
+        return PageWriter(self, self.path(key), header)
+
+    def _stored(self, tmp, path, size):
+        # Moves a written page into place, and evicts old pages if the cache is full
+        with self._lock:
+            # Count the cache before the page is in it, so the first count does not include the page twice
+            total = self.size()
+            old = os.path.getsize(path) if os.path.exists(path) else 0
+            os.replace(tmp, path)
+            self._size = total + size - old
+            if self._size > self.max_size:
+                self.evict()
+
+    def refresh(self, key, etag=None, last_modified=None):
+        """
+        Marks a cached page as freshly stored, without recompressing it
+        Args:
+            key (string): The normalized URL of the page
+            [etag] (string): New ETag of the page
+            [last_modified] (string): New Last-Modified of the page
+        """
+        path = self.path(key)
+        try:
+            with open(path, "rb") as f:
+                header = json.loads(f.readline())
+                body = f.read()
+        except (OSError, ValueError):
+            return
+        header["etag"] = etag or header.get("etag")
+        header["last_modified"] = last_modified or header.get("last_modified")
+        header["stored"] = time.time()
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(json.dumps(header).encode("utf-8") + b"\n" + body)
+        os.replace(tmp, path)
+
+    def entries(self):
+        # Returns a list of (access_time, size, path) for each cached page
+        entries = []
+        for root, dirs, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith(".page"):
+                    stat = os.stat(os.path.join(root, name))
+                    entries.append((stat.st_mtime, stat.st_size, os.path.join(root, name)))
+        return entries
+
+    def size(self):
+        # Returns the total size of the cached pages in bytes
+        if self._size is None:
+            self._size = sum(e[1] for e in self.entries())
+        return self._size
+
+    def evict(self):
+        # Removes the least recently used pages until the cache is below the low water mark of its size cap
+        entries = sorted(self.entries())
+        self._size = sum(e[1] for e in entries)
+        for accessed, size, path in entries:
+            if self._size <= self.max_size * self.low_water:
+                break
+            try:
+                os.remove(path)
+                self._size -= size
+            except OSError:
+                pass
+
+    def clear(self):
+        # Removes every page from the cache
+        with self._lock:
+            for accessed, size, path in self.entries():
+                os.remove(path)
+            self._size = 0
+
+class PageWriter:
+    """
+    Writes a page to a PageCache, compressing each piece as it is written,
+    so a page that is being downloaded never has to be held in memory in full.
+    The page is written to a temporary file, so readers never see half a page
+    """
+    def __init__(self, cache, path, header):
+        """
+        Args:
+            cache (PageCache): The cache to store the page in
+            path (string): The file of the page in the cache
+            header (dict): The metadata of the page
+        """
+        self.cache = cache
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        self._file = open(self._tmp, "wb")
+        self._file.write(json.dumps(header).encode("utf-8") + b"\n")
+        self._compressor = zlib.compressobj()
+
+    def write(self, text):
+        # Adds a piece of the page
+        self._file.write(self._compressor.compress(text.encode("utf-8")))
+
+    def commit(self):
+        # Stores the written page in the cache
+        self._file.write(self._compressor.flush())
+        size = self._file.tell()
+        self._file.close()
+        self.cache._stored(self._tmp, self.path, size)
+
+    def abort(self):
+        # Drops the written page, like when the download failed
+        self._file.close()
+        try:
+            os.remove(self._tmp)
+        except OSError:
+            pass
+
+class TokenBucket:
+    """
+    Thread-safe token bucket, allowing requests at a steady rate with short bursts.
+    The bucket can also be paused, to make every thread back off from a host.
+    """
+    def __init__(self, rate, burst=None):
+        """
+        Args:
+            rate (float): The amount of tokens added per second
+            [burst] (int): The maximum amount of tokens the bucket holds. Defaults to the rate
+        """
+        self.rate = rate
+        self.burst = burst or max(rate, 1)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._paused_until = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        # Takes a token from the bucket, waiting until one is available and the bucket is not paused
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if now >= self._paused_until and self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = max(self._paused_until - now, (1 - self._tokens) / self.rate)
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        # Stops handing out tokens for the given amount of seconds
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = 0
+
+class SharedBuckets:
+    """
+    The token buckets of every host of a Fetcher, kept in one place so several processes can share them
+    through a multiprocessing manager, see Fetcher.limits. The rate limits then hold for all processes together,
+    instead of for each process on its own
+    Properties:
+        rate: The amount of requests per second to each host
+        burst: The amount of requests that may be sent at once before the rate applies
+    """
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, host):
+        # Returns the bucket of a host, creating it on first use
+        with self._lock:
+            if host not in self._buckets:
+                self._buckets[host] = TokenBucket(self.rate, self.burst)
+            return self._buckets[host]
+
+    def acquire(self, host):
+        # Takes a token from the bucket of a host, see TokenBucket.acquire
+        self.bucket(host).acquire()
+
+    def pause(self, host, seconds):
+        # Pauses the bucket of a host, see TokenBucket.pause
+        self.bucket(host).pause(seconds)
+
+class HostBucket:
+    # The bucket of one host in a SharedBuckets, used by a HostPool in place of its own TokenBucket
+    def __init__(self, buckets, host):
+        self.buckets = buckets
+        self.host = host
+
+    def acquire(self):
+        self.buckets.acquire(self.host)
+
+    def pause(self, seconds):
+        self.buckets.pause(self.host, seconds)
+
+def retry_after(resp):
+    """
+    Reads the Retry-After header of a response
+    Args:
+        resp (Response): The response
+    Returns:
+        float: The seconds to wait before retrying, or None if the header is missing or invalid
+    """
+    value = resp.headers.get("Retry-After")
+    if not value:
+        return None
+    if value.strip().isdigit():
+        return float(value)
+    try:
+        return max(0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+class HostPool:
+    """
+    Bounded pool of keep-alive sessions for a single host
+    Properties:
+        size: The maximum amount of sessions for the host
+        created: The amount of sessions created so far
+        requests: The amount of requests sent through the pool
+        reused: The amount of requests that were sent on a previously used session
+        retries: The amount of requests that were retried after a failure
+        bucket: The TokenBucket limiting the request rate to the host, or None if there is no limit
+    """
+    def __init__(self, size, rate=None, burst=None):
+        self.size = size
+        self.created = 0
+        self.requests = 0
+        self.reused = 0
+        self.retries = 0
+        self.bucket = TokenBucket(rate, burst) if rate else None
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        # Returns an idle session, creates a new one if the pool is not full, or waits for one to be released
+        try:
+            session = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                create = self.created < self.size
+                if create:
+                    self.created += 1
+            session = new_session() if create else self._idle.get()
+        with self._lock:
+            self.requests += 1
+            if session.used:
+                self.reused += 1
+        session.used = True
+        return session
+
+    def retried(self):
+        # Counts a retried request
+        with self._lock:
+            self.retries += 1
+
+    def release(self, session):
+        # Puts a session back into the pool
+        self._idle.put(session)
+
+    def close(self):
+        # Closes all idle sessions
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+    def stats(self):
+        return {
+            "pool_size": self.size,
+            "sessions": self.created,
+            "requests": self.requests,
+            "reused": self.reused,
+            "retries": self.retries
+        }
+
+def new_session():
+    """
+    Creates a session that keeps a single persistent connection to a host
+    Returns:
+        Session: The new requests session
+    """
+    session = req.Session()
+    adapter = req.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=1)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.used = False
+    return session
+
+class Fetcher:
+    """
+    Fetches URLs through persistent sessions, to avoid a new TCP+TLS handshake for every request.
+    Each host gets its own bounded pool of sessions. Safe to share between threads.
+    Pages are served from the cache when possible. Stale pages are revalidated with a conditional request,
+    and the bytes that a 304 Not Modified response saved are counted.
+    In offline mode, pages that are not cached raise CacheMiss.
+    Requests to each host are limited by a token bucket shared by every thread. Responses with
+    status 429 or 5xx and failed connections are retried with exponential backoff and jitter,
+    or after the time given by the Retry-After header, and every thread backs off from the host meanwhile.
+    Properties:
+        revalidated: The amount of stale pages that the server reported as not modified
+        bytes_saved: The amount of page bytes that did not have to be downloaded again
+        limits: SharedBuckets to take the rate limits from instead of the fetcher's own buckets, or None.
+            Set it before the first request, to share the rate limits with fetchers in other processes
+    """
+    def __init__(self, pool_size=4, timeout=30, cache=None, offline=False, rate=None, burst=None,
+            retries=5, backoff=0.5, max_backoff=60):
+        """
+        Args:
+            [pool_size] (int): The maximum amount of sessions for each host
+            [timeout] (float): Seconds to wait for a server before giving up
+            [cache] (PageCache): Cache to serve and store pages in
+            [offline] (bool): Only serve pages from the cache
+            [rate] (float): The maximum amount of requests per second to each host. None has no limit
+            [burst] (int): The amount of requests that may be sent at once before the rate applies
+            [retries] (int): How many times a failed request is retried before giving up
+            [backoff] (float): Seconds to wait before the first retry, doubled for every retry
+            [max_backoff] (float): The maximum seconds to wait before a retry
+        """
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.rate = rate
+        self.burst = burst
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.cache = cache
+        self.offline = offline
+        self.revalidated = 0
+        self.bytes_saved = 0
+        self.limits = None
+        self._pools = {}
+        self._lock = threading.Lock()
+
+    def pool(self, host):
+        # Returns the session pool for a host, creating it on first use
+        with self._lock:
+            if host not in self._pools:
+                pool = self._pools[host] = HostPool(self.pool_size, self.rate, self.burst)
+                if self.rate and self.limits is not None:
+                    pool.bucket = HostBucket(self.limits, host)
+            return self._pools[host]
+
+    def fetch(self, url, params=None):
+        """
+        Gets a page from the cache, or sends a GET request on a pooled session
+        Args:
+            url (string): The URL to request
+            [params] (dict): Parameters to apply to the request
+        Returns:
+            Page: The fetched page
+        """
+        key = normalize_url(url, params)
+        cached = self.cache.get(key) if self.cache else None
+        if cached and (self.offline or not self.cache.is_stale(cached[1])):
+            instrument.count("fetch.cache_hits")
+            return cached[0]
+        if self.offline:
+            raise CacheMiss(key)
+
+        headers = None
+        if cached:
+            # Ask the server to only send the page if it has changed since it was cached
+            page = cached[0]
+            headers = {}
+            if page.etag:
+                headers["If-None-Match"] = page.etag
+            if page.last_modified:
+                headers["If-Modified-Since"] = page.last_modified
+
+        resp = self.request(url, params, headers)
+        if cached and resp.status_code == 304:
+            # Not modified, keep the cached page and mark it as fresh again
+            page.etag = resp.headers.get("ETag", page.etag)
+            page.last_modified = resp.headers.get("Last-Modified", page.last_modified)
+            self.cache.refresh(key, page.etag, page.last_modified)
+            with self._lock:
+                self.revalidated += 1
+                self.bytes_saved += len(page.text.encode("utf-8"))
+            return page
+
+        page = Page(resp.url, resp.text, resp.status_code,
+                resp.headers.get("ETag"), resp.headers.get("Last-Modified"))
+        instrument.count("fetch.bytes", len(resp.content))
+        # Only store successful responses
+        if self.cache and resp.status_code == 200:
+            self.cache.put(key, page)
+        return page
+
+    def stream(self, url, params=None, chunk_size=1 << 14):
+        """
+        Gets a page as decoded chunks of text, while it is downloaded. Only one chunk is held back at a time.
+        Without a cache, closing the generator early stops the download. With a cache, the page is
+        compressed into the cache chunk by chunk, and closing the generator early still reads the rest
+        of the page into the cache without handing it out, so the page never has to be fetched again.
+        Cached pages are served in chunks as well
+        Args:
+            url (string): The URL to request
+            [params] (dict): Parameters to apply to the request
+            [chunk_size] (int): The amount of bytes to read at a time
+        Returns:
+            generator: The chunks of text of the page
+        """
+        key = normalize_url(url, params)
+        cached = self.cache.get(key) if self.cache else None
+        if cached or self.offline:
+            if cached and (self.offline or not self.cache.is_stale(cached[1])):
+                text = cached[0].text
+            else:
+                # A stale page is revalidated, which mostly ends in a 304 without a body to stream
+                text = self.fetch(url, params).text
+            for i in range(0, len(text), chunk_size):
+                yield text[i:i + chunk_size]
+            return
+
+        resp = self.request(url, params, stream=True)
+        decoder = codecs.getincrementaldecoder(resp.encoding or "utf-8")(errors="replace")
+        received = 0
+
+        def texts():
+            nonlocal received
+            for data in resp.iter_content(chunk_size):
+                received += len(data)
+                text = decoder.decode(data)
+                if text:
+                    yield text
+            text = decoder.decode(b"", True)
+            if text:
+                yield text
+
+        # Only store successful responses
+        writer = None
+        if self.cache and resp.status_code == 200:
+            writer = self.cache.writer(key, resp.url, resp.headers.get("ETag"), resp.headers.get("Last-Modified"))
+        pieces = texts()
+        complete = False
+        try:
+            try:
+                for text in pieces:
+                    if writer:
+                        writer.write(text)
+                    yield text
+                complete = True
+            except GeneratorExit:
+                if writer:
+                    # The caller stopped early, so read the rest of the page for the cache without handing it out
+                    try:
+                        for text in pieces:
+                            writer.write(text)
+                        complete = True
+                    except (req.RequestException, OSError):
+                        pass
+                raise
+        finally:
+            # Also runs when the generator is closed early, which drops the rest of the body if it is not cached
+            if writer and complete:
+                writer.commit()
+            elif writer:
+                writer.abort()
+            close_response(resp)
+            instrument.count("fetch.bytes", received)
+
+    def request(self, url, params=None, headers=None, stream=False):
+        """
+        Sends a GET request on a pooled session, within the rate limit of the host.
+        Retries with backoff when the server is busy or the connection fails.
+        Args:
+            url (string): The URL to request
+            [params] (dict): Parameters to apply to the request
+            [headers] (dict): Headers to send with the request
+            [stream] (bool): Only read the headers, and leave the body to be read from the response.
+                The session stays taken from the pool until the response is closed with close_response
+        Returns:
+            Response: The response of the request. The last response if every retry failed
+        """
+        pool = self.pool(urlsplit(url).netloc)
+        for attempt in range(self.retries + 1):
+            if pool.bucket:
+                pool.bucket.acquire()
+            session = pool.acquire()
+            instrument.count("fetch.requests")
+            resp = None
+            try:
+                # The time until the headers arrive, streamed bodies are read later
+                with instrument.span("fetch.request", url=url, attempt=attempt):
+                    resp = session.get(url, params=params, headers=headers, timeout=self.timeout, stream=stream)
+            except (req.ConnectionError, req.Timeout):
+                if attempt == self.retries:
+                    raise
+            finally:
+                if stream and resp is not None:
+                    # The body is still read over the connection of the session, so it is released with the response
+                    resp.release_session = functools.partial(pool.release, session)
+                else:
+                    pool.release(session)
+
+            if resp is not None and resp.status_code != 429 and resp.status_code < 500:
+                return resp
+            if attempt == self.retries:
+                return resp
+            if resp is not None:
+                # Hand the connection of a streamed response back before trying again
+                close_response(resp)
+
+            # Wait as long as the server asks, or back off exponentially with full jitter
+            delay = retry_after(resp) if resp is not None else None
+            if delay is None:
+                delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+            pool.retried()
+            instrument.count("fetch.retries")
+            if pool.bucket:
+                # Make every thread back off from the host, not just this one
+                pool.bucket.pause(delay)
+            else:
+                time.sleep(delay)
+
+    def stats(self):
+        """
+        Gets the pool size and reuse counters of every host
+        Returns:
+            dict: Counters for each host, on the form {host: {pool_size, sessions, requests, reused}}
+        """
+        with self._lock:
+            return {host: pool.stats() for host, pool in self._pools.items()}
+
+    def close(self):
+        # Closes all pooled sessions
+        with self._lock:
+            for pool in self._pools.values():
+                pool.close()
+            self._pools = {}
+
+def close_response(resp):
+    """
+    Closes a response, and puts the session of a streamed response back into its pool, see Fetcher.request.
+    Closing a response more than once does nothing
+    Args:
+        resp (Response): The response to close
+    """
+    resp.close()
+    release = getattr(resp, "release_session", None)
+    if release:
+        resp.release_session = None
+        release()
+
+# Fetcher, cache and rate limits shared by every call to get_html
+default_fetcher = Fetcher(cache=PageCache(), rate=20)
+
+def get_html(url, params=None, output=None, fetcher=None):
     """
     Requests the HTML of a website. Can also write the HTML to a file.
     Args:
         url (string): The URL of the website to get
         [params] (dict): Parameters to apply to the request
         [output] (string): The output file to optionally write the HTML to
+        [fetcher] (Fetcher): The fetcher to send the request through. Uses the shared fetcher by default
     Returns:
         String: The HTML contents of the given website
     """
-    resp = req.get(url, params=params)
+    resp = (fetcher or default_fetcher).fetch(url, params)
 
     if output:
         write_to_file(output, resp)
-        
+
     return resp.text
 
+def stream_html(url, params=None, chunk_size=1 << 14, fetcher=None):
+    """
+    Requests the HTML of a website, and yields it in decoded chunks as it is downloaded.
+    Stop iterating, or close the generator, to stop the download early.
+    Args:
+        url (string): The URL of the website to get
+        [params] (dict): Parameters to apply to the request
+        [chunk_size] (int): The amount of bytes to read at a time
+        [fetcher] (Fetcher): The fetcher to send the request through. Uses the shared fetcher by default
+    Returns:
+        generator: The chunks of the HTML of the given website
+    """
+    return (fetcher or default_fetcher).stream(url, params, chunk_size)
+
 def write_to_file(output, resp):
     file = open(output, "w")
     file.write(f"{resp.url}\n\n")
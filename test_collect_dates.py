@@ -0,0 +1,23 @@
+import json
+from benchmark import saved_pages
+from collect_dates import find_corpus_dates, find_dates
+
+def test_corpus_dates(tmp_path):
+    pages = list(saved_pages().values())
+    files = []
+    for i, html in enumerate(pages):
+        files.append(str(tmp_path / f"page_{i}.html"))
+        with open(files[-1], "w", encoding="utf-8") as f:
+            f.write(html)
+    files.append(str(tmp_path / "missing.html"))
+    output = str(tmp_path / "dates.jsonl")
+    # More processes than cores are used as one per core, or the threads when there is a single core
+    for processes in (1, 64):
+        summary = find_corpus_dates(files, output, processes, threads=2)
+        with open(output) as f:
+            results = {r["source"]: r for r in map(json.loads, f)}
+        assert summary["pages"] == len(files) and summary["errors"] == 1
+        assert "error" in results[files[-1]]
+        for file, html in zip(files, pages):
+            assert results[file]["dates"] == find_dates(html)
+        assert summary["dates"] == sum(len(find_dates(html)) for html in pages)
@@ -0,0 +1,36 @@
+import fetch_player_statistics as ps
+
+def stats_page(header, rows):
+    # A player's page with a regular season stats table of the given header and rows
+    head = "".join(f"<th>{name}</th>" for name in header)
+    body = "".join("<tr>" + "".join(f"<td>{cell}</td>" for cell in row) + "</tr>\n" for row in rows)
+    return (f'<html><body><h3><span id="Regular_season">Regular season</span></h3>\n'
+            f"<table><tbody><tr>{head}</tr>\n{body}</tbody></table></body></html>")
+
+season = ["2019–20", "Team", "60", "60", "35.1", ".480", ".350", ".800", "7.5", "5.1", "1.2", "0.9", "25.3"]
+
+def test_stats_by_header():
+    # Columns are found by name, also when the table has them in another order
+    header = ps.stat_headers[:8] + ["PPG", "APG", "SPG", "BPG", "RPG"]
+    row = season[:8] + ["25.3", "5.1", "1.2", "0.9", "7.5"]
+    assert ps.parse_player_stats(stats_page(header, [row])) == (25.3, 0.9, 7.5)
+
+def test_stats_with_other_headers():
+    # Columns not named like stat_headers are found by their position
+    header = ps.stat_headers[:12] + ["PTS"]
+    assert ps.parse_player_stats(stats_page(header, [season])) == (25.3, 0.9, 7.5)
+    # Columns that are missing give 0
+    assert ps.parse_player_stats(stats_page(ps.stat_headers[:9], [season[:9]])) == (0.0, 0.0, 7.5)
+
+def test_stats_without_season():
+    assert ps.parse_player_stats(stats_page(ps.stat_headers, [["2018–19"] + season[1:]])) is None
+
+def test_player_table_top():
+    table = ps.PlayerTable(2)
+    for i, (team, ppg) in enumerate([("A", 10), ("B", 20), ("A", 30), ("A", 10), ("B", 5)]):
+        table.append(f"Player {i}", team, f"/wiki/Player_{i}", ppg)
+    assert table.top(2).tolist() == [2, 0, 1, 4]
+    assert table.top(1).tolist() == [2, 1]
+    assert table.top(0).tolist() == []
+    assert table.top(-1).tolist() == []
+    assert len(table.take(table.top(0))) == 0
@@ -0,0 +1,30 @@
+import pytest
+from benchmark import saved_pages
+from filter_urls import LinkExtractor, extract_links
+
+pages = saved_pages()
+
+def feed(html, url, size, anchors):
+    extractor = LinkExtractor(url, anchors=anchors)
+    links = []
+    for i in range(0, len(html), size):
+        links += extractor.feed(html[i:i + size])
+    return links + extractor.close()
+
+@pytest.mark.parametrize("anchors", [False, True])
+@pytest.mark.parametrize("size", [5, 97, 16384])
+def test_chunks_give_the_same_links(size, anchors):
+    # Tags and links cut off at the end of a chunk are found once the next chunk arrives
+    for url, html in pages.items():
+        assert feed(html, url, size, anchors) == extract_links(html, url, anchors)
+
+def test_link_kinds():
+    html = ('<a href="/wiki/Star_Wars">a</a><a class="x" href="/wiki/Star_Wars#Plot">b</a><a href="#cite_note-1">c</a>'
+            '<a\nhref=/wiki/File%3AX.png>d</a><a data-href="/wiki/Hidden" href="https://example.com/">e</a>'
+            '<A HREF="x">f</A><a href="https://en.wikipedia.org/wiki/Main_Page?action=edit">g</a>')
+    assert extract_links(html, "https://en.wikipedia.org/wiki/Page") == [
+        ("https://en.wikipedia.org/wiki/Star_Wars", "article"),
+        ("https://en.wikipedia.org/wiki/File%3AX.png", "namespace"),
+        ("https://example.com/", "other"),
+        ("https://en.wikipedia.org/wiki/Main_Page?action=edit", "other"),
+    ]
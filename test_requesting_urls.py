@@ -0,0 +1,112 @@
+import concurrent.futures
+import tracemalloc
+from requesting_urls import Fetcher, Page, PageCache, get_html, normalize_url, stream_html
+from local_wiki import LocalWiki
+
+pages = {f"/wiki/Page_{i}": f"<html><body>{'Page text. ' * 20000}{i}</body></html>" for i in range(32)}
+
+def test_fetch_reuses_connections():
+    with LocalWiki(pages) as wiki:
+        fetcher = Fetcher(pool_size=2, cache=None)
+        with concurrent.futures.ThreadPoolExecutor(8) as executor:
+            htmls = list(executor.map(lambda i: get_html(f"{wiki.url}/wiki/Page_{i}", fetcher=fetcher), range(32)))
+        stats = fetcher.stats()[wiki.url[7:]]
+        fetcher.close()
+    assert htmls == list(pages.values())
+    # Every request is sent on one of the two pooled connections
+    assert wiki.connections <= 2
+    assert stats["sessions"] == 2
+    assert stats["reused"] == 30
+
+def test_stream_reuses_connections():
+    with LocalWiki(pages, bandwidth=8 * 2**20) as wiki:
+        fetcher = Fetcher(pool_size=2, cache=None)
+
+        def stream(i):
+            return "".join(stream_html(f"{wiki.url}/wiki/Page_{i}", fetcher=fetcher, chunk_size=4096))
+
+        with concurrent.futures.ThreadPoolExecutor(8) as executor:
+            htmls = list(executor.map(stream, range(32)))
+        stats = fetcher.stats()[wiki.url[7:]]
+        fetcher.close()
+    assert htmls == list(pages.values())
+    # A session is only handed to another stream once the body of the last one is read
+    assert wiki.connections <= 2
+    assert stats["sessions"] == 2
+    assert stats["reused"] == 30
+
+def test_stream_closed_early_releases_session():
+    with LocalWiki(pages) as wiki:
+        fetcher = Fetcher(pool_size=1, cache=None)
+        for i in range(3):
+            chunks = stream_html(f"{wiki.url}/wiki/Page_{i}", fetcher=fetcher, chunk_size=4096)
+            next(chunks)
+            chunks.close()
+        stats = fetcher.stats()[wiki.url[7:]]
+        fetcher.close()
+    assert stats["sessions"] == 1
+    assert stats["requests"] == 3
+
+def test_stream_closed_early_is_cached(tmp_path):
+    with LocalWiki(pages) as wiki:
+        fetcher = Fetcher(cache=PageCache(str(tmp_path)))
+        url = f"{wiki.url}/wiki/Page_0"
+        chunks = stream_html(url, fetcher=fetcher, chunk_size=4096)
+        assert next(chunks)
+        chunks.close()
+        requests = wiki.requests
+        # The rest of the page was read into the cache, so it is not fetched again
+        assert "".join(stream_html(url, fetcher=fetcher)) == pages["/wiki/Page_0"]
+        assert get_html(url, fetcher=fetcher) == pages["/wiki/Page_0"]
+        assert wiki.requests == requests
+        fetcher.close()
+
+def test_stream_to_cache_holds_one_chunk(tmp_path):
+    html = "<html><body>" + "".join(f"<p>Paragraph {i}</p>" for i in range(400000)) + "</body></html>"
+    with LocalWiki({"/wiki/Long": html.encode("utf-8")}) as wiki:
+        fetcher = Fetcher(cache=PageCache(str(tmp_path)))
+        tracemalloc.start()
+        try:
+            size = sum(len(chunk) for chunk in stream_html(f"{wiki.url}/wiki/Long", fetcher=fetcher))
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        fetcher.close()
+    assert size == len(html)
+    # The page is compressed into the cache as it arrives, instead of being collected in memory
+    assert peak < len(html) / 4
+    assert PageCache(str(tmp_path)).get(normalize_url(f"{wiki.url}/wiki/Long"))[0].text == html
+
+def cache_size(directory):
+    return sum(size for accessed, size, path in PageCache(directory).entries())
+
+def test_cache_size(tmp_path):
+    directory = str(tmp_path)
+    PageCache(directory).put("a", Page("a", "First page " * 1000))
+    # A new cache counts the pages already on disk once
+    cache = PageCache(directory)
+    cache.put("b", Page("b", "Second page " * 1000))
+    assert cache.size() == cache_size(directory)
+    cache.put("b", Page("b", "Replaced page " * 10))
+    assert cache.size() == cache_size(directory)
+
+def test_cache_evicts_to_low_water(tmp_path):
+    directory = str(tmp_path)
+    texts = [f"Page {i} " + "".join(f"{i * j:x}" for j in range(2000)) for i in range(20)]
+    cache = PageCache(directory, max_size=2 * 10**4, low_water=0.5)
+    walks = 0
+    entries = cache.entries
+
+    def counted():
+        nonlocal walks
+        walks += 1
+        return entries()
+    cache.entries = counted
+    for i, text in enumerate(texts):
+        cache.put(str(i), Page(str(i), text))
+    walked = walks
+    assert len(cache.entries()) < len(texts)
+    assert cache_size(directory) <= 2 * 10**4
+    assert cache.size() == cache_size(directory)
+    # Every eviction frees half the cache, so most puts on the full cache do not walk it
+    assert 0 < walked < len(texts) / 2
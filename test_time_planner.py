@@ -0,0 +1,24 @@
+from time_planner import extract_events
+from benchmark import replay_events
+
+def flag(name):
+    return f'<span class="flagicon"><img alt="" src="flag.png"></span>&#160;<a href="/wiki/{name}" title="{name}">{name}</a>'
+
+def test_extract_events_from_saved_slip():
+    html, events = replay_events()
+    assert extract_events(html) == events
+
+def test_extract_events_spanning_venue():
+    # Laid out like the Wikipedia calendar: the venue spans two rows, and the winners have flags too
+    html = ('<table class="wikitable"><tbody><tr><th>#</th><th>Date</th><th>Venue</th><th>Type</th><th>Winner</th></tr>'
+            f'<tr><td>1</td><td><span data-sort-value="2019-12-07">7 December 2019</span></td><td rowspan="2">{flag("Lake Louise")}</td>'
+            f'<td><b>DH</b><sub>1</sub></td><td>{flag("Austria")} Some Skier</td></tr>'
+            f'<tr><td>2</td><td>8 December 2019</td><td>SG <sup>2</sup></td><td>{flag("Italy")}</td></tr>'
+            '<tr><td colspan="5">Cancelled</td></tr>'
+            f'<tr><td>3</td><td>21 December 2019</td><td class="venue">{flag("Val Gardena")}</td><td>PG</td></tr>'
+            '</tbody></table>')
+    assert extract_events(html) == [
+        ["7 December 2019", "Lake Louise", "Downhill"],
+        ["8 December 2019", "Lake Louise", "Super Giant Slalom"],
+        ["21 December 2019", "Val Gardena", "Parallel Giant Slalom"],
+    ]
@@ -0,0 +1,130 @@
+import io
+import time
+from contextlib import redirect_stdout
+import pytest
+import wiki_race_challenge as wr
+from link_graph import LinkGraph
+from local_wiki import LocalFetcher, LocalWiki, synthetic_wiki, use_fetcher
+
+url = "https://en.wikipedia.org/wiki/Article_%d"
+
+@pytest.fixture(scope="module")
+def wiki():
+    with LocalWiki(synthetic_wiki(300, 10)) as wiki:
+        yield wiki
+
+def run_race(wiki, checkpoint, engine="thread", scorer="keywords", start=0, goal=299):
+    # Runs a race with a checkpointer that saves after every expansion, and waits for the last write
+    with use_fetcher(LocalFetcher(wiki, cache=None, pool_size=4)), redirect_stdout(io.StringIO()):
+        keywords = wr.find_keywords(url % goal, 3)
+        queue = wr.ArticleQueue([wr.Article(url % start)])
+        visited = wr.VisitedSet([url % start])
+        checkpointer = wr.Checkpointer(checkpoint, interval=0)
+        path = wr.race(url % start, url % goal, keywords, queue, visited, 4, 0, engine, False, wr.article_links,
+                checkpointer, 2, None, scorer)
+    checkpointer.wait()
+    return path, keywords, queue, visited, checkpointer
+
+def assert_round_trip(checkpoint, start, goal, keywords, queue, visited):
+    # Saves the race and checks that loading it gives back the same queue and visited articles
+    checkpointer = wr.Checkpointer(checkpoint)
+    checkpointer.save(start, goal, keywords, queue, visited, force=True)
+    checkpointer.wait()
+    loaded = wr.Checkpointer.load(checkpoint)
+    assert loaded[:3] == (start, goal, keywords)
+    expected = sorted((e[1], e[0], e[2].url, e[2].path) for e in queue.snapshot())
+    assert sorted((e[1], e[0], e[2].url, e[2].path) for e in loaded[3].snapshot()) == expected
+    assert loaded[4].snapshot() == visited.snapshot()
+
+def test_checkpoint_tfidf(wiki, tmp_path):
+    checkpoint = str(tmp_path / "race.checkpoint")
+    path, keywords, queue, visited, checkpointer = run_race(wiki, checkpoint, scorer="tfidf")
+    assert path
+    # Every expansion before the goal was found wrote a checkpoint
+    assert checkpointer.saved > 0
+    assert any(not float(e[0]).is_integer() for e in queue.snapshot())
+    assert_round_trip(checkpoint, url % 0, url % 299, keywords, queue, visited)
+
+@pytest.mark.parametrize("engine", ["thread", "async"])
+def test_checkpoint_round_trip(wiki, tmp_path, engine):
+    checkpoint = str(tmp_path / "race.checkpoint")
+    path, keywords, queue, visited, checkpointer = run_race(wiki, checkpoint, engine)
+    assert path
+    # Every expansion before the goal was found wrote a checkpoint
+    assert checkpointer.saved > 0
+    # The last one was saved before the goal was found, so resuming from it finds the goal again
+    start, goal, saved_keywords, saved_queue, saved_visited = wr.Checkpointer.load(checkpoint)
+    assert (start, goal, saved_keywords) == (url % 0, url % 299, keywords)
+    assert goal not in saved_visited.snapshot()
+    with use_fetcher(LocalFetcher(wiki, cache=None, pool_size=4)), redirect_stdout(io.StringIO()):
+        resumed = wr.race(start, goal, keywords, saved_queue, saved_visited, 4, 0, engine, False, wr.article_links,
+                None, 2)
+    assert resumed and resumed[0] == goal and resumed[-1] == start
+
+    assert len(queue)
+    assert_round_trip(checkpoint, url % 0, url % 299, keywords, queue, visited)
+
+def test_frontier_snapshot_keeps_expanding_articles():
+    start = wr.Article(url % 0)
+    frontier = wr.Frontier(url % 9, [(0, 0, start)], {url % 0})
+    assert frontier.next_article() == (url % 0, 0, None)
+    assert frontier.visit(url % 0, [url % 1, url % 2]) == [url % 1, url % 2]
+    # The article is still being expanded, so resuming from the snapshot must expand it again
+    entries, visited = frontier.snapshot()
+    assert [e[2].url for e in entries] == [url % 0]
+    assert visited == {url % 0}
+    queue = wr.ArticleQueue()
+    queue.restore(entries)
+    resumed = wr.Frontier(url % 9, queue.snapshot(), visited)
+    assert resumed.next_article() == (url % 0, 0, None)
+    assert resumed.visit(url % 0, [url % 1, url % 2]) == [url % 1, url % 2]
+
+    frontier.insert(url % 0, [(url % 1, 5), (url % 2, 3)])
+    entries, visited = frontier.snapshot()
+    assert sorted(e[2].url for e in entries) == [url % 1, url % 2]
+    assert visited == {url % 0, url % 1, url % 2}
+
+@pytest.mark.parametrize("engine,top", [("thread", None), ("process", None), ("thread", 3), ("async", 3), ("process", 3)])
+def test_race_with_graph(wiki, tmp_path, engine, top):
+    graph_path = str(tmp_path / "links.graph")
+    with use_fetcher(LocalFetcher(wiki, cache=None, pool_size=4)), redirect_stdout(io.StringIO()):
+        path = wr.wiki_race(url % 0, url % 299, engine=engine, processes=2, graph=LinkGraph(graph_path), top=top)
+        assert path
+        # The links of every expanded article were stored, so the second race needs no requests
+        requests = wiki.requests
+        graph = LinkGraph(graph_path)
+        assert graph.links(url % 0)
+        assert wr.wiki_race(url % 0, url % 299, engine=engine, processes=2, graph=graph,
+                top=top) == graph.shortest_path(url % 0, url % 299)
+        assert wiki.requests == requests
+
+@pytest.fixture(scope="module")
+def slow_wiki():
+    with LocalWiki(synthetic_wiki(300, 10), latency=0.01) as wiki:
+        yield wiki
+
+def test_process_checkpoint(slow_wiki, tmp_path):
+    checkpoint = str(tmp_path / "race.checkpoint")
+    path, keywords, queue, visited, checkpointer = run_race(slow_wiki, checkpoint, "process")
+    assert path
+    # Checkpoints are written while the workers expand articles
+    assert checkpointer.saved > 0
+    start, goal, saved_keywords, saved_queue, saved_visited = wr.Checkpointer.load(checkpoint)
+    assert (start, goal, saved_keywords) == (url % 0, url % 299, keywords)
+    with use_fetcher(LocalFetcher(slow_wiki, cache=None, pool_size=4)), redirect_stdout(io.StringIO()):
+        resumed = wr.race(start, goal, keywords, saved_queue, saved_visited, 4, 0, "process", False, wr.article_links,
+                None, 2)
+    assert resumed and resumed[0] == goal and resumed[-1] == start
+    # The queue is left as the race left it
+    assert len(queue)
+    assert_round_trip(checkpoint, url % 0, url % 299, keywords, queue, visited)
+
+def test_process_rate_limit(wiki):
+    rate = 50
+    with use_fetcher(LocalFetcher(wiki, cache=None, pool_size=4, rate=rate, burst=1)), redirect_stdout(io.StringIO()):
+        requests = wiki.requests
+        start = time.monotonic()
+        assert wr.wiki_race(url % 0, url % 299, engine="process", processes=4)
+        seconds = time.monotonic() - start
+    # The workers share one rate limit, instead of each sending [rate] requests per second
+    assert wiki.requests - requests <= rate * seconds + 2
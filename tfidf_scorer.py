@@ -0,0 +1,123 @@
+import collections
+import zlib
+import numpy as np
+import patterns
+from keyword_matcher import body_text
+
+# The words of a text, after it is lowercased
+word_pattern = patterns.register("tfidf.word", "[a-z0-9]+")
+
+class TfidfScorer:
+    """
+    Scores pages by the cosine similarity of their TF-IDF vector to the one of the goal page, as an alternative
+    to scoring them by keywords. Words are hashed into a fixed amount of dimensions, so the vectors are sparse
+    arrays of (index, weight) and no vocabulary has to be known beforehand. How rare each word is (IDF) is learned
+    from the pages scored so far, so common words like "the" or "Wikipedia" weigh less as the race goes on.
+    Pages are scored in batches with NumPy, see score_pages
+    Properties:
+        dims: The amount of hashed dimensions
+        pages: The amount of pages learned from, including the goal
+        df: The amount of pages each dimension occurs in, as a float64 array
+    """
+    def __init__(self, goal_html, dims=1 << 18):
+        """
+        Args:
+            goal_html (string): The HTML of the goal article
+            [dims] (int): The amount of hashed dimensions, a power of two
+        """
+        self.dims = dims
+        self.pages = 0
+        self.df = np.zeros(dims)
+        self._ids = {} # Word -> its hashed dimension
+        vector = self.vectorize(body_text(goal_html))
+        self.learn([vector])
+        # The goal term frequencies as a dense array, to look them up at the indices of any page
+        self._goal_indices, self._goal_tf = vector
+        self._goal = np.zeros(dims)
+        self._goal[self._goal_indices] = self._goal_tf
+
+    def vectorize(self, text):
+        """
+        Turns a text into a sparse vector of term frequencies
+        Args:
+            text (string): The text, like the body text of a page
+        Returns:
+            tuple: A sorted int64 array of the hashed dimensions of the words and a float64 array of their
+                term frequencies, as 1 + log(count) so a word repeated many times does not dominate
+        """
+        counts = collections.Counter(word_pattern.findall(text.lower()))
+        ids = self._ids
+        if len(ids) > 1 << 20:
+            # Keep the memory of the hashed words bounded in long races
+            ids.clear()
+        indices = np.empty(len(counts), np.int64)
+        mask = self.dims - 1
+        for i, word in enumerate(counts):
+            index = ids.get(word)
+            if index is None:
+                # crc32 is the same in every process, unlike hash()
+                index = ids[word] = zlib.crc32(word.encode("utf-8")) & mask
+            indices[i] = index
+        tf = 1 + np.log(np.fromiter(counts.values(), np.float64, len(counts)))
+        # Add up the words hashed to the same dimension, so each dimension is in the vector once
+        indices, owners = np.unique(indices, return_inverse=True)
+        return indices, np.bincount(owners, tf, len(indices))
+
+    def learn(self, vectors):
+        """
+        Counts the dimensions of pages in the document frequencies
+        Args:
+            vectors (list): The vectors of the pages, see vectorize
+        """
+        for indices, tf in vectors:
+            self.df[indices] += 1
+        self.pages += len(vectors)
+
+    def idf(self, indices):
+        # The smoothed inverse document frequencies of dimensions
+        return np.log((1 + self.pages) / (1 + self.df[indices])) + 1
+
+    def similarity(self, vectors):
+        """
+        Computes the cosine similarity of vectors to the goal in one batch, with the current document frequencies
+        Args:
+            vectors (list): The vectors to compare, see vectorize
+        Returns:
+            array: The similarity of each vector, from 0 to 1
+        """
+        if not vectors:
+            return np.zeros(0)
+        lengths = np.fromiter((len(indices) for indices, tf in vectors), np.int64, len(vectors))
+        indices = np.concatenate([v[0] for v in vectors])
+        weights = np.concatenate([v[1] for v in vectors])
+        # The vector each entry belongs to, to sum the entries of every vector at once
+        owners = np.repeat(np.arange(len(vectors)), lengths)
+        idf = self.idf(indices)
+        weights *= idf
+        dots = np.bincount(owners, weights * self._goal[indices] * idf, len(vectors))
+        norms = np.sqrt(np.bincount(owners, weights * weights, len(vectors)))
+        goal = self._goal_tf * self.idf(self._goal_indices)
+        norms *= np.sqrt(goal @ goal)
+        return np.divide(dots, norms, out=np.zeros(len(vectors)), where=norms > 0)
+
+    def score_pages(self, htmls):
+        """
+        Scores pages by their similarity to the goal, learning the document frequencies of the pages first
+        Args:
+            htmls (list): The HTML of each page
+        Returns:
+            list: The score of each page, from 0 to 1000
+        """
+        vectors = [self.vectorize(body_text(html)) for html in htmls]
+        self.learn(vectors)
+        return (self.similarity(vectors) * 1000).tolist()
+
+    def score_texts(self, texts):
+        """
+        Scores short texts by their similarity to the goal, like the title and text of links, without learning from them
+        Args:
+            texts (list): The texts to score
+        Returns:
+            list: The score of each text, from 0 to 1000
+        """
+        return (self.similarity([self.vectorize(text) for text in texts]) * 1000).tolist()
@@ -1,6 +1,7 @@
-from bs4 import BeautifulSoup
+from document import parse, rows
 from requesting_urls import get_html
-import regex as re
+import instrument
+import patterns
 
 def get_discipline(disc):
     """
@@ -20,6 +21,11 @@ def get_discipline(disc):
     }
     return disciplines.get(disc)
 
+# Regex expressions that are run over the text of each cell, so the rows are never serialized back into HTML
+r_date = patterns.register("events.date", "[\d]{1,2} [a-zA-Z]* [\d]{4}")
+r_disc = patterns.register("events.discipline", "(DH|SL|GS|SG|AC|PG)(?![a-zA-Z])")
+
+@instrument.traced("extract.events")
 def extract_events(html):
     """
     Gets all skiing events from a Wikipedia page
@@ -28,35 +34,31 @@ def extract_events(html):
     Returns:
         list: A list of skiing events where each item is a list of [date, venue, discipline]
     """
-
-    soup = BeautifulSoup(html, "html.parser")
-
-    # Find the table of events and the rows within
-    soup_table = soup.find("table", {"class": "wikitable"})
-    soup_tbody = soup_table.find("tbody")
-    soup_rows = soup_tbody.findAll("tr")
-
-    soup_rows = soup_rows[1:] # Remove headers
-
-    # Regex expressions that retrieve each field from each row
-    # Rows are very inconsistently composed, so this is simpler than pure BeautifulSoup
-    r_date = re.compile("[\d]{1,2} [a-zA-Z]* [\d]{4}")
-    r_venue = re.compile("<td.*flagicon.*<a[^>]*>(.*)</a>.*\s.*(DH|SL|GS|SG|AC|PG)")
-    r_disc = re.compile("<td.*(DH|SL|GS|SG|AC|PG).*<")
+    # Find the table of events and the cells of each row
+    soup_table = parse(html).table({"class": "wikitable"})
+    soup_rows = rows(soup_table.find("tbody"))
 
     last_venue = None # The venue of the previous row
     events = []
 
-    for soup_row in soup_rows:
-        row = str(soup_row)
-        date = r_date.search(row)
+    for cells in soup_rows:
+        texts = [cell.get_text().strip() for cell in cells]
+        dates = [(i, r_date.search(text)) for i, text in enumerate(texts)]
+        dates = [(i, date.group(0)) for i, date in dates if date]
         # If the row has no date, the row is invalid and should not be checked further
-        if date:
-            # If the row has no venue, the venue must span multiple cells. Use the previous venue
-            venue = r_venue.search(row) or last_venue
-            last_venue = venue
-            disc = r_disc.search(row).group(1)
-            events.append([date.group(0), venue.group(1), get_discipline(disc)])
+        if not dates:
+            continue
+        first, date = dates[0]
+        # The discipline is the first cell after the date that starts with a discipline code
+        disc = next((i for i in range(first + 1, len(texts)) if r_disc.match(texts[i])), None)
+        if disc is None:
+            continue
+        # The venue is the cell with a flag right before the discipline.
+        # If there is none, the venue spans multiple rows. Use the previous venue
+        link = cells[disc - 1].find("a") if cells[disc - 1].find(class_="flagicon") else None
+        venue = link.get_text().strip() if link else last_venue
+        last_venue = venue
+        events.append([date, venue, get_discipline(r_disc.match(texts[disc]).group(1))])
 
     return events
 
@@ -1,40 +1,63 @@
-from filter_urls import find_articles
-from requesting_urls import get_html
-import regex as re
-import time
+from filter_urls import extract_links, find_articles
+from link_graph import CachedLinks
+from keyword_matcher import KeywordMatcher, body_text
+from tfidf_scorer import TfidfScorer
+import requesting_urls
+from requesting_urls import SharedBuckets, get_html
+import instrument
+import patterns
+import requests as req
+from array import array
+import asyncio
+import collections
 import concurrent.futures
+import heapq
+import itertools
+from multiprocessing.managers import BaseManager
+import os
+import pickle
 import threading
+import time
+from urllib.parse import unquote
+import zlib
 
 class Article:
     """
     Class to contains Article information
     Properties:
         url: The url to the article
+        parent: The article the link was found in
         path: The full path from the source article
         score: The score rewarded from the keyword search
     """
     def __init__(self, url, parent=None):
         self.url = url
-        self.path = [url]
-        if parent:
-            self.path += parent.path
+        self.parent = parent
         self.score = 0
 
+    @property
+    def path(self):
+        # Follows the parents back to the source article
+        path = []
+        article = self
+        while article:
+            path.append(article.url)
+            article = article.parent
+        return path
+
 class ArticleList:
     """
     Encapsulated list of articles to handle race conditions for threads
     """
     def __init__(self, articles):
-        self.articles = articles
-        self._lock = threading.Lock()
+        self.articles = collections.deque(articles)
+        self._lock = instrument.lock("sub_articles")
 
     def next_article(self):
         # Removes and returns the first article in the list
         with self._lock:
             if len(self.articles) > 0:
-                article = self.articles[0]
-                self.articles = self.articles[1:]
-                return article
+                return self.articles.popleft()
             else:
                 return None
 
@@ -54,98 +77,1002 @@ class ArticleList:
 
     def contains(self, article):
         # Checks if the list contains a specific article
-        return article in self.articles
+        with self._lock:
+            return article in self.articles
 
     def clear(self):
         # Emtpies the entire list
         with self._lock:
-            self.articles = []
+            self.articles.clear()
 
     def __len__(self):
         return len(self.articles)
 
-def wiki_thread(goal, article, queue, visited, sub_articles, keywords, sleeptime=0.01):
+class ArticleQueue:
+    """
+    Thread-safe priority queue of articles, where the highest score comes first.
+    Articles with equal scores come out in the order they were inserted.
+    Backed by a heap, so inserting and removing articles takes logarithmic time.
+    """
+    def __init__(self, articles=()):
+        self._heap = []
+        self._count = itertools.count()
+        self._lock = instrument.lock("queue")
+        for article in articles:
+            self.insert(article)
+
+    def insert(self, article):
+        # Inserts an Article in a sorted position in regards to its score
+        with self._lock:
+            heapq.heappush(self._heap, (-article.score, next(self._count), article))
+
+    def next_article(self):
+        # Removes and returns the article with the highest score
+        with self._lock:
+            if self._heap:
+                return heapq.heappop(self._heap)[2]
+            return None
+
+    def peek(self):
+        # Returns the article with the highest score without removing it
+        with self._lock:
+            return self._heap[0][2] if self._heap else None
+
+    def snapshot(self):
+        # Returns a copy of the heap entries, on the form (-score, order, article)
+        with self._lock:
+            return list(self._heap)
+
+    def restore(self, entries):
+        # Replaces the queue with heap entries from a snapshot
+        with self._lock:
+            self._heap = list(entries)
+            heapq.heapify(self._heap)
+            self._count = itertools.count(max((e[1] for e in self._heap), default=-1) + 1)
+
+    def clear(self):
+        # Empties the entire queue
+        with self._lock:
+            self._heap = []
+
+    def __len__(self):
+        return len(self._heap)
+
+class VisitedSet:
+    """
+    Thread-safe set of visited article urls
+    """
+    def __init__(self, urls=()):
+        self._urls = set(urls)
+        self._lock = instrument.lock("visited")
+
+    def add(self, url):
+        """
+        Marks a url as visited
+        Args:
+            url (string): The url to mark
+        Returns:
+            bool: True if the url was not visited before. Only one thread gets True for each url
+        """
+        with self._lock:
+            if url in self._urls:
+                return False
+            self._urls.add(url)
+            return True
+
+    def contains(self, url):
+        # Checks if a url has been visited
+        return url in self._urls
+
+    def snapshot(self):
+        # Returns a copy of the visited urls
+        with self._lock:
+            return set(self._urls)
+
+    def __len__(self):
+        return len(self._urls)
+
+class Checkpointer:
+    """
+    Periodically saves the state of a race to a file, so the race can be resumed after a crash.
+    Snapshots are taken between article expansions, where copying the queue and visited set is quick,
+    and are compressed and written by a background thread while the race goes on.
+    """
+    def __init__(self, path, interval=5):
+        """
+        Args:
+            path (string): The file to save the checkpoints to
+            [interval] (float): The minimum amount of seconds between checkpoints
+        """
+        self.path = path
+        self.interval = interval
+        self.saved = 0
+        self._last = time.monotonic()
+        self._writer = None
+
+    def save(self, start, goal, keywords, queue, visited, force=False):
+        """
+        Takes a snapshot of the race and writes it in the background, if the interval has passed
+        Args:
+            start (string): The starting article of the race
+            goal (string): The goal article of the race
+            keywords (list): The keyword tiers of the race
+            queue (ArticleQueue): The queue of articles to expand
+            visited (VisitedSet): The set of visited articles
+            [force] (bool): Save even if the interval has not passed, waiting for any running write
+        """
+        if not force and time.monotonic() - self._last < self.interval:
+            return
+        if self._writer and self._writer.is_alive():
+            if not force:
+                return
+            self._writer.join()
+        self._last = time.monotonic()
+        snapshot = (start, goal, keywords, queue.snapshot(), visited.snapshot())
+        self._writer = threading.Thread(target=lambda: self._write(self.dumps(self.encode(*snapshot))))
+        self._writer.start()
+
+    def due(self):
+        # Checks if the interval has passed and the last checkpoint is written, so save would write a new one
+        return time.monotonic() - self._last >= self.interval and not (self._writer and self._writer.is_alive())
+
+    def save_data(self, data):
+        """
+        Writes an already encoded checkpoint in the background, like one from Frontier.encoded_snapshot.
+        Waits for any running write first
+        Args:
+            data (bytes): The contents of the checkpoint file, see dumps
+        """
+        self.wait()
+        self._last = time.monotonic()
+        self._writer = threading.Thread(target=self._write, args=(data,))
+        self._writer.start()
+
+    def wait(self):
+        # Waits until the last checkpoint is written
+        if self._writer:
+            self._writer.join()
+
+    @staticmethod
+    def encode(start, goal, keywords, entries, visited):
+        """
+        Encodes the state of a race into strings and flat arrays, which are far quicker
+        to pickle and send between processes than the articles themselves
+        Args:
+            start (string): The starting article of the race
+            goal (string): The goal article of the race
+            keywords (list): The keyword tiers of the race
+            entries (list): The queue entries, see ArticleQueue.snapshot
+            visited (set): The visited urls
+        Returns:
+            dict: The encoded state
+        """
+        # Expanded articles are stored once and referenced by index, as many queued articles share them
+        expanded = {} # id of an Article -> its index
+        expanded_urls = []
+        expanded_parents = array("i")
+        queue_parents = array("i")
+        for entry in entries:
+            parent = entry[2].parent
+            if parent is not None and id(parent) not in expanded:
+                # Give indices from the top down, so parents are always stored before their children
+                chain = []
+                while parent is not None and id(parent) not in expanded:
+                    chain.append(parent)
+                    parent = parent.parent
+                for article in reversed(chain):
+                    expanded[id(article)] = len(expanded_urls)
+                    expanded_urls.append(article.url)
+                    expanded_parents.append(expanded[id(article.parent)] if article.parent else -1)
+            parent = entry[2].parent
+            queue_parents.append(expanded[id(parent)] if parent is not None else -1)
+
+        return {
+            "version": 2,
+            "start": start,
+            "goal": goal,
+            "keywords": keywords,
+            "visited": "\n".join(visited),
+            "expanded": "\n".join(expanded_urls),
+            "expanded_parents": expanded_parents.tobytes(),
+            "queue": "\n".join([e[2].url for e in entries]),
+            "queue_parents": queue_parents.tobytes(),
+            # Scores are stored as floats, as the scores of a TfidfScorer are not whole numbers
+            "scores": array("d", [-e[0] for e in entries]).tobytes(),
+            "order": array("q", [e[1] for e in entries]).tobytes()
+        }
+
+    @staticmethod
+    def dumps(state):
+        # Compresses an encoded state into the contents of a checkpoint file
+        return zlib.compress(pickle.dumps(state, pickle.HIGHEST_PROTOCOL), 1)
+
+    @staticmethod
+    def loads(data):
+        # Decompresses the contents of a checkpoint file into an encoded state
+        return pickle.loads(zlib.decompress(data))
+
+    def _write(self, data):
+        # Write to a temporary file first, so a crash never leaves a half written checkpoint
+        with open(self.path + ".tmp", "wb") as f:
+            f.write(data)
+        os.replace(self.path + ".tmp", self.path)
+        self.saved += 1
+
+    @staticmethod
+    def load(path):
+        """
+        Loads a checkpoint
+        Args:
+            path (string): The checkpoint file
+        Returns:
+            tuple: (start, goal, keywords, queue, visited) of the saved race
+        """
+        with open(path, "rb") as f:
+            return Checkpointer.decode(Checkpointer.loads(f.read()))
+
+    @staticmethod
+    def decode(state):
+        """
+        Recreates the queue and visited set of an encoded state
+        Args:
+            state (dict): The state of the race, see encode
+        Returns:
+            tuple: (start, goal, keywords, queue, visited) of the race
+        """
+        def strings(name):
+            return state[name].split("\n") if state[name] else []
+
+        def numbers(name, typecode):
+            values = array(typecode)
+            values.frombytes(state[name])
+            return values
+
+        # Recreate the expanded articles first, so the queued articles can share them as parents
+        expanded = []
+        for url, parent in zip(strings("expanded"), numbers("expanded_parents", "i")):
+            expanded.append(Article(url, expanded[parent] if parent >= 0 else None))
+
+        entries = []
+        # Version 1 checkpoints stored the scores as integers
+        scores = numbers("scores", "d" if state["version"] >= 2 else "q")
+        for url, parent, score, order in zip(strings("queue"), numbers("queue_parents", "i"),
+                scores, numbers("order", "q")):
+            article = Article(url, expanded[parent] if parent >= 0 else None)
+            # Keyword scores are whole numbers, and are given back as integers
+            article.score = score = int(score) if float(score).is_integer() else score
+            entries.append((-score, order, article))
+        queue = ArticleQueue()
+        queue.restore(entries)
+        return state["start"], state["goal"], state["keywords"], queue, VisitedSet(strings("visited"))
+
+def fetch_until_accepted(url):
+    """
+    Gets the html of an article, trying again until the request is accepted, in case a request is denied.
+    The fetcher already backs off and retries denied requests, this keeps going after it gives up
+    Args:
+        url (string): The url of the article to fetch
+    Returns:
+        string: The html of the article
+    """
+    html = None
+    while not html:
+        try:
+            html = get_html(url)
+        except req.RequestException:
+            pass
+    return html
+
+def article_links(url):
+    # Finds the articles linked in the content of an article, and stops the download after the content
+    return find_articles(url, content_only=True)
+
+@instrument.traced("score")
+def score_article(url, html, parent, matcher, body_only=False):
+    """
+    Creates an Article and grants it a score from the keywords found in its HTML and URL
+    Args:
+        url (string): The url of the article
+        html (string): The html of the article
+        parent (Article): The article the link was found in
+        matcher (KeywordMatcher): Matcher for the keyword tiers to score articles by
+        [body_only] (bool): Only look for keywords in the text of the article body, instead of the full HTML
+    Returns:
+        Article: The scored article
+    """
+    content = body_text(html) if body_only else html
+    item = Article(url, parent)
+    # Grant points for keywords in the HTML
+    hits = matcher.count(content.lower())
+    # Grant more points for keywords in the URL, where spaces are underscores
+    url_hits = matcher.count(url.lower().replace("_", " "))
+    for i in range(matcher.tiers):
+        item.score += hits[i] * [1, 10, 50][i] + url_hits[i] * [5, 30, 100][i]
+    return item
+
+@instrument.traced("score_batch")
+def score_pages(urls, htmls, parent, matcher, body_only=False):
+    """
+    Creates and scores several Articles at once. A TfidfScorer scores them in a single batch,
+    a KeywordMatcher one at a time, see score_article
+    Args:
+        urls (list): The urls of the articles
+        htmls (list): The html of each article
+        parent (Article): The article the links were found in
+        matcher (KeywordMatcher or TfidfScorer): The scorer of the race
+        [body_only] (bool): Only look for keywords in the text of the article body. A TfidfScorer always does
+    Returns:
+        list: The scored Articles
+    """
+    if not isinstance(matcher, TfidfScorer):
+        return [score_article(url, html, parent, matcher, body_only) for url, html in zip(urls, htmls)]
+    articles = []
+    for url, score in zip(urls, matcher.score_pages(htmls)):
+        item = Article(url, parent)
+        item.score = score
+        articles.append(item)
+    return articles
+
+class PageBatch:
+    """
+    Collects the pages fetched by several threads, and scores and queues them a batch at a time,
+    for scorers that are faster at scoring many pages at once, like TfidfScorer.
+    Only one batch is scored at a time, so the scorer is never used by two threads at once
+    """
+    def __init__(self, parent, queue, matcher, body_only=False, size=32):
+        """
+        Args:
+            parent (Article): The article the links were found in
+            queue (ArticleQueue): The queue to insert the scored articles into
+            matcher (KeywordMatcher or TfidfScorer): The scorer of the race
+            [body_only] (bool): Only score the text of the article body
+            [size] (int): The amount of pages to collect before scoring them, which bounds the memory used
+        """
+        self.parent = parent
+        self.queue = queue
+        self.matcher = matcher
+        self.body_only = body_only
+        self.size = size
+        self._pages = []
+        self._lock = threading.Lock()
+
+    def add(self, url, html):
+        # Adds a fetched page, scoring the batch if it is full
+        with self._lock:
+            self._pages.append((url, html))
+            if len(self._pages) >= self.size:
+                self._score()
+
+    def flush(self):
+        # Scores the pages left in the batch
+        with self._lock:
+            self._score()
+
+    def _score(self):
+        pages, self._pages = self._pages, []
+        if pages:
+            urls, htmls = zip(*pages)
+            for item in score_pages(urls, htmls, self.parent, self.matcher, self.body_only):
+                self.queue.insert(item)
+
+def should_check(url):
+    # Only check english wiki links and do not go to the Main Page. No cheating!
+    return "en.w" in url and "/Main_Page" not in url
+
+def article_anchors(url):
+    # Like article_links, with the title attribute and text of each link, on the form (url, title, text)
+    return find_articles(url, content_only=True, anchors=True)
+
+class Prescorer:
+    """
+    Class to choose which links of an article are worth fetching, from the keywords in their URL, title and anchor text.
+    Only the pages of the best links are fetched and scored. The other links are queued with the score of their anchor,
+    so they are still expanded if nothing better is found
+    Properties:
+        top: The most links of an article to fetch, or None for no limit
+        threshold: The lowest anchor score of a link to fetch, or None for no limit
+        links: Function returning the (url, title, text) of the articles an article links to
+        fetched: The amount of links fetched and scored so far
+        avoided: The amount of links queued without fetching their page so far
+    """
+    def __init__(self, top=None, threshold=None, links=article_anchors):
+        self.top = top
+        self.threshold = threshold
+        self.links = links
+        self.fetched = 0
+        self.avoided = 0
+
+    def score(self, matcher, url, title, text):
+        # Scores a link like the URL of a fetched article is scored, counting the title and text of the link as well
+        hits = matcher.count(f"{url.replace('_', ' ')} {title} {text}".lower())
+        return sum(hits[i] * [5, 30, 100][i] for i in range(matcher.tiers))
+
+    def select(self, matcher, anchors):
+        """
+        Ranks links by their anchor scores, and picks the ones to fetch
+        Args:
+            matcher (KeywordMatcher or TfidfScorer): The scorer of the race to score links by
+            anchors (list): The links as (url, title, text) tuples
+        Returns:
+            tuple: A list of the urls to fetch, and a list of (url, score) tuples of the links not to fetch
+        """
+        if isinstance(matcher, TfidfScorer):
+            scores = matcher.score_texts([f"{unquote(url[url.rfind('/') + 1:]).replace('_', ' ')} {title} {text}"
+                    for url, title, text in anchors])
+        else:
+            scores = [self.score(matcher, *anchor) for anchor in anchors]
+        # Best score first, and links in the order of the page on equal scores
+        order = sorted(range(len(anchors)), key=lambda i: -scores[i])
+        fetch = []
+        skip = []
+        for rank, i in enumerate(order):
+            if (self.top is None or rank < self.top) and (self.threshold is None or scores[i] >= self.threshold):
+                fetch.append(anchors[i][0])
+            else:
+                skip.append((anchors[i][0], scores[i]))
+        self.fetched += len(fetch)
+        self.avoided += len(skip)
+        instrument.count("prescore.avoided", len(skip))
+        return fetch, skip
+
+    def apply(self, anchors, article, goal, queue, visited, matcher):
+        """
+        Queues the links of an article that are not worth fetching, and marks them as visited
+        Args:
+            anchors (list): The links of the article as (url, title, text) tuples
+            article (Article): The article the links are from
+            goal (string): The article the race is trying to find
+            queue (ArticleQueue): The queue to insert the links that are not fetched into
+            visited (VisitedSet): The set of visited articles
+            matcher (KeywordMatcher): Matcher for the keyword tiers to score links by
+        Returns:
+            list: The urls for the threads to check, with the goal first if it is linked
+        """
+        candidates = [a for a in anchors if a[0] != goal and should_check(a[0]) and not visited.contains(a[0])]
+        fetch, skip = self.select(matcher, candidates)
+        for url, score in skip:
+            if visited.add(url):
+                item = Article(url, article)
+                item.score = score
+                queue.insert(item)
+        return ([goal] if any(a[0] == goal for a in anchors) else []) + fetch
+
+def wiki_thread(goal, article, queue, visited, sub_articles, matcher, sleeptime=0, body_only=False, batch=None):
     """
     Checks all sub articles from links in an article, grants them scores, and puts them in the queue
     Args:
         goal (string): The article it is trying to find a path to
         article (Article): The article the links were fetched from
-        queue (ArticleList): The queue to insert sub articles into
-        visited (ArticleList): The list of previusly visited articles
+        queue (ArticleQueue): The queue to insert sub articles into
+        visited (VisitedSet): The set of previusly visited articles
         sub_articles (ArticleList): The list of articles to be checked
-        keywords (list): List of keywords to score articles by
+        matcher (KeywordMatcher): Matcher for the keyword tiers to score articles by
         sleeptime (float): Time to sleep between each article
+        [body_only] (bool): Only score the text of the article body
+        [batch] (PageBatch): Collects the fetched articles to be scored in batches, instead of scoring each one
     """
-    title_exp = re.compile("<title>(.+) -.+</title>")
-
     while True:
         time.sleep(sleeptime) # Slight delay to avoid denied responses
         l = sub_articles.next_article()
         # Stop when article list is empty
         if not l:
             break
-        # Only search if link has not been visited already
-        if not visited.contains(l):
-            visited.append(l) # Add to visited list
+        # Only search if link has not been visited already, and mark it as visited
+        if visited.add(l):
             if l == goal:
                 # The correct link was found!
                 print("Done!")
                 sub_articles.clear()
                 return Article(l, article).path
-            elif "en.w" in l and "/Main_Page" not in l:
-                # Only check english wiki links and do not go to the Main Page. No cheating!
-
-                # Tries to get the html repeatedly until the request is accepted.
-                # In case a request is denied.
-                html = None
-                while not html:
-                    try:
-                        html = get_html(l)
-                    except:
-                        pass
-
-                content = html.lower()
-                item = Article(l, article)
-                # Check for keywords in the HTML, to grant the Article a score
-                for i in range(len(keywords)):
-                    for k in keywords[i]:
-                        if k in content:
-                            # Grant points if keywords are in the HTML
-                            item.score += [1, 10, 50][i]
-                        if k.replace(" ", "_") in l.lower():
-                            # Grant more points if keywords are in the URL
-                            item.score += [5, 30, 100][i]
-                # Insert Article into search queue in accordance to its score
-                inserted = queue.insert(item)
-
-
-def wiki_race(start, goal, output=None, greed=2, threads=4, sleeptime=0.01):
+            elif should_check(l):
+                html = fetch_until_accepted(l)
+                if batch:
+                    batch.add(l, html)
+                else:
+                    # Insert Article into search queue in accordance to its score
+                    queue.insert(score_article(l, html, article, matcher, body_only))
+
+async def async_race(start, goal, matcher, concurrency=8, sleeptime=0, body_only=False, links=article_links,
+        queue=None, visited=None, checkpoint=None, prescorer=None):
     """
-    Finds the a short path between two wikipedia pages.
-    It usually finds a short path, but may not always find the shortest, as it can grow quite greedy.
-    Tried BFS, that didn't terminate and Wikipedia started denying my requests, so here we are!
-    Ranks all articles by their keyword scores, and goes to the most promising articles first.
-    If no articles look promising, it performs regular BFS.
+    Asyncio version of the search loop in wiki_race.
+    Keeps a persistent pool of in-flight requests limited by a global semaphore, instead of
+    a new set of threads for every article. While the links of an article are being scored,
+    the links of the currently best scored article are already requested.
     Args:
         start (string): The starting Wikipedia Article to find the path from
         goal (string): The Wikipedia article to find the path to
-        [output] (string): Optional output file to write the path to
-        [greed] (int): Specified how what keywords to consider when scoring articles
-            0: No keywords are considered, pure BFS (THIS WILL TAKE FOREVER)
-            1: High Priority keywords only, this will probably take a long time
-            2: Mid-High Priority, this usually finds the best path (DEFAULT)
-            3: All keywords. Rarely finds the best path, but does find a path very quickly
-        [threads] (int): The amount of threads, too many might make Wikipedia deny requests eventually
-            Default: 4, this works well as long as the algorithm isn't called excessively
-        [sleeptime] (float): The time each thread sleeps before moving to next thread, to avoid denied requests
+        matcher (KeywordMatcher or TfidfScorer): The scorer to score articles by
+        [concurrency] (int): The maximum amount of requests in flight at the same time
+        [sleeptime] (float): The time each request waits before it is sent, to avoid denied requests
+        [body_only] (bool): Only score the text of the article body
+        [links] (function): Returns the list of article urls an article links to
+        [queue] (ArticleQueue): The queue to continue from, instead of starting at the start
+        [visited] (VisitedSet): The visited articles to continue from
+        [checkpoint] (function): Called after every article expansion, to save checkpoints
+        [prescorer] (Prescorer): Only fetch the links it picks. The links function must return anchors then
     Returns:
-        list: An list containing the path from the start to the goal
+        list: A list containing the path from the goal to the start, or None if no path was found
+    """
+    loop = asyncio.get_running_loop()
+    limit = asyncio.Semaphore(concurrency)
+    executor = concurrent.futures.ThreadPoolExecutor(concurrency)
+
+    async def fetch(function, url):
+        # Runs a blocking fetch in the pool once the concurrency limit allows it
+        async with limit:
+            await asyncio.sleep(sleeptime)
+            return await loop.run_in_executor(executor, function, url)
+
+    async def page(url):
+        return url, await fetch(fetch_until_accepted, url)
+
+    if queue is None:
+        queue = ArticleQueue([Article(start)])
+    if visited is None:
+        visited = VisitedSet([start])
+    prefetched = {} # Link requests started ahead of time, by article url
+
+    try:
+        while True:
+            article = queue.next_article()
+            # Stop when no articles remain in the queue
+            if not article:
+                return None
+
+            if article.url not in prefetched:
+                prefetched[article.url] = asyncio.ensure_future(fetch(links, article.url))
+            sub_articles = await prefetched.pop(article.url)
+            if prescorer:
+                sub_articles = prescorer.apply(sub_articles, article, goal, queue, visited, matcher)
+            instrument.gauge("queue", len(queue))
+            instrument.gauge("visited", len(visited))
+
+            # Print the score, url and number of sub-articles as a progress update
+            print(f"{article.score}: {article.url} ({len(sub_articles)} sub-articles)")
+
+            pending = set()
+            for l in sub_articles:
+                if visited.add(l):
+                    if l == goal:
+                        # The correct link was found!
+                        print("Done!")
+                        for task in pending:
+                            task.cancel()
+                        return Article(l, article).path
+                    elif should_check(l):
+                        pending.add(asyncio.ensure_future(page(l)))
+
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                # Score the pages that arrived together as a batch, and insert them into the queue by their score
+                urls, htmls = zip(*[task.result() for task in done])
+                for item in score_pages(urls, htmls, article, matcher, body_only):
+                    queue.insert(item)
+                # Request the links of the best article so far, if no other prefetch is running
+                best = queue.peek()
+                if best and best.url not in prefetched and all(t.done() for t in prefetched.values()):
+                    prefetched[best.url] = asyncio.ensure_future(fetch(links, best.url))
+
+            if checkpoint:
+                checkpoint()
+    finally:
+        for task in prefetched.values():
+            task.cancel()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+class Frontier:
+    """
+    The queue, visited set and expanded articles of a race, shared by the worker processes of process_race.
+    Lives in the process of a RaceManager, and the workers use it through a proxy, so every method
+    is a round trip between processes. The methods therefore handle all links of an article at a time.
+    Properties:
+        queue: The ArticleQueue of articles to expand
+        visited: The VisitedSet of visited article urls
+        path: The path from the goal to the start once the goal is found, else None
+        expanded: The amount of articles handed out for expansion
+        graph: Copy of the LinkGraph of the race to read known links from and store new links in, or None
+    """
+    def __init__(self, goal, entries, visited, graph=None):
+        """
+        Args:
+            goal (string): The article to find the path to
+            entries (list): The queue entries to start from, see ArticleQueue.snapshot
+            visited (set): The visited article urls to start from
+            [graph] (LinkGraph): Link graph of earlier races, see LinkGraph.cached
+        """
+        self.goal = goal
+        self.queue = ArticleQueue()
+        self.queue.restore(entries)
+        self.visited = VisitedSet(visited)
+        self.path = None
+        self.expanded = 0
+        self.graph = graph
+        self._found = {} # The links fetched during the race, by url, for the graph of the parent process
+        self._expanding = {} # Articles being expanded by a worker, by url
+        self._claimed = {} # The links each article being expanded marked as visited, by url
+        self._lock = threading.Lock()
+
+    def next_article(self):
+        """
+        Hands out the best scored article for a worker to expand
+        Returns:
+            tuple: The url and score of the article, and its links if the graph knows them, else None.
+                None if the queue is empty or the goal was found
+        """
+        with self._lock:
+            if self.path:
+                return None
+            article = self.queue.next_article()
+            if not article:
+                return None
+            self._expanding[article.url] = article
+            self._claimed[article.url] = []
+            self.expanded += 1
+            known = self.graph.links(article.url) if self.graph is not None else None
+            return article.url, article.score, known
+
+    def visit(self, url, links):
+        """
+        Marks the links of an article as visited, and finds the ones for the worker to score.
+        If the goal is among them, the path is stored and the race is over
+        Args:
+            url (string): The article the links are from
+            links (list): The urls the article links to
+        Returns:
+            list: The urls that were not visited before and should be scored
+        """
+        new = []
+        with self._lock:
+            if self.graph is not None and self.graph.links(url) is None:
+                self.graph.add(url, links)
+                self._found[url] = links
+            claimed = self._claimed[url]
+            for l in links:
+                if self.visited.add(l):
+                    claimed.append(l)
+                    if l == self.goal:
+                        # The correct link was found!
+                        self.path = self.path or Article(l, self._expanding[url]).path
+                        return []
+                    elif should_check(l):
+                        new.append(l)
+        return new
+
+    def insert(self, url, scores):
+        """
+        Adds the scored links of an article to the queue, and marks the article as expanded
+        Args:
+            url (string): The article the links are from
+            scores (list): The scored links as (url, score) tuples
+        """
+        # Done under the lock, so a snapshot never sees the article as neither expanding nor expanded
+        with self._lock:
+            parent = self._expanding.pop(url)
+            del self._claimed[url]
+            for l, score in scores:
+                article = Article(l, parent)
+                article.score = score
+                self.queue.insert(article)
+
+    def done(self):
+        # Checks if the race is over, as the goal was found or no articles are left to expand
+        with self._lock:
+            return bool(self.path) or (not self._expanding and not len(self.queue))
+
+    def result(self):
+        # Returns the path from the goal to the start, or None if it was not found
+        return self.path
+
+    def found_links(self):
+        # Returns the links fetched during the race that the graph did not know, on the form {url: [urls]}
+        with self._lock:
+            return dict(self._found)
+
+    def snapshot(self):
+        """
+        Takes a consistent copy of the race, to save checkpoints while the workers keep going.
+        Articles that are being expanded are put back in the queue, and the links they marked as visited
+        are left out of the visited urls, so the articles are expanded again when the race is resumed
+        Returns:
+            tuple: The queue entries, see ArticleQueue.snapshot, and the visited urls
+        """
+        with self._lock:
+            entries = self.queue.snapshot()
+            visited = self.visited.snapshot()
+            first = min((e[1] for e in entries), default=0)
+            for i, article in enumerate(self._expanding.values()):
+                # Before every queued article of the same score, as they were taken from the queue first
+                entries.append((-article.score, first - 1 - i, article))
+                visited.difference_update(self._claimed[article.url])
+        return entries, visited
+
+    def encoded_snapshot(self, start, keywords):
+        """
+        Takes a consistent copy of the race like snapshot, encoded and compressed for a checkpoint,
+        which is far quicker to send to another process than the articles themselves.
+        Only copying the queue and visited set holds the lock, the workers go on while the copy is encoded
+        Args:
+            start (string): The starting article of the race
+            keywords (list): The keyword tiers of the race
+        Returns:
+            bytes: The contents of a checkpoint file of the race, see Checkpointer.dumps
+        """
+        entries, visited = self.snapshot()
+        return Checkpointer.dumps(Checkpointer.encode(start, self.goal, keywords, entries, visited))
+
+class RaceManager(BaseManager):
+    # Runs the Frontier of a race in a separate process, for the workers of process_race
+    pass
+
+RaceManager.register("Frontier", Frontier)
+RaceManager.register("SharedBuckets", SharedBuckets)
+
+def process_worker(frontier, keywords, threads, sleeptime, body_only, links, prescorer=None, scorer=None, batch=32,
+        limits=None):
+    """
+    Expands articles from a shared Frontier in a worker process until the race is over.
+    The links of each article are fetched and scored in this process, so scoring runs in parallel with the other workers
+    Args:
+        frontier (Frontier): Proxy of the shared frontier
+        keywords (list): The keyword tiers to score articles by
+        threads (int): The amount of threads fetching the links of an article
+        sleeptime (float): Time to sleep before each fetch
+        body_only (bool): Only score the text of the article body
+        links (function): Returns the list of article urls an article links to
+        [prescorer] (Prescorer): Only fetch the links it picks. The links function must return anchors then
+        [scorer] (TfidfScorer): Score the articles with this instead of the keywords.
+            Each worker learns its document frequencies from the pages it scores itself
+        [batch] (int): The amount of pages to fetch before scoring them together
+        [limits] (SharedBuckets): Proxy of the rate limits shared by every worker, see Fetcher.limits
+    Returns:
+        tuple: The amount of articles this worker expanded, and the amount of links the prescorer fetched and avoided
+    """
+    # Connections can not be shared with the parent process, so open new ones
+    requesting_urls.default_fetcher.close()
+    # Every worker takes from the same rate limits, so together they do not send more requests than one process would
+    requesting_urls.default_fetcher.limits = limits
+    matcher = scorer or KeywordMatcher(keywords)
+
+    def fetch_link(url):
+        time.sleep(sleeptime) # Slight delay to avoid denied responses
+        return fetch_until_accepted(url)
+
+    expanded = 0
+    with concurrent.futures.ThreadPoolExecutor(threads) as executor:
+        while True:
+            task = frontier.next_article()
+            if not task:
+                if frontier.done():
+                    return (expanded, prescorer.fetched, prescorer.avoided) if prescorer else (expanded, 0, 0)
+                # Other workers are still expanding, and may add articles to the queue
+                time.sleep(0.01)
+                continue
+            url, score, known = task
+            if known is None:
+                found = links(url)
+            else:
+                # The graph only knows the urls of the links, so they are pre-scored without a title and text
+                found = [(link, "", "") for link in known] if prescorer else known
+            sub_articles = frontier.visit(url, [a[0] for a in found] if prescorer else found)
+            skip = []
+            if prescorer:
+                new = set(sub_articles)
+                sub_articles, skip = prescorer.select(matcher, [a for a in found if a[0] in new])
+            # Print the score, url and number of sub-articles as a progress update
+            print(f"{score}: {url} ({len(sub_articles)} sub-articles)")
+            scores = []
+            for i in range(0, len(sub_articles), batch):
+                urls = sub_articles[i:i + batch]
+                scores += [(a.url, a.score) for a in score_pages(urls, list(executor.map(fetch_link, urls)), None, matcher, body_only)]
+            frontier.insert(url, scores + skip)
+            expanded += 1
+
+def process_race(goal, keywords, queue, visited, processes=None, threads=4, sleeptime=0, body_only=False,
+        links=article_links, checkpointer=None, prescorer=None, scorer=None, start=None):
+    """
+    Multi-process version of the search loop in wiki_race.
+    Worker processes take the best scored articles from a shared queue and visited set, kept by a RaceManager,
+    and each fetches and scores the links of its article on its own. Scoring the pages is CPU bound,
+    so unlike the threads of the other engines, the workers are not held back by the GIL.
+    Several articles are expanded at a time, so the order of expansion is less strict than with one process
+    Args:
+        goal (string): The Wikipedia article to find the path to
+        keywords (list): The keyword tiers to score articles by
+        queue (ArticleQueue): The queue to start from. Updated with the state of the race for checkpoints
+        visited (VisitedSet): The visited articles to start from
+        [processes] (int): The amount of worker processes. Default: the amount of CPU cores
+        [threads] (int): The amount of threads fetching links in each worker
+        [sleeptime] (float): Time each thread sleeps before each fetch
+        [body_only] (bool): Only score the text of the article body
+        [links] (function): Returns the list of article urls an article links to. Must be picklable.
+            If it is a CachedLinks of a LinkGraph, the Frontier reads and stores the links in the graph,
+            and the workers only get the function it wraps
+        [checkpointer] (Checkpointer): Saves the race whenever it is due. The state is encoded by the RaceManager,
+            and written without recreating the articles in this process
+        [prescorer] (Prescorer): Only fetch the links it picks. The links function must return anchors then.
+            Gets the sums of the counts of the workers
+        [scorer] (TfidfScorer): Score the articles with this instead of the keywords, see process_worker
+        [start] (string): The starting article of the race, for the checkpoints
+    Returns:
+        list: A list containing the path from the goal to the start, or None if no path was found
+    """
+    processes = processes or os.cpu_count()
+    graph = None
+    if isinstance(links, CachedLinks):
+        # The closures of a graph can not be sent to other processes, so the Frontier gets a copy of the graph instead
+        graph, links = links.graph, links.fetch
+    fetcher = requesting_urls.default_fetcher
+    with RaceManager() as manager:
+        frontier = manager.Frontier(goal, queue.snapshot(), visited.snapshot(), graph)
+        limits = manager.SharedBuckets(fetcher.rate, fetcher.burst) if fetcher.rate else None
+        with concurrent.futures.ProcessPoolExecutor(processes) as executor:
+            futures = [executor.submit(process_worker, frontier, keywords, threads, sleeptime, body_only, links, prescorer, scorer,
+                    limits=limits) for i in range(processes)]
+            while True:
+                timeout = max(checkpointer.interval, 0.1) if checkpointer else None
+                done, running = concurrent.futures.wait(futures, timeout=timeout)
+                # Raise any error of a worker
+                for future in done:
+                    future.result()
+                if not running:
+                    break
+                if checkpointer.due():
+                    checkpointer.save_data(frontier.encoded_snapshot(start, keywords))
+            counts = [future.result() for future in futures]
+        if checkpointer:
+            # Leave the queue as the race left it, like the other engines do
+            queue.restore(Checkpointer.decode(Checkpointer.loads(frontier.encoded_snapshot(start, keywords)))[3].snapshot())
+        if graph is not None:
+            for url, found in frontier.found_links().items():
+                graph.add(url, found)
+        expanded = sum(count[0] for count in counts)
+        if prescorer:
+            prescorer.fetched += sum(count[1] for count in counts)
+            prescorer.avoided += sum(count[2] for count in counts)
+        path = frontier.result()
+        if path:
+            print("Done!")
+        print(f"{expanded} articles expanded by {processes} processes")
+        return path
+
+def what_links_here(url):
+    """
+    Finds the Wikipedia articles that link to an article, from its "What links here" page
+    Args:
+        url (string): The URL of the Wikipedia article
+    Returns:
+        list: List of Wikipedia article URLs that link to the article
+    """
+    title = unquote(url[url.rindex("/wiki/") + 6:])
+    params = {"title": f"Special:WhatLinksHere/{title}", "namespace": 0, "limit": 5000}
+    html = get_html("https://en.wikipedia.org/w/index.php", params)
+    # Only look at the list of linking pages, not the navigation around it
+    start = html.find('id="mw-whatlinkshere-list"')
+    if start < 0:
+        return []
+    end = html.find('class="printfooter"', start)
+    links = extract_links(html[start:end if end > 0 else len(html)], url)
+    return [link for link, kind in links if kind == "article"]
+
+class LinkFixture:
+    """
+    Offline link graph to race through, instead of fetching links and backlinks from Wikipedia
+    """
+    def __init__(self, graph):
+        """
+        Args:
+            graph (dict): The links of each article, on the form {url: [urls]}
+        """
+        self.graph = graph
+        self.backgraph = {}
+        for url, links in graph.items():
+            for l in links:
+                self.backgraph.setdefault(l, []).append(url)
+
+    def links(self, url):
+        # Returns the articles an article links to
+        return self.graph.get(url, [])
+
+    def backlinks(self, url):
+        # Returns the articles that link to an article
+        return self.backgraph.get(url, [])
+
+def bidirectional_race(start, goal, links=article_links, backlinks=what_links_here, threads=4):
+    """
+    Finds the shortest path between two articles with a breadth first search from both ends.
+    The forward search follows the links in each article, and the backward search follows the articles
+    that link to each article. A full level of the smaller frontier is expanded at a time, and the search
+    stops at the first level where the frontiers meet, so the path is the shortest within the explored graph.
+    Args:
+        start (string): The starting Wikipedia Article to find the path from
+        goal (string): The Wikipedia article to find the path to
+        [links] (function): Returns the list of article urls an article links to
+        [backlinks] (function): Returns the list of article urls that link to an article
+        [threads] (int): The amount of threads to fetch the links of a level with
+    Returns:
+        list: A list containing the path from the goal to the start, or None if there is no path
     """
+    if start == goal:
+        return [goal]
 
+    # Each side maps every visited article to its neighbour towards its end of the path
+    forward = {start: None}
+    backward = {goal: None}
+    forward_frontier = [start]
+    backward_frontier = [goal]
+
+    with concurrent.futures.ThreadPoolExecutor(threads) as executor:
+        while forward_frontier and backward_frontier:
+            # Expand the side with the smaller frontier
+            is_forward = len(forward_frontier) <= len(backward_frontier)
+            if is_forward:
+                frontier, visited, other, expand = forward_frontier, forward, backward, links
+            else:
+                frontier, visited, other, expand = backward_frontier, backward, forward, backlinks
+
+            print(f"{'Forward' if is_forward else 'Backward'}: {len(frontier)} articles")
+            instrument.gauge("forward_frontier" if is_forward else "backward_frontier", len(frontier))
+            instrument.gauge("visited", len(forward) + len(backward))
+
+            next_frontier = []
+            meetings = []
+            for url, found in zip(frontier, executor.map(expand, frontier)):
+                for l in found:
+                    if l in visited or (not should_check(l) and l not in other):
+                        continue
+                    visited[l] = url
+                    next_frontier.append(l)
+                    if l in other:
+                        meetings.append(l)
+
+            if meetings:
+                # The whole level is expanded, so the shortest path goes through one of the meetings
+                meet = min(meetings, key=lambda m: path_length(forward, m) + path_length(backward, m))
+                path = [meet]
+                url = forward[meet]
+                while url:
+                    path.append(url)
+                    url = forward[url]
+                url = backward[meet]
+                while url:
+                    path.insert(0, url)
+                    url = backward[url]
+                return path
+
+            if is_forward:
+                forward_frontier = next_frontier
+            else:
+                backward_frontier = next_frontier
+
+    return None
+
+def path_length(parents, url):
+    # Counts the steps from an article to the end of its side of the search
+    steps = 0
+    while parents[url]:
+        url = parents[url]
+        steps += 1
+    return steps
+
+# Paragraphs, link titles and bold text of the goal article, for find_keywords
+paragraph_pattern = patterns.register("keywords.paragraph", "<p>.*")
+title_pattern = patterns.register("keywords.title", 'title="([^"#]*)"')
+bold_pattern = patterns.register("keywords.bold", "<b>([^<]*)</b>")
+
+def find_keywords(goal, greed=2):
+    """
+    Finds (possibly) important keywords in the goal article, in three priority tiers
+    Args:
+        goal (string): The Wikipedia article to find keywords in
+        [greed] (int): Specifies what keywords to consider, see wiki_race
+    Returns:
+        list: Three lists of keywords, for low, mid and high priority
+    """
     goal_html = get_html(goal)
 
     # All the articles contents are in <p> objects
-    goal_points = re.findall('<p>.*', goal_html)
+    goal_points = paragraph_pattern.findall(goal_html)
 
     # Concatenate the content
     goal_content = ""
@@ -158,9 +1085,9 @@ def wiki_race(start, goal, output=None, greed=2, threads=4, sleeptime=0.01):
         # Low Priority, any single word from Mid and High priority
         [],
         # Mid Priority, the titles of any hyperlinks in the article
-        re.findall('title="([^"#]*)"', goal_content),
+        title_pattern.findall(goal_content),
         # High Priority, text that is in bold, as well as the title of the article
-        re.findall('<b>([^<]*)</b>', goal_content) + [goal[goal.rindex("/"):].replace("_", " ")]
+        bold_pattern.findall(goal_content) + [goal[goal.rindex("/"):].replace("_", " ")]
     ]
 
     # Remove special characters from keywords
@@ -185,6 +1112,139 @@ def wiki_race(start, goal, output=None, greed=2, threads=4, sleeptime=0.01):
     for i in range(len(keywords)):
         keywords[i] = [s for s in keywords[i] if len(s) > 3]
 
+    return keywords
+
+def write_path(output, path):
+    """
+    Writes a path to file
+    Args:
+        output (string): filename to write to
+        path (list): list of article urls to be written to file
+    """
+    f = open(output, "w")
+    for i in path:
+        f.write(f"{i}\n")
+    f.close()
+
+def wiki_race(start, goal, output=None, greed=2, threads=4, sleeptime=0, engine="thread", body_only=False,
+        bidirectional=False, links=article_links, backlinks=what_links_here, graph=None,
+        checkpoint=None, checkpoint_interval=5, resume=False, processes=None, top=None, threshold=None,
+        anchors=article_anchors, scorer="keywords"):
+    """
+    Finds the a short path between two wikipedia pages.
+    It usually finds a short path, but may not always find the shortest, as it can grow quite greedy.
+    Tried BFS, that didn't terminate and Wikipedia started denying my requests, so here we are!
+    Ranks all articles by their keyword scores, and goes to the most promising articles first.
+    If no articles look promising, it performs regular BFS.
+    Args:
+        start (string): The starting Wikipedia Article to find the path from
+        goal (string): The Wikipedia article to find the path to
+        [output] (string): Optional output file to write the path to
+        [greed] (int): Specified how what keywords to consider when scoring articles
+            0: No keywords are considered, pure BFS (THIS WILL TAKE FOREVER)
+            1: High Priority keywords only, this will probably take a long time
+            2: Mid-High Priority, this usually finds the best path (DEFAULT)
+            3: All keywords. Rarely finds the best path, but does find a path very quickly
+        [threads] (int): The amount of threads, too many might make Wikipedia deny requests eventually
+            Default: 4, this works well as long as the algorithm isn't called excessively
+            With the async engine, this is the maximum amount of requests in flight
+        [sleeptime] (float): The time each thread sleeps before moving to next thread, to avoid denied requests
+            Default: 0, as the shared fetcher of get_html already limits the request rate to Wikipedia
+        [engine] (string): How the articles are fetched
+            "thread": A new set of threads checks the links of each article (DEFAULT)
+            "async": A persistent pool of pipelined requests, see async_race
+            "process": Worker processes sharing one queue, each with [threads] threads, see process_race
+        [body_only] (bool): Only look for keywords in the text of the article body, instead of the full HTML
+        [bidirectional] (bool): Search from both the start and the goal instead, see bidirectional_race.
+            Finds the shortest path, and does not use keywords
+        [links] (function): Returns the articles an article links to
+        [backlinks] (function): Returns the articles that link to an article, for the bidirectional search
+        [graph] (LinkGraph): Link graph of earlier races. If it already knows a path, no articles are fetched.
+            Otherwise the links of every expanded article are read from and added to it
+        [checkpoint] (string): File to periodically save the queue, visited articles and keywords to.
+            Only used by the keyword searching engines, and removed when the race finishes
+        [checkpoint_interval] (float): The minimum amount of seconds between checkpoints (Default: 5)
+        [resume] (bool): Continue the race saved in the checkpoint file, if it exists
+        [processes] (int): The amount of worker processes of the process engine. Default: the amount of CPU cores
+        [top] (int): Pre-score the links of each article from their URL, title and text, and only fetch the pages
+            of the [top] best links. The others are queued with their pre-score, see Prescorer
+        [threshold] (int): Pre-score the links, and only fetch the pages of links scoring at least [threshold]
+        [anchors] (function): Returns the (url, title, text) of the articles an article links to, for pre-scoring.
+            Used instead of links when pre-scoring. The graph stores the urls of the anchors,
+            and the links it already knows are pre-scored by their url alone
+        [scorer] (string): How the articles are scored
+            "keywords": By the keywords of the goal found with [greed] (DEFAULT)
+            "tfidf": By the similarity of their text to the text of the goal, see TfidfScorer.
+                Its word statistics are learned during the race, and start over when a race is resumed
+    Returns:
+        list: An list containing the path from the start to the goal
+    """
+    if graph is not None:
+        # Races through articles that were already expanded need no requests
+        path = graph.shortest_path(start, goal)
+        if not path:
+            try:
+                path = wiki_race(start, goal, None, greed, threads, sleeptime, engine, body_only,
+                        bidirectional, graph.cached(links), backlinks, None, checkpoint, checkpoint_interval, resume, processes,
+                        top, threshold, anchors, scorer)
+            finally:
+                graph.save()
+        if path and output:
+            write_path(output, path)
+        return path
+
+    if bidirectional:
+        path = bidirectional_race(start, goal, links, backlinks, threads)
+        if path and output:
+            write_path(output, path)
+        return path
+
+    if resume and checkpoint and os.path.exists(checkpoint):
+        # Continue from where the saved race stopped
+        start, goal, keywords, queue, visited = Checkpointer.load(checkpoint)
+        print(f"Resuming with {len(queue)} articles in the queue and {len(visited)} visited")
+    else:
+        keywords = find_keywords(goal, greed)
+        # Create the thread-safe queue and visited set
+        queue = ArticleQueue([Article(start)])
+        visited = VisitedSet([start])
+
+    checkpointer = Checkpointer(checkpoint, checkpoint_interval) if checkpoint else None
+    prescorer = Prescorer(top, threshold, anchors) if top is not None or threshold is not None else None
+    path = race(start, goal, keywords, queue, visited, threads, sleeptime, engine, body_only, links, checkpointer, processes,
+            prescorer, scorer)
+    if prescorer:
+        print(f"Pre-scoring fetched {prescorer.fetched} links and avoided fetching {prescorer.avoided}")
+
+    if checkpointer:
+        # The race is over, so there is nothing left to resume
+        checkpointer.wait()
+        if os.path.exists(checkpoint):
+            os.remove(checkpoint)
+    if path and output:
+        write_path(output, path)
+    return path
+
+def race(start, goal, keywords, queue, visited, threads, sleeptime, engine, body_only, links, checkpointer=None, processes=None,
+        prescorer=None, scorer="keywords"):
+    """
+    Runs the keyword searching engines of wiki_race from a queue of articles
+    Args:
+        See wiki_race
+        keywords (list): The keyword tiers to score articles by
+        queue (ArticleQueue): The queue of articles to expand
+        visited (VisitedSet): The set of visited articles
+        [checkpointer] (Checkpointer): Saves the race between article expansions
+        [processes] (int): The amount of worker processes of the process engine
+        [prescorer] (Prescorer): Only fetch the links it picks, and get the links from its anchors function
+        [scorer] (string): "keywords" or "tfidf", see wiki_race
+    Returns:
+        list: An list containing the path from the goal to the start
+    """
+    checkpoint = None
+    if checkpointer:
+        checkpoint = lambda: checkpointer.save(start, goal, keywords, queue, visited)
+
     # Print out the keywords
     print("LOW PRIORITY")
     for i in keywords[0]:
@@ -197,9 +1257,22 @@ def wiki_race(start, goal, output=None, greed=2, threads=4, sleeptime=0.01):
         print(i)
     print("\nSCANNING ARTICLES")
 
-    # Create the thread-safe queue and visited lists
-    queue = ArticleList([Article(start)])
-    visited = ArticleList([start])
+    if scorer == "tfidf":
+        matcher = TfidfScorer(fetch_until_accepted(goal))
+    else:
+        # Compile the keywords once, so each article is scored in a single pass
+        matcher = KeywordMatcher(keywords)
+    if prescorer:
+        # The urls of the anchors are stored in the graph, so a graph is still read and filled when pre-scoring
+        links = links.graph.cached_anchors(prescorer.links) if isinstance(links, CachedLinks) else prescorer.links
+
+    if engine == "process":
+        return process_race(goal, keywords, queue, visited, processes, threads, sleeptime, body_only, links, checkpointer,
+                prescorer, matcher if scorer == "tfidf" else None, start)
+
+    if engine == "async":
+        return asyncio.run(async_race(start, goal, matcher, threads, sleeptime, body_only, links,
+                queue, visited, checkpoint, prescorer))
 
     while True:
         article = queue.next_article()
@@ -208,25 +1281,34 @@ def wiki_race(start, goal, output=None, greed=2, threads=4, sleeptime=0.01):
             break
 
         # Find all links in the article, and create a thread-safe list
-        links = ArticleList(find_articles(article.url))
+        with instrument.span("links", url=article.url):
+            found = links(article.url)
+        if prescorer:
+            found = prescorer.apply(found, article, goal, queue, visited, matcher)
+        sub_articles = ArticleList(found)
+        instrument.gauge("queue", len(queue))
+        instrument.gauge("visited", len(visited))
 
         # Print the score, url and number of sub-articles as a progress update
-        print(f"{article.score}: {article.url} ({len(links)} sub-articles)")
+        print(f"{article.score}: {article.url} ({len(sub_articles)} sub-articles)")
+
+        # Pages are scored together when the scorer is faster at batches
+        batch = PageBatch(article, queue, matcher, body_only) if isinstance(matcher, TfidfScorer) else None
 
         # Make 4 threads that check all the sub-articles for keywords. Any more than 4, and Wikipedia starts denying requests at some point
         with concurrent.futures.ThreadPoolExecutor() as executor:
-            futures = [executor.submit(wiki_thread, goal, article, queue, visited, links, keywords) for i in range(threads)]
+            futures = [executor.submit(wiki_thread, goal, article, queue, visited, sub_articles, matcher, sleeptime, body_only, batch) for i in range(threads)]
 
         # Check if any thread reported a valid path
         results = [f.result() for f in futures]
         for r in results:
             if r:
-                if output:
-                    f = open(output, "w")
-                    for i in r:
-                        f.write(f"{i}\n")
-                    f.close()
                 return r
+        if batch:
+            batch.flush()
+
+        if checkpoint:
+            checkpoint()
 
 if __name__ == "__main__":
     # Define starting and stopping positions